@@ -1,42 +1,91 @@
 # backend/admin_routes.py - VERSIÓN CORREGIDA
-from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy.orm import Session
-from sqlalchemy import func, extract, text
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import func, extract, text, select, update
 from typing import List, Optional
-from datetime import datetime, timedelta
-from database import get_db
-from models import Conversation, Message, Lead
+from pydantic import BaseModel, Field
+from datetime import datetime, timedelta, date
+from database import get_async_db
+from models import Conversation, Message, Lead, OutboundMessage, Campaign, CampaignRecipient
 from auth import get_current_user
+from repositories.campaign_repository import CampaignRepository
+from services.pagination import KeysetPaginator
+from services.search import (
+    SEARCH_FIELDS, search_all, search_filter,
+    message_match, message_headline, render_snippet
+)
+from services.stats_cache import stats_cache
+from services.whatsapp import outbound_scheduler
 
 router = APIRouter()
 
+# Caracteres del último mensaje que se muestran en el listado
+MESSAGE_PREVIEW_LENGTH = 120
+
+# Columna de fecha de cada serie del flujo de actividad
+ACTIVITY_SERIES = {
+    "conversations": Conversation.created_at,
+    "messages": Message.timestamp,
+    "leads": Lead.created_at
+}
+
+# Estados desde los que se puede pasar a cada estado de campaña
+CAMPAIGN_TRANSITIONS = {
+    "running": ("draft", "paused"),
+    "paused": ("running",),
+    "cancelled": ("draft", "running", "paused")
+}
+
+# Columnas por las que se puede ordenar el listado de conversaciones (desc)
+CONVERSATION_SORTS = {
+    "last_interaction": Conversation.last_interaction,
+    "last_message_at": Conversation.last_message_at,
+    "last_user_message_at": Conversation.last_user_message_at,
+    "message_count": Conversation.message_count,
+    "created_at": Conversation.created_at
+}
+
 # ==================== CONVERSACIONES ====================
 
 @router.get("/conversations")
 async def get_conversations(
+    response: Response,
     skip: int = 0,
     limit: int = 100,
+    cursor: Optional[str] = None,
     search: Optional[str] = None,
     status: Optional[str] = None,
-    db: Session = Depends(get_db),
+    sort: str = Query("last_interaction", pattern="^(" + "|".join(CONVERSATION_SORTS) + ")$"),
+    db: AsyncSession = Depends(get_async_db),
     current_user: dict = Depends(get_current_user)
 ):
-    """Obtiene todas las conversaciones"""
-    query = db.query(Conversation)
+    """
+    Obtiene todas las conversaciones
+    
+    El conteo y la actividad salen de los contadores de la propia fila; la
+    vista previa del último mensaje es una subconsulta indexada por fila.
+    Para la página siguiente se envía el header X-Next-Cursor como cursor.
+    """
+    last_message_preview = select(
+        func.substr(Message.content, 1, MESSAGE_PREVIEW_LENGTH)
+    ).where(
+        Message.conversation_id == Conversation.id
+    ).order_by(Message.id.desc()).limit(1).scalar_subquery()
+    
+    query = select(Conversation, last_message_preview.label("last_message_preview"))
     
     if search:
-        search_filter = f"%{search}%"
-        query = query.filter(
-            (Conversation.phone_number.like(search_filter)) |
-            (Conversation.user_name.ilike(search_filter))
-        )
+        query = query.where(search_filter([Conversation.phone_number, Conversation.user_name], search))
     
     if status:
-        query = query.filter(Conversation.status == status)
+        query = query.where(Conversation.status == status)
     
-    conversations = query.order_by(
-        Conversation.last_interaction.desc()
-    ).offset(skip).limit(limit).all()
+    paginator = KeysetPaginator(
+        [CONVERSATION_SORTS[sort], Conversation.id], cursor=cursor, limit=limit, skip=skip
+    )
+    rows = paginator.page(
+        (await db.execute(paginator.apply(query))).all(), response, item=lambda row: row[0]
+    )
     
     return [{
         "id": c.id,
@@ -46,26 +95,30 @@ async def get_conversations(
         "profile_type": c.profile_type,
         "last_interaction": c.last_interaction,
         "created_at": c.created_at,
-        "messages_count": len(c.messages)
-    } for c in conversations]
+        "messages_count": c.message_count,
+        "last_message_preview": preview,
+        "last_message_role": c.last_role,
+        "last_message_at": c.last_message_at,
+        "last_user_message_at": c.last_user_message_at
+    } for c, preview in rows]
 
 @router.get("/conversations/{conversation_id}")
 async def get_conversation(
     conversation_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: dict = Depends(get_current_user)
 ):
     """Obtiene una conversación específica con sus mensajes"""
-    conversation = db.query(Conversation).filter(
-        Conversation.id == conversation_id
-    ).first()
+    conversation = await db.get(Conversation, conversation_id)
     
     if not conversation:
         raise HTTPException(status_code=404, detail="Conversación no encontrada")
     
-    messages = db.query(Message).filter(
-        Message.conversation_id == conversation_id
-    ).order_by(Message.timestamp).all()
+    messages = (await db.scalars(
+        select(Message).where(
+            Message.conversation_id == conversation_id
+        ).order_by(Message.timestamp)
+    )).all()
     
     return {
         "conversation": {
@@ -88,13 +141,15 @@ async def get_conversation(
 @router.get("/conversations/{conversation_id}/messages")
 async def get_messages(
     conversation_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: dict = Depends(get_current_user)
 ):
     """Obtiene los mensajes de una conversación"""
-    messages = db.query(Message).filter(
-        Message.conversation_id == conversation_id
-    ).order_by(Message.timestamp).all()
+    messages = (await db.scalars(
+        select(Message).where(
+            Message.conversation_id == conversation_id
+        ).order_by(Message.timestamp)
+    )).all()
     
     return [{
         "id": m.id,
@@ -107,20 +162,18 @@ async def get_messages(
 async def update_conversation_status(
     conversation_id: int,
     status: str,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: dict = Depends(get_current_user)
 ):
     """Actualiza el estado de una conversación"""
-    conversation = db.query(Conversation).filter(
-        Conversation.id == conversation_id
-    ).first()
+    conversation = await db.get(Conversation, conversation_id)
     
     if not conversation:
         raise HTTPException(status_code=404, detail="Conversación no encontrada")
     
     conversation.status = status
     conversation.last_interaction = datetime.utcnow()
-    db.commit()
+    await db.commit()
     
     return {"success": True, "message": "Estado actualizado"}
 
@@ -128,26 +181,32 @@ async def update_conversation_status(
 
 @router.get("/leads")
 async def get_leads(
+    response: Response,
     skip: int = 0,
     limit: int = 100,
+    cursor: Optional[str] = None,
+    search: Optional[str] = None,
     min_interest: Optional[int] = None,
     status: Optional[str] = None,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: dict = Depends(get_current_user)
 ):
     """Obtiene todos los leads"""
-    query = db.query(Lead)
+    query = select(Lead)
+    
+    if search:
+        query = query.where(search_filter([Lead.phone_number, Lead.user_name, Lead.email], search))
     
     if min_interest:
-        query = query.filter(Lead.interest_level >= min_interest)
+        query = query.where(Lead.interest_level >= min_interest)
     
     if status:
-        query = query.filter(Lead.status == status)
+        query = query.where(Lead.status == status)
     
-    leads = query.order_by(
-        Lead.interest_level.desc(),
-        Lead.updated_at.desc()
-    ).offset(skip).limit(limit).all()
+    paginator = KeysetPaginator(
+        [Lead.interest_level, Lead.updated_at, Lead.id], cursor=cursor, limit=limit, skip=skip
+    )
+    leads = paginator.page((await db.scalars(paginator.apply(query))).all(), response)
     
     return [{
         "id": l.id,
@@ -165,19 +224,19 @@ async def get_leads(
 @router.get("/leads/{lead_id}")
 async def get_lead(
     lead_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: dict = Depends(get_current_user)
 ):
     """Obtiene un lead específico"""
-    lead = db.query(Lead).filter(Lead.id == lead_id).first()
+    lead = await db.get(Lead, lead_id)
     
     if not lead:
         raise HTTPException(status_code=404, detail="Lead no encontrado")
     
     # Buscar conversación relacionada
-    conversation = db.query(Conversation).filter(
-        Conversation.phone_number == lead.phone_number
-    ).first()
+    conversation_id = await db.scalar(
+        select(Conversation.id).where(Conversation.phone_number == lead.phone_number)
+    )
     
     return {
         "lead": {
@@ -192,7 +251,7 @@ async def get_lead(
             "created_at": lead.created_at,
             "updated_at": lead.updated_at
         },
-        "conversation_id": conversation.id if conversation else None
+        "conversation_id": conversation_id
     }
 
 @router.put("/leads/{lead_id}")
@@ -202,11 +261,11 @@ async def update_lead(
     interest_level: Optional[int] = None,
     notes: Optional[str] = None,
     email: Optional[str] = None,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: dict = Depends(get_current_user)
 ):
     """Actualiza un lead"""
-    lead = db.query(Lead).filter(Lead.id == lead_id).first()
+    lead = await db.get(Lead, lead_id)
     
     if not lead:
         raise HTTPException(status_code=404, detail="Lead no encontrado")
@@ -221,18 +280,18 @@ async def update_lead(
         lead.email = email
     
     lead.updated_at = datetime.utcnow()
-    db.commit()
+    await db.commit()
     
     return {"success": True, "message": "Lead actualizado"}
 
 @router.post("/leads/{lead_id}/convert")
 async def convert_lead_to_distributor(
     lead_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: dict = Depends(get_current_user)
 ):
     """Convierte un lead en distribuidor"""
-    lead = db.query(Lead).filter(Lead.id == lead_id).first()
+    lead = await db.get(Lead, lead_id)
     
     if not lead:
         raise HTTPException(status_code=404, detail="Lead no encontrado")
@@ -240,7 +299,7 @@ async def convert_lead_to_distributor(
     # Marcar lead como convertido
     lead.status = "convertido"
     lead.updated_at = datetime.utcnow()
-    db.commit()
+    await db.commit()
     
     return {
         "success": True,
@@ -248,95 +307,419 @@ async def convert_lead_to_distributor(
         "lead_phone": lead.phone_number
     }
 
-# ==================== ESTADÍSTICAS ====================
+# ==================== CAMPAÑAS ====================
 
-@router.get("/stats/detailed")
-async def get_detailed_stats(
-    db: Session = Depends(get_db),
+class CampaignCreate(BaseModel):
+    name: str = Field(..., min_length=2)
+    template_name: str = Field(..., min_length=1)
+    language: str = "es"
+    parameters: List[str] = []
+    # Audiencia (leads); un filtro vacío no restringe
+    status: List[str] = []
+    profile_type: List[str] = []
+    min_interest: Optional[int] = Field(None, ge=1, le=10)
+    max_interest: Optional[int] = Field(None, ge=1, le=10)
+
+def _campaign_dict(c: Campaign) -> dict:
+    return {
+        "id": c.id,
+        "name": c.name,
+        "template_name": c.template_name,
+        "language": c.language,
+        "parameters": c.parameters,
+        "filters": c.filters,
+        "status": c.status,
+        "total_recipients": c.total_recipients,
+        "sent_count": c.sent_count,
+        "failed_count": c.failed_count,
+        "last_lead_id": c.last_lead_id,
+        "created_at": c.created_at,
+        "started_at": c.started_at,
+        "finished_at": c.finished_at
+    }
+
+@router.post("/campaigns")
+async def create_campaign(
+    campaign: CampaignCreate,
+    db: AsyncSession = Depends(get_async_db),
     current_user: dict = Depends(get_current_user)
 ):
-    """Obtiene estadísticas detalladas"""
-    # Estadísticas generales
-    total_conversations = db.query(Conversation).count()
-    total_leads = db.query(Lead).count()
-    high_interest = db.query(Lead).filter(Lead.interest_level >= 7).count()
+    """Crea una campaña en borrador y devuelve el tamaño de la audiencia"""
+    filters = {
+        key: value
+        for key, value in campaign.model_dump(include={"status", "profile_type", "min_interest", "max_interest"}).items()
+        if value not in (None, [])
+    }
+    db_campaign = Campaign(
+        name=campaign.name,
+        template_name=campaign.template_name,
+        language=campaign.language,
+        parameters=campaign.parameters,
+        filters=filters,
+        status="draft",
+        sent_count=0,
+        failed_count=0,
+        last_lead_id=0
+    )
+    db.add(db_campaign)
+    await db.commit()
     
-    # Conversaciones últimos 7 días
-    week_ago = datetime.utcnow() - timedelta(days=7)
-    recent_conversations = db.query(Conversation).filter(
-        Conversation.created_at >= week_ago
-    ).count()
-    
-    # Leads por estado
-    leads_by_status = db.query(
-        Lead.status,
-        func.count(Lead.id)
-    ).group_by(Lead.status).all()
-    
-    # Perfiles más comunes
-    profiles = db.query(
-        Conversation.profile_type,
-        func.count(Conversation.id)
-    ).group_by(Conversation.profile_type).all()
+    return {
+        "success": True,
+        "id": db_campaign.id,
+        "audience": await CampaignRepository(db).count_audience(filters)
+    }
+
+@router.get("/campaigns")
+async def get_campaigns(
+    response: Response,
+    limit: int = 50,
+    cursor: Optional[str] = None,
+    status: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: dict = Depends(get_current_user)
+):
+    """Lista las campañas, de la más reciente a la más antigua"""
+    query = select(Campaign)
+    if status:
+        query = query.where(Campaign.status == status)
     
+    paginator = KeysetPaginator([Campaign.id], cursor=cursor, limit=limit)
+    campaigns = paginator.page((await db.scalars(paginator.apply(query))).all(), response)
+    return [_campaign_dict(c) for c in campaigns]
+
+@router.get("/campaigns/{campaign_id}")
+async def get_campaign(
+    campaign_id: int,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: dict = Depends(get_current_user)
+):
+    """Obtiene una campaña con su progreso"""
+    campaign = await db.get(Campaign, campaign_id)
+    
+    if not campaign:
+        raise HTTPException(status_code=404, detail="Campaña no encontrada")
+    
+    return _campaign_dict(campaign)
+
+@router.get("/campaigns/{campaign_id}/recipients")
+async def get_campaign_recipients(
+    campaign_id: int,
+    response: Response,
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    status: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: dict = Depends(get_current_user)
+):
+    """Resultado del envío por destinatario (filtrable por sent / failed)"""
+    query = select(CampaignRecipient).where(CampaignRecipient.campaign_id == campaign_id)
+    if status:
+        query = query.where(CampaignRecipient.status == status)
+    
+    paginator = KeysetPaginator([CampaignRecipient.id], cursor=cursor, limit=limit)
+    recipients = paginator.page((await db.scalars(paginator.apply(query))).all(), response)
+    return [{
+        "id": r.id,
+        "lead_id": r.lead_id,
+        "phone_number": r.phone_number,
+        "status": r.status,
+        "wa_message_id": r.wa_message_id,
+        "error": r.error,
+        "attempts": r.attempts,
+        "sent_at": r.sent_at
+    } for r in recipients]
+
+async def _set_campaign_status(db: AsyncSession, campaign_id: int, status: str) -> dict:
+    """Cambia el estado con un UPDATE condicional (el runner lo lee en su próximo checkpoint)"""
+    values = {"status": status}
+    if status == "cancelled":
+        values["finished_at"] = datetime.utcnow()
+    changed = await db.scalar(
+        update(Campaign)
+        .where(Campaign.id == campaign_id, Campaign.status.in_(CAMPAIGN_TRANSITIONS[status]))
+        .values(**values)
+        .returning(Campaign.id)
+    )
+    await db.commit()
+    
+    if changed is None:
+        current = await db.scalar(select(Campaign.status).where(Campaign.id == campaign_id))
+        if current is None:
+            raise HTTPException(status_code=404, detail="Campaña no encontrada")
+        raise HTTPException(status_code=400, detail=f"La campaña está en estado {current}")
+    return {"success": True, "status": status}
+
+@router.post("/campaigns/{campaign_id}/start")
+async def start_campaign(
+    campaign_id: int,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: dict = Depends(get_current_user)
+):
+    """Inicia o reanuda una campaña (la toma el runner en segundos)"""
+    return await _set_campaign_status(db, campaign_id, "running")
+
+@router.post("/campaigns/{campaign_id}/pause")
+async def pause_campaign(
+    campaign_id: int,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: dict = Depends(get_current_user)
+):
+    """Pausa una campaña en curso; al reanudarla sigue desde el checkpoint"""
+    return await _set_campaign_status(db, campaign_id, "paused")
+
+@router.post("/campaigns/{campaign_id}/cancel")
+async def cancel_campaign(
+    campaign_id: int,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: dict = Depends(get_current_user)
+):
+    """Cancela una campaña (no se puede reanudar)"""
+    return await _set_campaign_status(db, campaign_id, "cancelled")
+
+# ==================== BÚSQUEDA ====================
+
+@router.get("/search")
+async def search(
+    q: str = Query(..., min_length=2, max_length=100),
+    entities: Optional[str] = Query(None, description="Separadas por coma; por defecto todas"),
+    limit: int = Query(10, ge=1, le=50),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Búsqueda global ordenada por relevancia en conversaciones, leads,
+    distribuidores, vendedores y productos
+    """
+    selected = [e.strip() for e in entities.split(",") if e.strip()] if entities else list(SEARCH_FIELDS)
+    invalid = [e for e in selected if e not in SEARCH_FIELDS]
+    if invalid:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Entidades inválidas: {', '.join(invalid)}. Opciones: {', '.join(SEARCH_FIELDS)}"
+        )
+    
+    return {
+        "query": q,
+        "results": await search_all(db, q, selected, limit)
+    }
+
+@router.get("/messages/search")
+async def search_messages(
+    response: Response,
+    q: str = Query(..., min_length=2, max_length=200),
+    role: Optional[str] = Query(None, pattern="^(user|assistant)$"),
+    profile_type: Optional[str] = None,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Busca en el contenido de todos los mensajes (más recientes primero)
+    
+    En PostgreSQL usa el índice de texto completo en español, así "membresías"
+    encuentra "membresía"; q acepta comillas para frases y -palabra para
+    excluir. snippet trae el fragmento con los términos entre <mark></mark>
+    (el resto del texto va escapado). Página siguiente: header X-Next-Cursor.
+    """
+    if not q.strip().strip('"'):
+        raise HTTPException(status_code=400, detail="Búsqueda vacía")
+    
+    dialect = db.get_bind().dialect.name
+    headline = message_headline(q, dialect)
+    columns = [Message, Conversation.phone_number, Conversation.user_name, Conversation.profile_type]
+    if headline is not None:
+        columns.append(headline.label("headline"))
+    
+    query = select(*columns).join(
+        Conversation, Conversation.id == Message.conversation_id
+    ).where(message_match(q, dialect))
+    
+    if role:
+        query = query.where(Message.role == role)
+    
+    if profile_type:
+        query = query.where(Conversation.profile_type == profile_type)
+    
+    if date_from:
+        query = query.where(Message.timestamp >= date_from)
+    
+    if date_to:
+        query = query.where(Message.timestamp < date_to + timedelta(days=1))
+    
+    paginator = KeysetPaginator([Message.timestamp, Message.id], cursor=cursor, limit=limit)
+    rows = paginator.page(
+        (await db.execute(paginator.apply(query))).all(), response, item=lambda row: row[0]
+    )
+    
+    return [{
+        "id": row[0].id,
+        "conversation_id": row[0].conversation_id,
+        "phone_number": row.phone_number,
+        "user_name": row.user_name,
+        "profile_type": row.profile_type,
+        "role": row[0].role,
+        "timestamp": row[0].timestamp,
+        "snippet": render_snippet(row[0].content, q, row.headline if headline is not None else None)
+    } for row in rows]
+
+# ==================== ESTADÍSTICAS ====================
+
+async def _query_detailed_stats(db: AsyncSession) -> dict:
+    """Una consulta agrupada por tabla, con los filtros como agregados condicionales"""
+    week_ago = datetime.utcnow() - timedelta(days=7)
+
+    # Perfiles más comunes + totales y conversaciones de los últimos 7 días
+    profiles = (await db.execute(
+        select(
+            Conversation.profile_type,
+            func.count(Conversation.id),
+            func.count(Conversation.id).filter(Conversation.created_at >= week_ago)
+        ).group_by(Conversation.profile_type)
+    )).all()
+
+    # Leads por estado + leads de alto interés
+    leads_by_status = (await db.execute(
+        select(
+            Lead.status,
+            func.count(Lead.id),
+            func.count(Lead.id).filter(Lead.interest_level >= 7)
+        ).group_by(Lead.status)
+    )).all()
+
     return {
         "general": {
-            "total_conversations": total_conversations,
-            "total_leads": total_leads,
-            "high_interest_leads": high_interest,
-            "recent_conversations": recent_conversations
+            "total_conversations": sum(count for _, count, _ in profiles),
+            "total_leads": sum(count for _, count, _ in leads_by_status),
+            "high_interest_leads": sum(high for _, _, high in leads_by_status),
+            "recent_conversations": sum(recent for _, _, recent in profiles)
         },
-        "leads_by_status": {status: count for status, count in leads_by_status},
-        "profiles": {profile: count for profile, count in profiles}
+        "leads_by_status": {status: count for status, count, _ in leads_by_status},
+        "profiles": {profile: count for profile, count, _ in profiles}
     }
 
+@router.get("/whatsapp/outbound")
+async def get_outbound_status(
+    db: AsyncSession = Depends(get_async_db),
+    current_user: dict = Depends(get_current_user)
+):
+    """Cola de envíos a WhatsApp: carriles del planificador de este proceso y outbox por estado"""
+    outbox = (await db.execute(
+        select(OutboundMessage.status, func.count(OutboundMessage.id))
+        .group_by(OutboundMessage.status)
+    )).all()
+    return {
+        "scheduler": outbound_scheduler.stats(),
+        "outbox": {status: count for status, count in outbox}
+    }
+
+@router.get("/stats/detailed")
+async def get_detailed_stats(
+    db: AsyncSession = Depends(get_async_db),
+    current_user: dict = Depends(get_current_user)
+):
+    """Obtiene estadísticas detalladas"""
+    return await stats_cache.get_or_compute(
+        "detailed",
+        ["conversations", "leads"],
+        lambda: _query_detailed_stats(db)
+    )
+
+def _period_start(moment: datetime, granularity: str) -> date:
+    """Inicio del periodo (día, semana desde el lunes o mes) que contiene la fecha"""
+    day = moment.date() if isinstance(moment, datetime) else moment
+    if granularity == "week":
+        return day - timedelta(days=day.weekday())
+    if granularity == "month":
+        return day.replace(day=1)
+    return day
+
+def _previous_period(start: date, granularity: str) -> date:
+    """Inicio del periodo anterior (los meses se recorren por calendario, no de 30 en 30 días)"""
+    if granularity == "month":
+        return (start - timedelta(days=1)).replace(day=1)
+    if granularity == "week":
+        return start - timedelta(days=7)
+    return start - timedelta(days=1)
+
+def _period_expression(column, granularity: str, dialect: str):
+    """Expresión SQL que trunca la columna al inicio del periodo"""
+    if dialect == "postgresql":
+        return func.date_trunc(granularity, column)
+    # SQLite (desarrollo/pruebas): mismas fronteras calculadas con date()/strftime()
+    if granularity == "month":
+        return func.strftime("%Y-%m-01", column)
+    if granularity == "week":
+        return func.date(column, "weekday 0", "-6 days")
+    return func.date(column)
+
 @router.get("/stats/activity-flow")
 async def get_activity_flow(
     months: int = Query(6, ge=1, le=12, description="Número de meses a obtener"),
-    db: Session = Depends(get_db),
+    granularity: str = Query("month", pattern="^(day|week|month)$", description="Agrupación: day, week o month"),
+    periods: Optional[int] = Query(None, ge=1, le=366, description="Número de periodos (por defecto: months, 12 semanas o 30 días)"),
+    series: str = Query("conversations", pattern="^(" + "|".join(ACTIVITY_SERIES) + ")$"),
+    db: AsyncSession = Depends(get_async_db),
     current_user: dict = Depends(get_current_user)
 ):
-    """Obtiene el flujo de actividad (conversaciones por mes)"""
+    """
+    Obtiene el flujo de actividad (conversaciones, mensajes o leads por periodo)
+    
+    El conteo se hace en la base con un GROUP BY sobre la columna de fecha
+    indexada, así la memoria y la latencia no crecen con el historial.
+    """
     try:
         # Nombres de meses en español
         month_names = ['Ene', 'Feb', 'Mar', 'Abr', 'May', 'Jun', 
                        'Jul', 'Ago', 'Sep', 'Oct', 'Nov', 'Dic']
         
-        # Generar últimos N meses
-        result = []
-        current_date = datetime.utcnow()
+        if periods is None:
+            periods = {"month": months, "week": 12, "day": 30}[granularity]
+        
+        # Inicios de los últimos N periodos, del más antiguo al actual
+        starts = [_period_start(datetime.utcnow(), granularity)]
+        for _ in range(periods - 1):
+            starts.append(_previous_period(starts[-1], granularity))
+        starts.reverse()
         
-        # Obtener datos de conversaciones
-        start_date = current_date - timedelta(days=months * 30)
-        conversations = db.query(Conversation).filter(
-            Conversation.created_at >= start_date
-        ).all()
+        date_column = ACTIVITY_SERIES[series]
+        period = _period_expression(date_column, granularity, db.get_bind().dialect.name)
+        rows = (await db.execute(
+            select(period.label("period"), func.count().label("total")).where(
+                date_column >= datetime.combine(starts[0], datetime.min.time())
+            ).group_by(period)
+        )).all()
         
-        # Agrupar por mes manualmente
-        month_counts = {}
-        for conv in conversations:
-            year_month = (conv.created_at.year, conv.created_at.month)
-            month_counts[year_month] = month_counts.get(year_month, 0) + 1
+        counts = {}
+        for key, total in rows:
+            if isinstance(key, str):
+                key = date.fromisoformat(key[:10])
+            elif isinstance(key, datetime):
+                key = key.date()
+            counts[key] = total
         
-        # Generar resultado para los últimos N meses
-        for i in range(months - 1, -1, -1):
-            target_date = current_date - timedelta(days=i * 30)
-            year = target_date.year
-            month = target_date.month
-            month_idx = month - 1
-            
-            count = month_counts.get((year, month), 0)
-            
-            result.append({
-                "month": month_names[month_idx],
-                "value": count,
-                "year": year,
-                "month_number": month
-            })
+        result = []
+        for start in starts:
+            item = {
+                "period": start.isoformat(),
+                "value": counts.get(start, 0)
+            }
+            if granularity == "month":
+                item.update({
+                    "month": month_names[start.month - 1],
+                    "year": start.year,
+                    "month_number": start.month
+                })
+            else:
+                item["label"] = f"{start.day} {month_names[start.month - 1]}"
+            result.append(item)
         
         return result
         
     except Exception as e:
         # Si hay error, devolver array vacío
         print(f"Error en activity-flow: {str(e)}")
-        return []
\ No newline at end of file
+        return []
@@ -1,14 +1,19 @@
 # backend/app/api/v1/distributors.py
 """Endpoints para el CRUD de distribuidores"""
 
-from fastapi import APIRouter, Depends, HTTPException, Query
+import asyncio
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
 from sqlalchemy.orm import Session
-from sqlalchemy import or_
+from sqlalchemy import or_, func
 from typing import List, Optional
 from datetime import datetime, date
-from passlib.context import CryptContext
 
+from ...auth import get_password_hash_async
 from ...database import get_db
+from ...services.pagination import KeysetPaginator
+from ...services.search import search_filter
+from ...services.stats_cache import stats_cache
 from ..models.distributor import Distributor
 from ...schemas.distributor import (
     DistributorCreate, 
@@ -18,39 +23,48 @@ from ...schemas.distributor import (
 )
 
 router = APIRouter(prefix="/distributors", tags=["distributors"])
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 @router.get("/stats/summary", response_model=dict)
 async def get_distributors_stats(db: Session = Depends(get_db)):
     """Obtiene estadísticas de los distribuidores"""
-    total = db.query(Distributor).count()
-    activos = db.query(Distributor).filter(Distributor.estado == "activo").count()
-    inactivos = db.query(Distributor).filter(Distributor.estado == "inactivo").count()
-    suspendidos = db.query(Distributor).filter(Distributor.estado == "suspendido").count()
-    
-    # Contar por nivel
-    niveles = {}
-    for nivel in ["Pre-Junior", "Junior", "Senior", "Master"]:
-        count = db.query(Distributor).filter(
-            Distributor.nivel == nivel,
-            Distributor.estado == "activo"
-        ).count()
-        niveles[nivel] = count
-    
+    return await stats_cache.get_or_compute(
+        "v1_distributors_summary",
+        ["distributors"],
+        lambda: _query_distributors_stats(db)
+    )
+
+def _query_distributors_stats(db: Session) -> dict:
+    """Conteos por estado y por nivel (solo activos) con un único GROUP BY"""
+    rows = db.query(
+        Distributor.estado,
+        Distributor.nivel,
+        func.count(Distributor.id)
+    ).group_by(Distributor.estado, Distributor.nivel).all()
+
+    por_estado = {"activo": 0, "inactivo": 0, "suspendido": 0}
+    niveles = {nivel: 0 for nivel in ["Pre-Junior", "Junior", "Senior", "Master"]}
+    for estado, nivel, count in rows:
+        if estado in por_estado:
+            por_estado[estado] += count
+        if estado == "activo" and nivel in niveles:
+            niveles[nivel] += count
+
     return {
-        "total": total,
+        "total": sum(count for _, _, count in rows),
         "por_estado": {
-            "activos": activos,
-            "inactivos": inactivos,
-            "suspendidos": suspendidos
+            "activos": por_estado["activo"],
+            "inactivos": por_estado["inactivo"],
+            "suspendidos": por_estado["suspendido"]
         },
         "por_nivel": niveles
     }
 
 @router.get("/", response_model=List[DistributorListResponse])
 async def get_all_distributors(
+    response: Response,
     skip: int = 0,
     limit: int = Query(default=100, le=1000),
+    cursor: Optional[str] = None,
     search: Optional[str] = None,
     estado: Optional[str] = None,
     nivel: Optional[str] = None,
@@ -67,16 +81,13 @@ async def get_all_distributors(
     
     # Aplicar filtros
     if search:
-        search_filter = f"%{search}%"
-        query = query.filter(
-            or_(
-                Distributor.nombres.ilike(search_filter),
-                Distributor.apellidos.ilike(search_filter),
-                Distributor.telefono.like(search_filter),
-                Distributor.email.ilike(search_filter),
-                Distributor.usuario.ilike(search_filter)
-            )
-        )
+        query = query.filter(search_filter([
+            Distributor.nombres,
+            Distributor.apellidos,
+            Distributor.telefono,
+            Distributor.email,
+            Distributor.usuario
+        ], search))
     
     if estado:
         query = query.filter(Distributor.estado == estado)
@@ -84,8 +95,11 @@ async def get_all_distributors(
     if nivel:
         query = query.filter(Distributor.nivel == nivel)
     
-    # Ordenar y paginar
-    distributors = query.order_by(Distributor.created_at.desc()).offset(skip).limit(limit).all()
+    # Ordenar y paginar (cursor en X-Next-Cursor; skip queda por compatibilidad)
+    paginator = KeysetPaginator(
+        [Distributor.created_at, Distributor.id], cursor=cursor, limit=limit, skip=skip
+    )
+    distributors = paginator.page(paginator.apply(query).all(), response)
     
     return [d.to_dict() for d in distributors]
 
@@ -120,6 +134,13 @@ async def create_distributor(distributor: DistributorCreate, db: Session = Depen
         elif existing.email == distributor.email:
             raise HTTPException(status_code=400, detail="Ya existe un distribuidor con ese email")
     
+    # Hashes en el pool de bcrypt (fuera del event loop), en paralelo
+    contrasena, contrasena_doble_factor = await asyncio.gather(
+        get_password_hash_async(distributor.contrasena),
+        get_password_hash_async(distributor.contrasena_doble_factor)
+        if distributor.contrasena_doble_factor else asyncio.sleep(0, result=None)
+    )
+    
     # Crear el nuevo distribuidor
     db_distributor = Distributor(
         nombres=distributor.nombres,
@@ -129,8 +150,8 @@ async def create_distributor(distributor: DistributorCreate, db: Session = Depen
         fecha_ingreso=distributor.fecha_ingreso,
         fecha_cumpleanos=distributor.fecha_cumpleanos,
         usuario=distributor.usuario,
-        contrasena=pwd_context.hash(distributor.contrasena),
-        contrasena_doble_factor=pwd_context.hash(distributor.contrasena_doble_factor) if distributor.contrasena_doble_factor else None,
+        contrasena=contrasena,
+        contrasena_doble_factor=contrasena_doble_factor,
         nivel=distributor.nivel or "Pre-Junior",
         estado=distributor.estado or "activo",
         lead_phone=distributor.lead_phone,
@@ -178,12 +199,10 @@ async def update_distributor(
     # Actualizar solo los campos que se enviaron
     update_data = distributor.dict(exclude_unset=True)
     
-    # Hashear contraseñas si se están actualizando
-    if "contrasena" in update_data and update_data["contrasena"]:
-        update_data["contrasena"] = pwd_context.hash(update_data["contrasena"])
-    
-    if "contrasena_doble_factor" in update_data and update_data["contrasena_doble_factor"]:
-        update_data["contrasena_doble_factor"] = pwd_context.hash(update_data["contrasena_doble_factor"])
+    # Hashear contraseñas si se están actualizando (en el pool de bcrypt)
+    fields = [f for f in ("contrasena", "contrasena_doble_factor") if update_data.get(f)]
+    hashes = await asyncio.gather(*(get_password_hash_async(update_data[f]) for f in fields))
+    update_data.update(zip(fields, hashes))
     
     # Actualizar campos
     for field, value in update_data.items():
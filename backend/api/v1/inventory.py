@@ -3,11 +3,13 @@
 Endpoints para el sistema de inventario y ventas
 """
 
-from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy.orm import Session
-from sqlalchemy import or_, func
-from typing import List, Optional
-from datetime import datetime, date
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from sqlalchemy.orm import Session, selectinload, joinedload, noload
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import func, insert, select, tuple_, update
+from sqlalchemy.exc import IntegrityError
+from typing import Dict, List, Optional, Tuple
+from datetime import datetime, date, timedelta
 import sys
 import os
 
@@ -17,21 +19,27 @@ if backend_path not in sys.path:
     sys.path.insert(0, backend_path)
 
 # Importar desde backend directamente (no desde app)
-from database import get_db
+from database import get_db, get_async_db
 
 # Importar modelos y schemas desde la estructura app/
 from inventory.models.inventory import (
     Vendedor, Producto, StockVendedor, VentaVendedor,
-    AsignacionProductoVendedor
+    AsignacionProductoVendedor, VentaDiaria,
+    AjusteInventarioVendedor, MovimientoStock, MOTIVOS_MOVIMIENTO
 )
 from inventory.schemas.inventory import (
     VendedorCreate, VendedorUpdate, VendedorResponse,
     ProductoCreate, ProductoUpdate, ProductoResponse,
-    StockCreate, StockUpdate, StockResponse,
-    VentaCreate, VentaUpdate, VentaResponse,
+    StockCreate, StockUpdate, StockLoteCreate, StockResponse,
+    VentaCreate, VentaLoteCreate, VentaUpdate, VentaResponse,
     AsignacionCreate, AsignacionResponse,
-    AjusteCreate, AjusteResponse
+    AjusteCreate, AjusteResponse,
+    MovimientoStockResponse, StockHistoricoResponse
 )
+from repositories.inventory_repository import SalesRollupRepository, StockLedgerRepository, StockRepository
+from services.pagination import KeysetPaginator
+from services.search import search_filter
+from services.stats_cache import stats_cache
 
 router = APIRouter(prefix="/inventory", tags=["inventory"])
 
@@ -39,51 +47,163 @@ router = APIRouter(prefix="/inventory", tags=["inventory"])
 # ESTADÍSTICAS GENERALES
 # ===============================================
 
+async def _query_inventario(db: AsyncSession) -> dict:
+    """Vendedores, productos, stock y valor del inventario en una sola sentencia"""
+    vendedores = select(
+        func.count(Vendedor.id).label("total")
+    ).where(Vendedor.estado == "activo").subquery()
+    productos = select(
+        func.count(Producto.id).label("total")
+    ).where(Producto.estado == "activo").subquery()
+    stock = select(
+        func.coalesce(func.sum(StockVendedor.cantidad_actual), 0).label("unidades"),
+        func.coalesce(func.sum(StockVendedor.cantidad_actual * Producto.precio_unitario), 0).label("valor")
+    ).join(Producto, Producto.id == StockVendedor.producto_id).subquery()
+
+    row = (await db.execute(select(
+        vendedores.c.total, productos.c.total, stock.c.unidades, stock.c.valor
+    ))).one()
+    return {
+        "total_vendedores": row[0] or 0,
+        "total_productos": row[1] or 0,
+        "stock_total": int(row[2] or 0),
+        "valor_inventario": float(row[3] or 0)
+    }
+
+async def _ventas_desde(db: AsyncSession, desde: date, *filters) -> dict:
+    """Totales de ventas desde una fecha, leídos del resumen diario"""
+    row = (await db.execute(
+        select(
+            func.coalesce(func.sum(VentaDiaria.num_ventas), 0),
+            func.coalesce(func.sum(VentaDiaria.unidades), 0),
+            func.coalesce(func.sum(VentaDiaria.valor), 0)
+        ).where(VentaDiaria.fecha >= desde, *filters)
+    )).one()
+    return {"ventas": int(row[0]), "unidades": int(row[1]), "valor": float(row[2])}
+
+def _inicio_mes() -> date:
+    return datetime.now().date().replace(day=1)
+
 @router.get("/estadisticas/general")
-async def get_estadisticas_general(db: Session = Depends(get_db)):
+async def get_estadisticas_general(db: AsyncSession = Depends(get_async_db)):
     """Obtiene estadísticas generales del inventario"""
-    total_vendedores = db.query(Vendedor).filter(Vendedor.estado == "activo").count()
-    total_productos = db.query(Producto).filter(Producto.estado == "activo").count()
-    
-    # Stock total
-    stock_total = db.query(func.sum(StockVendedor.cantidad_actual)).scalar() or 0
-    
-    # Valor total del inventario
-    valor_inventario = db.query(
-        func.sum(StockVendedor.cantidad_actual * Producto.precio_unitario)
-    ).join(Producto).scalar() or 0
-    
-    # Ventas del mes
-    inicio_mes = datetime.now().replace(
-        day=1, hour=0, minute=0, second=0, microsecond=0
+    # El valor del inventario se cachea y se invalida al escribir stock o productos
+    inventario = await stats_cache.get_or_compute(
+        "inventario",
+        ["vendedores", "productos", "stock_vendedores"],
+        lambda: _query_inventario(db)
     )
     
-    ventas_mes = db.query(VentaVendedor).filter(
-        VentaVendedor.fecha_venta >= inicio_mes
-    ).count()
+    # Ventas del mes desde el resumen diario (un registro por día/vendedor/producto)
+    mes = await _ventas_desde(db, _inicio_mes())
     
-    valor_ventas_mes = db.query(
-        func.sum(VentaVendedor.cantidad * VentaVendedor.precio_venta)
-    ).filter(
-        VentaVendedor.fecha_venta >= inicio_mes
-    ).scalar() or 0
+    return {
+        **inventario,
+        "ventas_mes": mes["ventas"],
+        "valor_ventas_mes": mes["valor"]
+    }
+
+async def _estadisticas_por(
+    db: AsyncSession, column, entity_id: int, dias: int, group_column, desglose_key: str
+) -> dict:
+    """Estadísticas de un vendedor o producto: stock, mes en curso y serie diaria"""
+    stock = (await db.execute(
+        select(
+            func.coalesce(func.sum(StockVendedor.cantidad_actual), 0),
+            func.coalesce(func.sum(StockVendedor.cantidad_actual * Producto.precio_unitario), 0)
+        ).join(Producto, Producto.id == StockVendedor.producto_id).where(
+            getattr(StockVendedor, column.key) == entity_id
+        )
+    )).one()
+    
+    mes = await _ventas_desde(db, _inicio_mes(), column == entity_id)
+    
+    desde = datetime.now().date() - timedelta(days=dias - 1)
+    por_dia = (await db.execute(
+        select(
+            VentaDiaria.fecha,
+            func.sum(VentaDiaria.num_ventas),
+            func.sum(VentaDiaria.unidades),
+            func.sum(VentaDiaria.valor)
+        ).where(column == entity_id, VentaDiaria.fecha >= desde)
+        .group_by(VentaDiaria.fecha).order_by(VentaDiaria.fecha)
+    )).all()
+    
+    desglose = (await db.execute(
+        select(
+            group_column,
+            func.sum(VentaDiaria.num_ventas),
+            func.sum(VentaDiaria.unidades),
+            func.sum(VentaDiaria.valor)
+        ).where(column == entity_id, VentaDiaria.fecha >= desde)
+        .group_by(group_column).order_by(func.sum(VentaDiaria.valor).desc())
+    )).all()
     
     return {
-        "total_vendedores": total_vendedores,
-        "total_productos": total_productos,
-        "stock_total": int(stock_total),
-        "valor_inventario": float(valor_inventario),
-        "ventas_mes": ventas_mes,
-        "valor_ventas_mes": float(valor_ventas_mes)
+        "stock_total": int(stock[0]),
+        "valor_inventario": float(stock[1]),
+        "ventas_mes": mes["ventas"],
+        "unidades_mes": mes["unidades"],
+        "valor_ventas_mes": mes["valor"],
+        "por_dia": [
+            {
+                "fecha": fecha.isoformat() if isinstance(fecha, date) else fecha,
+                "ventas": int(ventas),
+                "unidades": int(unidades),
+                "valor": float(valor)
+            }
+            for fecha, ventas, unidades, valor in por_dia
+        ],
+        desglose_key: [
+            {
+                group_column.key: group_id,
+                "ventas": int(ventas),
+                "unidades": int(unidades),
+                "valor": float(valor)
+            }
+            for group_id, ventas, unidades, valor in desglose
+        ]
     }
 
+@router.get("/estadisticas/vendedor/{vendedor_id}")
+async def get_estadisticas_vendedor(
+    vendedor_id: int,
+    dias: int = Query(default=30, ge=1, le=366),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Estadísticas de un vendedor: stock, ventas del mes y ventas por día y producto"""
+    if not await db.get(Vendedor, vendedor_id):
+        raise HTTPException(status_code=404, detail="Vendedor no encontrado")
+    
+    stats = await _estadisticas_por(
+        db, VentaDiaria.vendedor_id, vendedor_id, dias, VentaDiaria.producto_id, "por_producto"
+    )
+    return {"vendedor_id": vendedor_id, **stats}
+
+@router.get("/estadisticas/producto/{producto_id}")
+async def get_estadisticas_producto(
+    producto_id: int,
+    dias: int = Query(default=30, ge=1, le=366),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Estadísticas de un producto: stock, ventas del mes y ventas por día y vendedor"""
+    if not await db.get(Producto, producto_id):
+        raise HTTPException(status_code=404, detail="Producto no encontrado")
+    
+    stats = await _estadisticas_por(
+        db, VentaDiaria.producto_id, producto_id, dias, VentaDiaria.vendedor_id, "por_vendedor"
+    )
+    return {"producto_id": producto_id, **stats}
+
 # ===============================================
 # VENDEDORES ENDPOINTS
 # ===============================================
 
 @router.get("/vendedores", response_model=List[VendedorResponse])
 async def get_vendedores(
+    response: Response,
     skip: int = 0,
+    cursor: Optional[str] = None,
     limit: int = Query(default=100, le=1000),
     search: Optional[str] = None,
     ciudad: Optional[str] = None,
@@ -94,14 +214,9 @@ async def get_vendedores(
     query = db.query(Vendedor)
     
     if search:
-        search_filter = f"%{search}%"
-        query = query.filter(
-            or_(
-                Vendedor.nombre.ilike(search_filter),
-                Vendedor.telefono.like(search_filter),
-                Vendedor.email.ilike(search_filter)
-            )
-        )
+        query = query.filter(search_filter(
+            [Vendedor.nombre, Vendedor.telefono, Vendedor.email], search
+        ))
     
     if ciudad:
         query = query.filter(Vendedor.ciudad == ciudad)
@@ -109,7 +224,8 @@ async def get_vendedores(
     if estado:
         query = query.filter(Vendedor.estado == estado)
     
-    vendedores = query.order_by(Vendedor.id.desc()).offset(skip).limit(limit).all()
+    paginator = KeysetPaginator([Vendedor.id], cursor=cursor, limit=limit, skip=skip)
+    vendedores = paginator.page(paginator.apply(query).all(), response)
     return vendedores
 
 @router.get("/vendedores/{vendedor_id}", response_model=VendedorResponse)
@@ -177,7 +293,9 @@ async def delete_vendedor(vendedor_id: int, db: Session = Depends(get_db)):
 
 @router.get("/productos", response_model=List[ProductoResponse])
 async def get_productos(
+    response: Response,
     skip: int = 0,
+    cursor: Optional[str] = None,
     limit: int = Query(default=100, le=1000),
     search: Optional[str] = None,
     categoria: Optional[str] = None,
@@ -188,14 +306,9 @@ async def get_productos(
     query = db.query(Producto)
     
     if search:
-        search_filter = f"%{search}%"
-        query = query.filter(
-            or_(
-                Producto.nombre.ilike(search_filter),
-                Producto.codigo.like(search_filter),
-                Producto.descripcion.ilike(search_filter)
-            )
-        )
+        query = query.filter(search_filter(
+            [Producto.nombre, Producto.codigo, Producto.descripcion], search
+        ))
     
     if categoria:
         query = query.filter(Producto.categoria == categoria)
@@ -203,7 +316,8 @@ async def get_productos(
     if estado:
         query = query.filter(Producto.estado == estado)
     
-    productos = query.order_by(Producto.id.desc()).offset(skip).limit(limit).all()
+    paginator = KeysetPaginator([Producto.id], cursor=cursor, limit=limit, skip=skip)
+    productos = paginator.page(paginator.apply(query).all(), response)
     return productos
 
 @router.get("/productos/{producto_id}", response_model=ProductoResponse)
@@ -281,54 +395,64 @@ async def delete_producto(producto_id: int, db: Session = Depends(get_db)):
 # STOCK ENDPOINTS
 # ===============================================
 
+# Relaciones que los listados de stock y ventas pueden anidar (?expand=)
+EXPANDABLE_RELATIONS = ("vendedor", "producto")
+
+def _expand_options(model, expand: str) -> list:
+    """
+    Opciones de carga según expand: las relaciones pedidas se traen en el
+    mismo SELECT (JOIN, son muchos-a-uno) y las demás quedan en null sin
+    consultar la base. expand vacío devuelve solo los IDs.
+    """
+    requested = {part.strip() for part in expand.split(",") if part.strip()}
+    invalid = requested - set(EXPANDABLE_RELATIONS)
+    if invalid:
+        raise HTTPException(
+            status_code=400,
+            detail=f"expand inválido: {', '.join(sorted(invalid))}. Opciones: {', '.join(EXPANDABLE_RELATIONS)}"
+        )
+    return [
+        joinedload(getattr(model, relation)) if relation in requested else noload(getattr(model, relation))
+        for relation in EXPANDABLE_RELATIONS
+    ]
+
 @router.get("/stock", response_model=List[StockResponse])
 async def get_stock(
+    response: Response,
     vendedor_id: Optional[int] = None,
     producto_id: Optional[int] = None,
     skip: int = 0,
+    cursor: Optional[str] = None,
     limit: int = Query(default=100, le=1000),
-    db: Session = Depends(get_db)
+    expand: str = Query(default="vendedor,producto", description="Relaciones a anidar; vacío = solo IDs"),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Obtiene el stock de vendedores"""
-    query = db.query(StockVendedor)
+    """Obtiene el stock de vendedores (una sola consulta por página)"""
+    query = select(StockVendedor).options(*_expand_options(StockVendedor, expand))
     
     if vendedor_id:
-        query = query.filter(StockVendedor.vendedor_id == vendedor_id)
+        query = query.where(StockVendedor.vendedor_id == vendedor_id)
     
     if producto_id:
-        query = query.filter(StockVendedor.producto_id == producto_id)
+        query = query.where(StockVendedor.producto_id == producto_id)
     
-    stock_items = query.offset(skip).limit(limit).all()
+    paginator = KeysetPaginator(
+        [StockVendedor.id], cursor=cursor, limit=limit, skip=skip, descending=False
+    )
+    stock_items = paginator.page((await db.scalars(paginator.apply(query))).all(), response)
     return stock_items
 
 @router.post("/stock/asignar")
-async def asignar_stock(asignacion: StockCreate, db: Session = Depends(get_db)):
+async def asignar_stock(asignacion: StockCreate, db: AsyncSession = Depends(get_async_db)):
     """Asigna stock inicial a un vendedor"""
-    vendedor = db.query(Vendedor).filter(Vendedor.id == asignacion.vendedor_id).first()
+    vendedor = await db.get(Vendedor, asignacion.vendedor_id)
     if not vendedor:
         raise HTTPException(status_code=404, detail="Vendedor no encontrado")
     
-    producto = db.query(Producto).filter(Producto.id == asignacion.producto_id).first()
+    producto = await db.get(Producto, asignacion.producto_id)
     if not producto:
         raise HTTPException(status_code=404, detail="Producto no encontrado")
     
-    stock_existente = db.query(StockVendedor).filter(
-        StockVendedor.vendedor_id == asignacion.vendedor_id,
-        StockVendedor.producto_id == asignacion.producto_id
-    ).first()
-    
-    if stock_existente:
-        stock_existente.cantidad_actual += asignacion.cantidad
-        stock_existente.cantidad_inicial += asignacion.cantidad
-    else:
-        stock_existente = StockVendedor(
-            vendedor_id=asignacion.vendedor_id,
-            producto_id=asignacion.producto_id,
-            cantidad_inicial=asignacion.cantidad,
-            cantidad_actual=asignacion.cantidad
-        )
-        db.add(stock_existente)
-    
     db_asignacion = AsignacionProductoVendedor(
         vendedor_id=asignacion.vendedor_id,
         producto_id=asignacion.producto_id,
@@ -337,119 +461,510 @@ async def asignar_stock(asignacion: StockCreate, db: Session = Depends(get_db)):
         notas=f"Asignación de {asignacion.cantidad} unidades"
     )
     db.add(db_asignacion)
-    
-    db.commit()
+    await db.flush()
+    
+    # Suma atómica sobre la fila existente; si no hay fila se crea
+    stock_id = await db.scalar(
+        update(StockVendedor)
+        .where(
+            StockVendedor.vendedor_id == asignacion.vendedor_id,
+            StockVendedor.producto_id == asignacion.producto_id
+        )
+        .values(
+            cantidad_actual=StockVendedor.cantidad_actual + asignacion.cantidad,
+            cantidad_inicial=StockVendedor.cantidad_inicial + asignacion.cantidad,
+            ultima_actualizacion=datetime.utcnow()
+        )
+        .returning(StockVendedor.id)
+    )
+    if stock_id is None:
+        stock_nuevo = StockVendedor(
+            vendedor_id=asignacion.vendedor_id,
+            producto_id=asignacion.producto_id,
+            cantidad_inicial=asignacion.cantidad,
+            cantidad_actual=asignacion.cantidad
+        )
+        db.add(stock_nuevo)
+        await db.flush()
+        stock_id = stock_nuevo.id
+    
+    await StockRepository(db).record([{
+        "vendedor_id": asignacion.vendedor_id,
+        "producto_id": asignacion.producto_id,
+        "cantidad": asignacion.cantidad,
+        "motivo": "asignacion",
+        "referencia_id": db_asignacion.id
+    }])
+    
+    try:
+        await db.commit()
+    except IntegrityError:
+        # Otro request creó el mismo par de stock al mismo tiempo
+        await db.rollback()
+        raise HTTPException(status_code=409, detail="El stock cambió durante la operación, reintente")
     
     return {
         "success": True,
         "message": f"Se asignaron {asignacion.cantidad} unidades correctamente",
-        "stock_id": stock_existente.id
+        "stock_id": stock_id
+    }
+
+# ===============================================
+# OPERACIONES POR LOTE
+# Todo o nada: si una línea falla se rechaza el lote completo (400 con el
+# índice de cada línea y su error) y no se escribe nada.
+# ===============================================
+
+def _rechazar_lote(errores: List[dict]):
+    raise HTTPException(
+        status_code=400,
+        detail={"message": "Lote rechazado, no se guardó ninguna línea", "errors": errores}
+    )
+
+def _totales_por_par(items) -> Dict[Tuple[int, int], int]:
+    """Unidades por (vendedor, producto); un par puede repetirse en el lote"""
+    totales: Dict[Tuple[int, int], int] = {}
+    for item in items:
+        par = (item.vendedor_id, item.producto_id)
+        totales[par] = totales.get(par, 0) + item.cantidad
+    return totales
+
+async def _bloquear_stock(db: AsyncSession, pares) -> Dict[Tuple[int, int], StockVendedor]:
+    """
+    Bloquea las filas de stock de todos los pares con un solo SELECT ... FOR UPDATE.
+    El orden por id evita bloqueos cruzados entre dos lotes simultáneos.
+    """
+    filas = (await db.scalars(
+        select(StockVendedor)
+        .where(tuple_(StockVendedor.vendedor_id, StockVendedor.producto_id).in_(sorted(pares)))
+        .order_by(StockVendedor.id)
+        .with_for_update()
+    )).all()
+    return {(s.vendedor_id, s.producto_id): s for s in filas}
+
+async def _ids_existentes(db: AsyncSession, column, ids) -> set:
+    return set((await db.scalars(select(column).where(column.in_(ids)))).all())
+
+@router.post("/stock/asignar/lote")
+async def asignar_stock_lote(lote: StockLoteCreate, db: AsyncSession = Depends(get_async_db)):
+    """Asigna stock a varios vendedores y productos en una sola transacción"""
+    items = lote.items
+    vendedores = await _ids_existentes(db, Vendedor.id, {i.vendedor_id for i in items})
+    productos = await _ids_existentes(db, Producto.id, {i.producto_id for i in items})
+    
+    errores = []
+    for index, item in enumerate(items):
+        if item.vendedor_id not in vendedores:
+            errores.append({"index": index, "error": "Vendedor no encontrado"})
+        elif item.producto_id not in productos:
+            errores.append({"index": index, "error": "Producto no encontrado"})
+    if errores:
+        _rechazar_lote(errores)
+    
+    totales = _totales_por_par(items)
+    stock = await _bloquear_stock(db, totales)
+    ahora = datetime.utcnow()
+    for (vendedor_id, producto_id), cantidad in totales.items():
+        existente = stock.get((vendedor_id, producto_id))
+        if existente:
+            existente.cantidad_actual += cantidad
+            existente.cantidad_inicial += cantidad
+            existente.ultima_actualizacion = ahora
+        else:
+            stock[(vendedor_id, producto_id)] = StockVendedor(
+                vendedor_id=vendedor_id,
+                producto_id=producto_id,
+                cantidad_inicial=cantidad,
+                cantidad_actual=cantidad
+            )
+            db.add(stock[(vendedor_id, producto_id)])
+    
+    asignacion_ids = (await db.scalars(
+        insert(AsignacionProductoVendedor).returning(
+            AsignacionProductoVendedor.id, sort_by_parameter_order=True
+        ),
+        [
+            {
+                "vendedor_id": item.vendedor_id,
+                "producto_id": item.producto_id,
+                "cantidad": item.cantidad,
+                "asignado_por": 1,
+                "notas": f"Asignación de {item.cantidad} unidades (lote)",
+                "fecha_asignacion": ahora
+            }
+            for item in items
+        ]
+    )).all()
+    await StockRepository(db).record([
+        {
+            "vendedor_id": item.vendedor_id,
+            "producto_id": item.producto_id,
+            "cantidad": item.cantidad,
+            "motivo": "asignacion",
+            "referencia_id": asignacion_id
+        }
+        for item, asignacion_id in zip(items, asignacion_ids)
+    ])
+    
+    try:
+        await db.commit()
+    except IntegrityError:
+        # Otro request creó el mismo par de stock entre el SELECT y el INSERT
+        await db.rollback()
+        raise HTTPException(status_code=409, detail="El stock cambió durante la operación, reintente el lote")
+    
+    return {
+        "success": True,
+        "message": f"Se aplicaron {len(items)} asignaciones ({sum(totales.values())} unidades)",
+        "stock": [
+            {"vendedor_id": v, "producto_id": p, "stock_id": s.id, "cantidad_actual": s.cantidad_actual}
+            for (v, p), s in stock.items() if (v, p) in totales
+        ]
     }
 
 # ===============================================
 # VENTAS ENDPOINTS
 # ===============================================
 
+async def _rechazar_movimiento(db: AsyncSession, vendedor_id: int, producto_id: int, solicitado: int):
+    """Error de un descuento de stock que no se aplicó: sin stock asignado (404) o insuficiente (400)"""
+    disponible = await StockRepository(db).available(vendedor_id, producto_id)
+    if disponible is None:
+        raise HTTPException(
+            status_code=404, 
+            detail="No hay stock asignado para este producto y vendedor"
+        )
+    raise HTTPException(
+        status_code=400,
+        detail=f"Stock insuficiente. Disponible: {disponible}, Solicitado: {solicitado}"
+    )
+
+async def _get_venta(db: AsyncSession, venta_id: int) -> Optional[VentaVendedor]:
+    """Carga una venta con vendedor y producto (la sesión async no permite lazy load)"""
+    return await db.scalar(
+        select(VentaVendedor).options(
+            selectinload(VentaVendedor.vendedor),
+            selectinload(VentaVendedor.producto)
+        ).where(VentaVendedor.id == venta_id)
+    )
+
 @router.get("/ventas", response_model=List[VentaResponse])
 async def get_ventas(
+    response: Response,
     vendedor_id: Optional[int] = None,
     producto_id: Optional[int] = None,
     fecha_desde: Optional[date] = None,
     fecha_hasta: Optional[date] = None,
     skip: int = 0,
+    cursor: Optional[str] = None,
     limit: int = Query(default=100, le=1000),
-    db: Session = Depends(get_db)
+    expand: str = Query(default="vendedor,producto", description="Relaciones a anidar; vacío = solo IDs"),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Obtiene las ventas con filtros opcionales"""
-    query = db.query(VentaVendedor)
+    """Obtiene las ventas con filtros opcionales (una sola consulta por página)"""
+    query = select(VentaVendedor).options(*_expand_options(VentaVendedor, expand))
     
     if vendedor_id:
-        query = query.filter(VentaVendedor.vendedor_id == vendedor_id)
+        query = query.where(VentaVendedor.vendedor_id == vendedor_id)
     
     if producto_id:
-        query = query.filter(VentaVendedor.producto_id == producto_id)
+        query = query.where(VentaVendedor.producto_id == producto_id)
     
     if fecha_desde:
-        query = query.filter(VentaVendedor.fecha_venta >= fecha_desde)
+        query = query.where(VentaVendedor.fecha_venta >= fecha_desde)
     
     if fecha_hasta:
-        query = query.filter(VentaVendedor.fecha_venta <= fecha_hasta)
+        query = query.where(VentaVendedor.fecha_venta <= fecha_hasta)
     
-    ventas = query.order_by(VentaVendedor.fecha_venta.desc()).offset(skip).limit(limit).all()
+    paginator = KeysetPaginator(
+        [VentaVendedor.fecha_venta, VentaVendedor.id], cursor=cursor, limit=limit, skip=skip
+    )
+    ventas = paginator.page((await db.scalars(paginator.apply(query))).all(), response)
     return ventas
 
 @router.post("/ventas", response_model=VentaResponse)
-async def create_venta(venta: VentaCreate, db: Session = Depends(get_db)):
+async def create_venta(venta: VentaCreate, db: AsyncSession = Depends(get_async_db)):
     """Registra una nueva venta"""
-    stock = db.query(StockVendedor).filter(
-        StockVendedor.vendedor_id == venta.vendedor_id,
-        StockVendedor.producto_id == venta.producto_id
-    ).first()
-    
-    if not stock:
-        raise HTTPException(
-            status_code=404, 
-            detail="No hay stock asignado para este producto y vendedor"
-        )
-    
-    if stock.cantidad_actual < venta.cantidad:
-        raise HTTPException(
-            status_code=400,
-            detail=f"Stock insuficiente. Disponible: {stock.cantidad_actual}, Solicitado: {venta.cantidad}"
-        )
+    # Verificación y descuento en un solo UPDATE condicional; el movimiento
+    # se registra cuando la venta ya tiene id
+    stock_repo = StockRepository(db)
+    stock_restante = await stock_repo.move(venta.vendedor_id, venta.producto_id, -venta.cantidad)
+    if stock_restante is None:
+        await _rechazar_movimiento(db, venta.vendedor_id, venta.producto_id, venta.cantidad)
     
     precio_venta = venta.precio_venta
     if not precio_venta:
-        producto = db.query(Producto).filter(Producto.id == venta.producto_id).first()
-        precio_venta = producto.precio_unitario
+        precio_venta = await db.scalar(
+            select(Producto.precio_unitario).where(Producto.id == venta.producto_id)
+        )
     
     venta_data = venta.model_dump()
     venta_data['precio_venta'] = precio_venta
     db_venta = VentaVendedor(**venta_data)
     db.add(db_venta)
-    db.flush()
+    await db.flush()
+    
+    await stock_repo.record([{
+        "vendedor_id": db_venta.vendedor_id,
+        "producto_id": db_venta.producto_id,
+        "cantidad": -db_venta.cantidad,
+        "motivo": "venta",
+        "referencia_id": db_venta.id
+    }])
+    await SalesRollupRepository(db).add_sale(
+        db_venta.vendedor_id, db_venta.producto_id, db_venta.fecha_venta,
+        db_venta.cantidad, db_venta.precio_venta
+    )
     
-    stock.cantidad_actual -= venta.cantidad
+    await db.commit()
+    return await _get_venta(db, db_venta.id)
+
+@router.post("/ventas/lote")
+async def create_ventas_lote(lote: VentaLoteCreate, db: AsyncSession = Depends(get_async_db)):
+    """Registra varias ventas en una sola transacción (todo o nada)"""
+    items = lote.items
+    totales = _totales_por_par(items)
+    stock = await _bloquear_stock(db, totales)
+    
+    errores = []
+    for index, item in enumerate(items):
+        par = (item.vendedor_id, item.producto_id)
+        if par not in stock:
+            errores.append({"index": index, "error": "No hay stock asignado para este producto y vendedor"})
+        elif stock[par].cantidad_actual < totales[par]:
+            errores.append({
+                "index": index,
+                "error": f"Stock insuficiente. Disponible: {stock[par].cantidad_actual}, "
+                         f"Solicitado en el lote: {totales[par]}"
+            })
+    if errores:
+        _rechazar_lote(errores)
+    
+    # Precios faltantes: el precio unitario del producto, en una sola consulta
+    sin_precio = {item.producto_id for item in items if not item.precio_venta}
+    precios = {}
+    if sin_precio:
+        precios = dict((await db.execute(
+            select(Producto.id, Producto.precio_unitario).where(Producto.id.in_(sin_precio))
+        )).all())
+    
+    ahora = datetime.utcnow()
+    filas = []
+    for item in items:
+        fila = item.model_dump()
+        fila["precio_venta"] = item.precio_venta or precios.get(item.producto_id)
+        fila["fecha_venta"] = ahora
+        filas.append(fila)
+    
+    ids = (await db.scalars(
+        insert(VentaVendedor).returning(VentaVendedor.id, sort_by_parameter_order=True), filas
+    )).all()
+    
+    for par, cantidad in totales.items():
+        stock[par].cantidad_actual -= cantidad
+        stock[par].ultima_actualizacion = ahora
+    
+    await StockRepository(db).record([
+        {
+            "vendedor_id": fila["vendedor_id"],
+            "producto_id": fila["producto_id"],
+            "cantidad": -fila["cantidad"],
+            "motivo": "venta",
+            "referencia_id": venta_id
+        }
+        for fila, venta_id in zip(filas, ids)
+    ])
+    await SalesRollupRepository(db).add_sales(filas)
+    await db.commit()
     
-    db.commit()
-    db.refresh(db_venta)
-    return db_venta
+    return {
+        "success": True,
+        "message": f"Se registraron {len(ids)} ventas",
+        "venta_ids": ids,
+        "total_unidades": sum(totales.values()),
+        "valor_total": float(sum((f["precio_venta"] or 0) * f["cantidad"] for f in filas))
+    }
 
 @router.put("/ventas/{venta_id}", response_model=VentaResponse)
 async def update_venta(
     venta_id: int,
     venta_update: VentaUpdate,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Actualiza una venta existente"""
-    venta = db.query(VentaVendedor).filter(VentaVendedor.id == venta_id).first()
+    venta = await db.get(VentaVendedor, venta_id)
     if not venta:
         raise HTTPException(status_code=404, detail="Venta no encontrada")
     
     update_data = venta_update.model_dump(exclude_unset=True)
+    
+    # Si cambia la cantidad, el stock se ajusta por la diferencia (atómico,
+    # igual que al crear); una devolución sin stock asignado no se rechaza
+    diferencia = (update_data.get("cantidad") or venta.cantidad) - venta.cantidad
+    if diferencia:
+        stock_restante = await StockRepository(db).move(
+            venta.vendedor_id, venta.producto_id, -diferencia,
+            motivo="venta" if diferencia > 0 else "devolucion", referencia_id=venta.id
+        )
+        if stock_restante is None and diferencia > 0:
+            await _rechazar_movimiento(db, venta.vendedor_id, venta.producto_id, diferencia)
+    
+    # El resumen diario se corrige quitando la venta anterior y sumando la nueva
+    rollup = SalesRollupRepository(db)
+    if "cantidad" in update_data or "precio_venta" in update_data:
+        await rollup.add_sale(
+            venta.vendedor_id, venta.producto_id, venta.fecha_venta,
+            venta.cantidad, venta.precio_venta, sign=-1
+        )
     for field, value in update_data.items():
         setattr(venta, field, value)
+    if "cantidad" in update_data or "precio_venta" in update_data:
+        await rollup.add_sale(
+            venta.vendedor_id, venta.producto_id, venta.fecha_venta,
+            venta.cantidad, venta.precio_venta
+        )
     
-    db.commit()
-    db.refresh(venta)
-    return venta
+    await db.commit()
+    return await _get_venta(db, venta_id)
 
 @router.delete("/ventas/{venta_id}")
-async def delete_venta(venta_id: int, db: Session = Depends(get_db)):
+async def delete_venta(venta_id: int, db: AsyncSession = Depends(get_async_db)):
     """Elimina una venta y restaura el stock"""
-    venta = db.query(VentaVendedor).filter(VentaVendedor.id == venta_id).first()
+    venta = await db.get(VentaVendedor, venta_id)
     if not venta:
         raise HTTPException(status_code=404, detail="Venta no encontrada")
     
-    stock = db.query(StockVendedor).filter(
-        StockVendedor.vendedor_id == venta.vendedor_id,
-        StockVendedor.producto_id == venta.producto_id
-    ).first()
+    # Si el stock ya no existe no hay nada que restaurar
+    await StockRepository(db).move(
+        venta.vendedor_id, venta.producto_id, venta.cantidad,
+        motivo="devolucion", referencia_id=venta.id
+    )
     
-    if stock:
-        stock.cantidad_actual += venta.cantidad
+    await SalesRollupRepository(db).add_sale(
+        venta.vendedor_id, venta.producto_id, venta.fecha_venta,
+        venta.cantidad, venta.precio_venta, sign=-1
+    )
     
-    db.delete(venta)
-    db.commit()
+    await db.delete(venta)
+    await db.commit()
+    
+    return {"success": True, "message": "Venta eliminada y stock restaurado"}
+
+# ===============================================
+# AJUSTES ENDPOINTS
+# ===============================================
+
+@router.get("/ajustes", response_model=List[AjusteResponse])
+async def get_ajustes(
+    response: Response,
+    vendedor_id: Optional[int] = None,
+    producto_id: Optional[int] = None,
+    skip: int = 0,
+    cursor: Optional[str] = None,
+    limit: int = Query(default=100, le=1000),
+    expand: str = Query(default="vendedor,producto", description="Relaciones a anidar; vacío = solo IDs"),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Obtiene los ajustes de inventario, los más recientes primero"""
+    query = select(AjusteInventarioVendedor).options(*_expand_options(AjusteInventarioVendedor, expand))
+    
+    if vendedor_id:
+        query = query.where(AjusteInventarioVendedor.vendedor_id == vendedor_id)
+    
+    if producto_id:
+        query = query.where(AjusteInventarioVendedor.producto_id == producto_id)
+    
+    paginator = KeysetPaginator(
+        [AjusteInventarioVendedor.fecha_ajuste, AjusteInventarioVendedor.id],
+        cursor=cursor, limit=limit, skip=skip
+    )
+    return paginator.page((await db.scalars(paginator.apply(query))).all(), response)
+
+@router.post("/ajustes", response_model=AjusteResponse)
+async def create_ajuste(ajuste: AjusteCreate, db: AsyncSession = Depends(get_async_db)):
+    """Aumenta o disminuye el stock de un vendedor (conteo físico, merma, etc.)"""
+    delta = ajuste.cantidad if ajuste.tipo_ajuste == "aumento" else -ajuste.cantidad
+    
+    stock_repo = StockRepository(db)
+    cantidad_nueva = await stock_repo.move(ajuste.vendedor_id, ajuste.producto_id, delta)
+    if cantidad_nueva is None:
+        await _rechazar_movimiento(db, ajuste.vendedor_id, ajuste.producto_id, ajuste.cantidad)
+    
+    db_ajuste = AjusteInventarioVendedor(
+        **ajuste.model_dump(),
+        cantidad_anterior=cantidad_nueva - delta,
+        cantidad_nueva=cantidad_nueva
+    )
+    db.add(db_ajuste)
+    await db.flush()
+    
+    await stock_repo.record([{
+        "vendedor_id": ajuste.vendedor_id,
+        "producto_id": ajuste.producto_id,
+        "cantidad": delta,
+        "motivo": "ajuste",
+        "referencia_id": db_ajuste.id
+    }])
+    await db.commit()
+    
+    return await db.scalar(
+        select(AjusteInventarioVendedor).options(
+            *_expand_options(AjusteInventarioVendedor, "vendedor,producto")
+        ).where(AjusteInventarioVendedor.id == db_ajuste.id)
+    )
+
+# ===============================================
+# MOVIMIENTOS DE STOCK
+# ===============================================
+
+@router.get("/stock/movimientos", response_model=List[MovimientoStockResponse])
+async def get_movimientos_stock(
+    response: Response,
+    vendedor_id: Optional[int] = None,
+    producto_id: Optional[int] = None,
+    motivo: Optional[str] = Query(default=None, description=f"Uno de: {', '.join(MOTIVOS_MOVIMIENTO)}"),
+    fecha_desde: Optional[datetime] = None,
+    fecha_hasta: Optional[datetime] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(default=100, le=1000),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Libro de movimientos de stock, los más recientes primero"""
+    query = select(MovimientoStock)
+    
+    if vendedor_id:
+        query = query.where(MovimientoStock.vendedor_id == vendedor_id)
+    
+    if producto_id:
+        query = query.where(MovimientoStock.producto_id == producto_id)
+    
+    if motivo:
+        query = query.where(MovimientoStock.motivo == motivo)
     
-    return {"success": True, "message": "Venta eliminada y stock restaurado"}
\ No newline at end of file
+    if fecha_desde:
+        query = query.where(MovimientoStock.fecha >= fecha_desde)
+    
+    if fecha_hasta:
+        query = query.where(MovimientoStock.fecha <= fecha_hasta)
+    
+    paginator = KeysetPaginator([MovimientoStock.fecha, MovimientoStock.id], cursor=cursor, limit=limit)
+    return paginator.page((await db.scalars(paginator.apply(query))).all(), response)
+
+@router.get("/stock/historico", response_model=List[StockHistoricoResponse])
+async def get_stock_historico(
+    fecha: datetime,
+    vendedor_id: Optional[int] = None,
+    producto_id: Optional[int] = None,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Stock de cada vendedor/producto a una fecha: se parte del snapshot
+    anterior más cercano y se suman solo los movimientos posteriores.
+    """
+    return await StockLedgerRepository(db).stock_at(fecha, vendedor_id, producto_id)
+
+@router.post("/stock/snapshots")
+async def create_stock_snapshots(db: AsyncSession = Depends(get_async_db)):
+    """Toma los snapshots pendientes ahora (normalmente los toma la tarea periódica)"""
+    total = await StockLedgerRepository(db).take_snapshots()
+    return {"success": True, "snapshots": total}
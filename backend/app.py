@@ -2,21 +2,34 @@
 from fastapi import FastAPI, Request, HTTPException, Depends, Query, Form 
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import HTTPBearer
+import asyncio
 import os
 import sys
 import importlib.util
 from pathlib import Path
 from dotenv import load_dotenv
 from datetime import datetime
-from passlib.context import CryptContext
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
 
 # Importar módulos locales
-from database import engine, Base, get_db
+from database import engine, Base, get_db, get_async_db, AsyncSessionLocal
 from models import *
+from migrations import run_migrations
 from auth import create_access_token
 from admin_routes import router as admin_router
 from distributor_routes import router as distributor_router
 from chatbot import ChatbotService
+from services.http_client import start_http_client, close_http_client
+from services.message_queue import MessageQueue
+from services.outbox import OutboxDispatcher
+from services.campaigns import CampaignRunner
+from services.dedup import SqlDeduplicator, run_purge_loop
+from services.whatsapp import WhatsAppService
+from services.pagination import NEXT_CURSOR_HEADER
+from services.stats_cache import stats_cache
+from services.stock_snapshots import run_snapshot_loop
 
 # 🆕 Importar rutas de inventario
 try:
@@ -69,22 +82,70 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # El frontend lee el cursor de la página siguiente
+    expose_headers=[NEXT_CURSOR_HEADER],
 )
 
-# Crear base de datos
+# Crear base de datos y aplicar migraciones pendientes
 Base.metadata.create_all(bind=engine)
+run_migrations(engine)
 
 # Seguridad
 security = HTTPBearer()
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 # Variable global del chatbot
 chatbot_service = None
 
+# Cola de procesamiento de webhooks (se crea en startup)
+message_queue = None
+
+# Tarea periódica de snapshots de stock (se crea en startup)
+snapshot_task = None
+
+# Purga periódica de IDs procesados con DEDUP_BACKEND=sql (se crea en startup)
+dedup_purge_task = None
+
+# Despachador del outbox de WhatsApp (se crea en startup)
+outbox_dispatcher = None
+
+# Runner de campañas de difusión (se crea en startup)
+campaign_runner = None
+
+async def process_webhook_batch(messages: list):
+    """Procesa un lote encolado con su propia sesión asíncrona de base de datos"""
+    async with AsyncSessionLocal() as db:
+        await chatbot_service.process_messages(messages, db)
+    # Las respuestas ya están en el outbox: se envían sin esperar al sondeo
+    if outbox_dispatcher:
+        outbox_dispatcher.notify()
+
+def describe_webhook_batch(messages: list) -> str:
+    """Teléfono e IDs de un lote, para el log de la cola"""
+    return f"batch from {messages[0]['from']} with message ids {[m['id'] for m in messages]}"
+
+def enqueue_webhook(data: dict) -> bool:
+    """
+    Valida y encola todos los mensajes del webhook.
+
+    Se encola un lote por teléfono (clave de la cola) para mantener el orden
+    de cada número. Notificaciones de estado u otros eventos sin mensaje no
+    generan trabajo.
+    """
+    batches = {}
+    for message_info in chatbot_service._parse_webhook(data):
+        batches.setdefault(message_info["from"], []).append(message_info)
+    
+    return all(
+        message_queue.enqueue(phone, messages)
+        for phone, messages in batches.items()
+    )
+
 # ==================== EVENTOS ====================
 @app.on_event("startup")
 async def startup_event():
-    global chatbot_service
+    global chatbot_service, message_queue, snapshot_task, dedup_purge_task, outbox_dispatcher, campaign_runner
+    await start_http_client()
+    
     try:
         chatbot_service = ChatbotService()
         print("✅ ChatbotService inicializado correctamente")
@@ -92,6 +153,49 @@ async def startup_event():
         chatbot_service = None
         print(f"⚠️ Error inicializando ChatbotService: {e}")
     
+    if chatbot_service and isinstance(chatbot_service.processed_messages, SqlDeduplicator):
+        dedup_purge_task = asyncio.create_task(run_purge_loop(
+            chatbot_service.processed_messages,
+            AsyncSessionLocal,
+            float(os.getenv("DEDUP_PURGE_INTERVAL", "3600"))
+        ))
+    
+    message_queue = MessageQueue(
+        process_webhook_batch,
+        workers=int(os.getenv("WEBHOOK_WORKERS", "4")),
+        maxsize=int(os.getenv("WEBHOOK_QUEUE_SIZE", "1000")),
+        max_attempts=int(os.getenv("WEBHOOK_MAX_ATTEMPTS", "5")),
+        retry_delay=float(os.getenv("WEBHOOK_RETRY_DELAY", "1")),
+        describe=describe_webhook_batch
+    )
+    message_queue.start()
+    
+    whatsapp_service = WhatsAppService()
+    if whatsapp_service.token and whatsapp_service.phone_id:
+        outbox_dispatcher = OutboxDispatcher(
+            AsyncSessionLocal,
+            whatsapp_service.post_message,
+            batch_size=int(os.getenv("OUTBOX_BATCH_SIZE", "20")),
+            poll_interval=float(os.getenv("OUTBOX_POLL_INTERVAL", "2")),
+            max_attempts=int(os.getenv("OUTBOX_MAX_ATTEMPTS", "8"))
+        )
+        outbox_dispatcher.start()
+        
+        # Retoma también las campañas que quedaron en curso al apagar
+        campaign_runner = CampaignRunner(
+            AsyncSessionLocal,
+            whatsapp_service.post_message,
+            concurrency=int(os.getenv("CAMPAIGN_CONCURRENCY", "10")),
+            flush_size=int(os.getenv("CAMPAIGN_FLUSH_SIZE", "200"))
+        )
+        campaign_runner.start()
+    else:
+        print("⚠️ WhatsApp no configurado: las respuestas quedan pendientes en outbound_messages")
+    
+    snapshot_interval = float(os.getenv("STOCK_SNAPSHOT_INTERVAL", "3600"))
+    if INVENTORY_ENABLED and snapshot_interval > 0:
+        snapshot_task = asyncio.create_task(run_snapshot_loop(AsyncSessionLocal, snapshot_interval))
+    
     if NGROK_AVAILABLE and os.getenv("USE_NGROK", "false").lower() == "true":
         try:
             ngrok_auth_token = os.getenv("NGROK_AUTH_TOKEN")
@@ -115,7 +219,19 @@ async def startup_event():
 
 @app.on_event("shutdown")
 async def shutdown_event():
-    """Cerrar túnel ngrok al apagar el servidor"""
+    """Drenar la cola de mensajes, detener campañas, outbox, snapshots y purga de IDs, cerrar cliente HTTP y túnel ngrok al apagar el servidor"""
+    if message_queue:
+        await message_queue.stop(timeout=float(os.getenv("WEBHOOK_SHUTDOWN_TIMEOUT", "30")))
+    if campaign_runner:
+        await campaign_runner.stop()
+    if outbox_dispatcher:
+        await outbox_dispatcher.stop()
+    if snapshot_task:
+        snapshot_task.cancel()
+    if dedup_purge_task:
+        dedup_purge_task.cancel()
+    await close_http_client()
+    
     if NGROK_AVAILABLE:
         try:
             ngrok.kill()
@@ -157,22 +273,23 @@ async def verify_webhook_direct(
     raise HTTPException(status_code=403, detail="Invalid verification token")
 
 @app.post("/webhook")
-async def handle_webhook_direct(request: Request, db=Depends(get_db)):
+async def handle_webhook_direct(request: Request):
     """Manejo de mensajes de WhatsApp (ruta directa para Meta)"""
-    if not chatbot_service:
+    if not chatbot_service or not message_queue:
         raise HTTPException(status_code=503, detail="Chatbot no disponible")
 
     try:
         data = await request.json()
         print(f"📨 Mensaje recibido: {data}")
-        
-        response = await chatbot_service.process_message(data, db)
-        print(f"✅ Mensaje procesado correctamente")
-        
-        return {"status": "ok", "response": response}
     except Exception as e:
         print(f"❌ Error procesando webhook: {e}")
         return {"status": "error", "detail": str(e)}
+    
+    # Se responde de inmediato; el procesamiento ocurre en la cola
+    if not enqueue_webhook(data):
+        raise HTTPException(status_code=503, detail="Cola de mensajes llena")
+    
+    return {"status": "ok"}
 
 # ==================== RUTAS CON /api (para compatibilidad) ====================
 
@@ -187,18 +304,16 @@ async def verify_webhook(request: Request):
     raise HTTPException(status_code=403, detail="Invalid token")
 
 @app.post("/api/webhook")
-async def handle_webhook(request: Request, db=Depends(get_db)):
-    if not chatbot_service:
+async def handle_webhook(request: Request):
+    if not chatbot_service or not message_queue:
         raise HTTPException(status_code=503, detail="Chatbot no disponible")
 
     data = await request.json()
 
-    try:
-        response = await chatbot_service.process_message(data, db)
-        return {"status": "ok", "response": response}
-    except Exception as e:
-        print(f"❌ Error procesando webhook: {e}")
-        return {"status": "error", "detail": str(e)}
+    if not enqueue_webhook(data):
+        raise HTTPException(status_code=503, detail="Cola de mensajes llena")
+    
+    return {"status": "ok"}
 
 @app.post("/api/auth/login")
 async def login(
@@ -274,74 +389,81 @@ if INVENTORY_ENABLED and inventory_router:
 app.include_router(admin_router, prefix="/api/admin", tags=["Admin"])
 app.include_router(distributor_router, prefix="/api/distributors", tags=["Distributors"])
 
+# Niveles de distribuidor que se reportan en el resumen (sincronizado con el frontend)
+DISTRIBUTOR_LEVELS = [
+    "Pre-Junior",
+    "Junior",
+    "Senior",
+    "Master",
+    "Plata",
+    "Oro",
+    "Platino",
+    "Diamante"
+]
+
+async def _query_general_stats(db: AsyncSession) -> dict:
+    """Todos los contadores del dashboard en una sola sentencia (una subconsulta escalar por contador)"""
+    row = (await db.execute(select(
+        select(func.count(Conversation.id)).scalar_subquery().label("total_conversations"),
+        select(func.count(Distributor.id)).scalar_subquery().label("total_distributors"),
+        select(func.count(Lead.id)).scalar_subquery().label("total_leads"),
+        select(func.count(Distributor.id)).where(
+            Distributor.estado == "activo"
+        ).scalar_subquery().label("active_distributors"),
+        select(func.count(Lead.id)).where(
+            Lead.interest_level >= 7
+        ).scalar_subquery().label("high_interest_leads")
+    ))).one()
+
+    return {key: value or 0 for key, value in row._mapping.items()}
+
 @app.get("/api/stats")
-async def get_stats(db=Depends(get_db)):
-    """Obtiene estadísticas generales - VERSIÓN CORREGIDA"""
-    from sqlalchemy import func, text
-    
-    try:
-        # Usar query específico que solo cuenta IDs en lugar de seleccionar todas las columnas
-        total_distributors = db.execute(text("SELECT COUNT(id) FROM distributors")).scalar()
-    except Exception as e:
-        print(f"⚠️ Error contando distribuidores: {e}")
-        total_distributors = 0
+async def get_stats(db: AsyncSession = Depends(get_async_db)):
+    """Obtiene estadísticas generales (cacheadas unos segundos, se invalidan al escribir)"""
+    return await stats_cache.get_or_compute(
+        "general",
+        ["conversations", "distributors", "leads"],
+        lambda: _query_general_stats(db)
+    )
+
+async def _query_distributors_stats(db: AsyncSession) -> dict:
+    """Conteos por estado y nivel con un único GROUP BY estado, nivel"""
+    rows = (await db.execute(
+        select(Distributor.estado, Distributor.nivel, func.count(Distributor.id))
+        .group_by(Distributor.estado, Distributor.nivel)
+    )).all()
+
+    total = 0
+    por_estado = {"activo": 0, "inactivo": 0, "suspendido": 0}
+    por_nivel = {}
+    for estado, nivel, count in rows:
+        total += count
+        if estado in por_estado:
+            por_estado[estado] += count
+        # Todos los estados cuentan para el nivel, no solo los activos
+        if nivel in DISTRIBUTOR_LEVELS:
+            por_nivel[nivel] = por_nivel.get(nivel, 0) + count
 
     return {
-        "total_conversations": db.query(Conversation).count(),
-        "total_distributors": total_distributors,
-        "total_leads": db.query(Lead).count(),
-        "active_distributors": db.execute(text("SELECT COUNT(id) FROM distributors WHERE estado = 'activo'")).scalar() or 0,
-        "high_interest_leads": db.query(Lead).filter(Lead.interest_level >= 7).count()
+        "total": total,
+        "por_estado": {
+            "activos": por_estado["activo"],
+            "inactivos": por_estado["inactivo"],
+            "suspendidos": por_estado["suspendido"]
+        },
+        # Solo los niveles que tienen distribuidores, en el orden del frontend
+        "por_nivel": {nivel: por_nivel[nivel] for nivel in DISTRIBUTOR_LEVELS if por_nivel.get(nivel)}
     }
 
-# backend/app.py - SOLO LA PARTE A REEMPLAZAR
-
 @app.get("/api/distributors/stats/summary")
-async def get_distributors_stats(db=Depends(get_db)):
+async def get_distributors_stats(db: AsyncSession = Depends(get_async_db)):
     """Obtiene estadísticas de los distribuidores - VERSIÓN CORREGIDA CON TODOS LOS NIVELES"""
-    from sqlalchemy import text
-    
     try:
-        total = db.execute(text("SELECT COUNT(id) FROM distributors")).scalar() or 0
-        activos = db.execute(text("SELECT COUNT(id) FROM distributors WHERE estado = 'activo'")).scalar() or 0
-        inactivos = db.execute(text("SELECT COUNT(id) FROM distributors WHERE estado = 'inactivo'")).scalar() or 0
-        suspendidos = db.execute(text("SELECT COUNT(id) FROM distributors WHERE estado = 'suspendido'")).scalar() or 0
-        
-        # ⭐ TODOS LOS NIVELES - SINCRONIZADO CON FRONTEND
-        niveles_lista = [
-            "Pre-Junior", 
-            "Junior", 
-            "Senior", 
-            "Master", 
-            "Plata", 
-            "Oro", 
-            "Platino", 
-            "Diamante"
-        ]
-        
-        # Contar por nivel (todos los estados, no solo activos)
-        niveles = {}
-        for nivel in niveles_lista:
-            count = db.execute(
-                text("SELECT COUNT(id) FROM distributors WHERE nivel = :nivel"),
-                {"nivel": nivel}
-            ).scalar() or 0
-            
-            # Solo agregar al resultado si hay distribuidores de ese nivel
-            if count > 0:
-                niveles[nivel] = count
-        
-        print(f"📊 Estadísticas por nivel: {niveles}")  # Para debug
-        
-        return {
-            "total": total,
-            "por_estado": {
-                "activos": activos,
-                "inactivos": inactivos,
-                "suspendidos": suspendidos
-            },
-            "por_nivel": niveles
-        }
+        return await stats_cache.get_or_compute(
+            "distributors_summary",
+            ["distributors"],
+            lambda: _query_distributors_stats(db)
+        )
     except Exception as e:
         print(f"⚠️ Error obteniendo estadísticas: {e}")
         raise HTTPException(status_code=500, detail=f"Error obteniendo estadísticas: {str(e)}")
@@ -1,4 +1,6 @@
 # backend/auth.py
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from typing import Optional
 from fastapi import Depends, HTTPException, status
@@ -27,6 +29,39 @@ def get_password_hash(password):
     """Genera el hash de una contraseña"""
     return pwd_context.hash(password)
 
+# bcrypt tarda ~250 ms por llamada a propósito. Dentro de un handler async
+# congela el event loop (y con él los webhooks), así que las rutas usan las
+# versiones async, que corren en este pool acotado (bcrypt libera el GIL).
+password_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("PASSWORD_HASH_WORKERS", "2")),
+    thread_name_prefix="bcrypt"
+)
+
+async def verify_password_async(plain_password, hashed_password) -> bool:
+    """verify_password fuera del event loop"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(password_executor, verify_password, plain_password, hashed_password)
+
+async def get_password_hash_async(password) -> str:
+    """get_password_hash fuera del event loop"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(password_executor, get_password_hash, password)
+
+# Pool aparte para importaciones masivas: usa todos los núcleos sin ocupar
+# el pool de las rutas interactivas
+bulk_password_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("BULK_HASH_WORKERS", str(os.cpu_count() or 2))),
+    thread_name_prefix="bcrypt-bulk"
+)
+
+async def hash_passwords_bulk(passwords) -> list:
+    """Hashea una lista de contraseñas en paralelo (mismo orden de entrada)"""
+    loop = asyncio.get_running_loop()
+    return await asyncio.gather(*(
+        loop.run_in_executor(bulk_password_executor, get_password_hash, password)
+        for password in passwords
+    ))
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     """Crea un token JWT"""
     to_encode = data.copy()
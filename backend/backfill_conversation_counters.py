@@ -0,0 +1,66 @@
+# backend/backfill_conversation_counters.py
+"""
+Recalcula los contadores desnormalizados de las conversaciones
+(message_count, last_message_at, last_user_message_at, last_role)
+a partir de la tabla messages.
+
+Uso:
+    python backfill_conversation_counters.py [--batch-size 1000]
+"""
+
+import argparse
+
+from sqlalchemy import func, select, update
+
+from database import engine, Base
+from models import Conversation, Message
+from migrations import run_migrations
+
+
+def backfill(batch_size: int = 1000) -> int:
+    """Actualiza las conversaciones por bloques de ids; devuelve cuántas se procesaron"""
+    conversation_id = Message.conversation_id == Conversation.id
+    values = {
+        "message_count": select(func.count(Message.id)).where(conversation_id).scalar_subquery(),
+        "last_message_at": select(func.max(Message.timestamp)).where(conversation_id).scalar_subquery(),
+        "last_user_message_at": select(func.max(Message.timestamp)).where(
+            conversation_id, Message.role == "user"
+        ).scalar_subquery(),
+        "last_role": select(Message.role).where(conversation_id).order_by(
+            Message.id.desc()
+        ).limit(1).scalar_subquery(),
+    }
+
+    processed = 0
+    last_id = 0
+    while True:
+        with engine.begin() as connection:
+            ids = connection.execute(
+                select(Conversation.id).where(Conversation.id > last_id)
+                .order_by(Conversation.id).limit(batch_size)
+            ).scalars().all()
+            if not ids:
+                break
+            connection.execute(
+                update(Conversation).where(
+                    Conversation.id.between(ids[0], ids[-1])
+                ).values(**values)
+            )
+        processed += len(ids)
+        last_id = ids[-1]
+        print(f"   {processed} conversaciones actualizadas...")
+
+    return processed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recalcula los contadores de conversaciones")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    Base.metadata.create_all(bind=engine)
+    run_migrations(engine)
+
+    print("🔄 Recalculando contadores de conversaciones...")
+    total = backfill(args.batch_size)
+    print(f"✅ Listo: {total} conversaciones")
@@ -0,0 +1,201 @@
+# backend/bench/bench_async_db.py
+"""
+Prueba de carga de las rutas asíncronas (get_async_db) con tráfico de webhooks.
+
+Levanta la app en el mismo proceso (httpx + ASGITransport, sin red) sobre
+una base SQLite temporal con conversaciones de ejemplo. Lanza rondas de
+50 GET /api/admin/conversations simultáneos mientras llegan webhooks que
+procesa la cola (chatbot + outbox) y mide p50/p99 de cada ruta, el atraso
+del event loop y que todos los mensajes queden guardados.
+
+Como referencia, repite la carga admin con la misma consulta hecha con
+SessionLocal dentro de un handler async def (como estaban las rutas antes).
+
+SQLite local no tiene la latencia de red de PostgreSQL: cada sentencia
+espera DB_LATENCY_MS (5 por defecto) en el hilo que la ejecuta. Con el
+driver síncrono ese hilo es el del event loop; con aiosqlite es el suyo,
+igual que psycopg async espera la red sin bloquear el loop.
+
+Uso (desde backend/): python -m bench.bench_async_db [rondas] [webhooks]
+"""
+
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+_db_dir = tempfile.mkdtemp(prefix="hgw-bench-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_db_dir, 'bench.db')}"
+os.environ.setdefault("DEDUP_BACKEND", "sql")
+os.environ["USE_NGROK"] = "false"
+os.environ["USE_OPENAI"] = "false"
+os.environ["WHATSAPP_TOKEN"] = ""
+os.environ["WHATSAPP_PHONE_ID"] = ""
+
+import httpx
+from sqlalchemy import event, func, insert, select
+
+import app as app_module
+from auth import create_access_token
+from database import SessionLocal, async_engine, engine
+from models import Conversation, Message
+
+CONCURRENT_ADMIN = 50
+CONVERSATIONS = 2000
+TICK = 0.01
+DB_LATENCY = float(os.getenv("DB_LATENCY_MS", "5")) / 1000
+
+
+def _wait_network(statement):
+    time.sleep(DB_LATENCY)
+
+
+@event.listens_for(engine, "connect")
+def _sync_latency(dbapi_connection, connection_record):
+    dbapi_connection.set_trace_callback(_wait_network)
+
+
+@event.listens_for(async_engine.sync_engine, "connect")
+def _async_latency(dbapi_connection, connection_record):
+    # Se instala desde el hilo de aiosqlite, donde corren las sentencias
+    dbapi_connection.run_async(
+        lambda connection: connection._execute(connection._conn.set_trace_callback, _wait_network)
+    )
+
+
+# Las conexiones que abrió el arranque de la app (create_all, migraciones) no tienen la latencia
+engine.dispose()
+
+
+def _seed():
+    db = SessionLocal()
+    try:
+        db.execute(insert(Conversation), [
+            {"phone_number": f"5731{n:08d}", "status": "nuevo", "profile_type": "otro", "message_count": 2}
+            for n in range(CONVERSATIONS)
+        ])
+        ids = db.scalars(select(Conversation.id)).all()
+        db.execute(insert(Message), [
+            {"conversation_id": conversation_id, "role": role, "content": f"mensaje {role} de ejemplo"}
+            for conversation_id in ids for role in ("user", "assistant")
+        ])
+        db.commit()
+    finally:
+        db.close()
+
+
+@app_module.app.get("/bench/conversations-sync")
+async def conversations_sync(limit: int = 100):
+    """La misma consulta con la sesión síncrona: bloquea el loop mientras corre"""
+    db = SessionLocal()
+    try:
+        preview = select(func.substr(Message.content, 1, 80)).where(
+            Message.conversation_id == Conversation.id
+        ).order_by(Message.id.desc()).limit(1).scalar_subquery()
+        rows = db.execute(
+            select(Conversation, preview).order_by(Conversation.last_interaction.desc()).limit(limit)
+        ).all()
+        return [{"id": c.id, "preview": p} for c, p in rows]
+    finally:
+        db.close()
+
+
+def _webhook(n: int) -> dict:
+    phone = f"5732{n % 200:08d}"
+    return {"entry": [{"changes": [{"value": {"messages": [{
+        "id": f"wamid.bench.{n}",
+        "from": phone,
+        "type": "text",
+        "text": {"body": "precio" if n % 2 else "hola"}
+    }]}}]}]}
+
+
+async def _heartbeat(lags: list, stop: asyncio.Event):
+    while not stop.is_set():
+        expected = time.perf_counter() + TICK
+        await asyncio.sleep(TICK)
+        lags.append(max(0.0, time.perf_counter() - expected))
+
+
+def _percentile(values: list, p: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))] * 1000
+
+
+async def _timed(latencies: list, request, started: float = None):
+    """Latencia desde started (el inicio de la ronda): incluye la espera en cola"""
+    started = started or time.perf_counter()
+    response = await request
+    latencies.append(time.perf_counter() - started)
+    assert response.status_code == 200, response.text
+
+
+async def _load(client: httpx.AsyncClient, admin_path: str, rounds: int, webhooks: int, offset: int):
+    headers = {"Authorization": f"Bearer {create_access_token({'sub': 'bench', 'role': 'admin'})}"}
+    admin, hooks, lags, stop = [], [], [], asyncio.Event()
+    heartbeat = asyncio.create_task(_heartbeat(lags, stop))
+
+    async def webhook_traffic():
+        for n in range(webhooks):
+            await _timed(hooks, client.post("/webhook", json=_webhook(offset + n)))
+            await asyncio.sleep(0.002)
+
+    async def admin_traffic():
+        for _ in range(rounds):
+            started = time.perf_counter()
+            await asyncio.gather(*(
+                _timed(admin, client.get(admin_path, params={"limit": 100}, headers=headers), started)
+                for _ in range(CONCURRENT_ADMIN)
+            ))
+
+    started = time.perf_counter()
+    await asyncio.gather(webhook_traffic(), admin_traffic())
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await heartbeat
+    return elapsed, admin, hooks, lags
+
+
+async def _main(rounds: int, webhooks: int):
+    await app_module.startup_event()
+    transport = httpx.ASGITransport(app=app_module.app)
+    try:
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+            for n, (name, path) in enumerate((
+                ("async (get_async_db)", "/api/admin/conversations"),
+                ("sync (SessionLocal)", "/bench/conversations-sync"),
+            )):
+                elapsed, admin, hooks, lags = await _load(client, path, rounds, webhooks, n * webhooks)
+                print(
+                    f"  {name:21s} {elapsed:6.2f} s  "
+                    f"admin p50 {_percentile(admin, 0.5):7.1f} ms p99 {_percentile(admin, 0.99):7.1f} ms  "
+                    f"webhook p50 {_percentile(hooks, 0.5):6.1f} ms p99 {_percentile(hooks, 0.99):7.1f} ms  "
+                    f"atraso del loop máx {max(lags) * 1000:7.1f} ms"
+                )
+    finally:
+        await app_module.shutdown_event()
+
+    db = SessionLocal()
+    try:
+        stored = db.scalar(select(func.count(Message.id)).where(Message.content.in_(("hola", "precio"))))
+    finally:
+        db.close()
+    print(f"  mensajes de webhook guardados: {stored} de {2 * webhooks}")
+
+
+def main():
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    webhooks = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    _seed()
+    print(
+        f"{rounds} rondas de {CONCURRENT_ADMIN} GET de conversaciones, {webhooks} webhooks, "
+        f"{CONVERSATIONS} conversaciones, {DB_LATENCY * 1000:.0f} ms por sentencia, "
+        f"DEDUP_BACKEND={os.environ['DEDUP_BACKEND']}, {os.cpu_count()} CPU"
+    )
+    asyncio.run(_main(rounds, webhooks))
+
+
+if __name__ == "__main__":
+    main()
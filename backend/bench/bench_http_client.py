@@ -0,0 +1,93 @@
+# backend/bench/bench_http_client.py
+"""
+Benchmark del cliente HTTP compartido (services/http_client.py).
+
+Compara, contra un servidor HTTP local con latencia simulada, un cliente
+nuevo por envío (como se hacía antes) con el cliente compartido con
+keep-alive. Mide envíos por segundo y conexiones TCP abiertas.
+
+Uso (desde backend/): python -m bench.bench_http_client [envíos] [concurrencia]
+"""
+
+import asyncio
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DATABASE_URL", "sqlite:///:memory:")
+
+import httpx
+
+from services.http_client import close_http_client, get_http_client
+
+LATENCY = 0.01  # segundos de "Graph API" por envío
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive
+    connections = 0
+
+    def setup(self):
+        super().setup()
+        type(self).connections += 1
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        time.sleep(LATENCY)
+        body = b'{"messages":[{"id":"wamid.bench"}]}'
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+async def _run(url: str, total: int, concurrency: int, shared: bool) -> float:
+    semaphore = asyncio.Semaphore(concurrency)
+    payload = {"messaging_product": "whatsapp", "to": "573000000000", "type": "text", "text": {"body": "hola"}}
+
+    async def send():
+        async with semaphore:
+            if shared:
+                response = await get_http_client().post(url, json=payload)
+            else:
+                async with httpx.AsyncClient(timeout=10) as client:
+                    response = await client.post(url, json=payload)
+            response.raise_for_status()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(send() for _ in range(total)))
+    return time.perf_counter() - started
+
+
+def main():
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    concurrency = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/v18.0/123/messages"
+
+    print(f"{total} envíos, concurrencia {concurrency}, latencia del servidor {LATENCY * 1000:.0f} ms")
+    for name, shared in (("cliente por envío", False), ("cliente compartido", True)):
+        _Handler.connections = 0
+
+        async def run():
+            try:
+                return await _run(url, total, concurrency, shared)
+            finally:
+                await close_http_client()
+
+        elapsed = asyncio.run(run())
+        print(f"  {name:20s} {elapsed:6.2f} s  {total / elapsed:7.1f} envíos/s  {_Handler.connections:4d} conexiones")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+# backend/bench/bench_passwords.py
+"""
+Benchmark de bcrypt dentro del event loop (auth.py).
+
+Simula logins simultáneos mientras un latido de 10 ms mide cuánto se atrasa
+el event loop (lo mismo que esperaría un webhook). Compara verify_password
+llamado directo en el handler con verify_password_async (pool acotado).
+
+Uso (desde backend/): python -m bench.bench_passwords [logins]
+"""
+
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from auth import get_password_hash, password_executor, verify_password, verify_password_async
+
+TICK = 0.01
+
+
+async def _heartbeat(lags: list, stop: asyncio.Event):
+    """Registra el atraso de cada latido respecto de lo programado"""
+    while not stop.is_set():
+        expected = time.perf_counter() + TICK
+        await asyncio.sleep(TICK)
+        lags.append(max(0.0, time.perf_counter() - expected))
+
+
+async def _run(hashed: str, logins: int, use_pool: bool):
+    async def login():
+        if use_pool:
+            return await verify_password_async("secreto123", hashed)
+        return verify_password("secreto123", hashed)
+
+    lags, stop = [], asyncio.Event()
+    heartbeat = asyncio.create_task(_heartbeat(lags, stop))
+    await asyncio.sleep(TICK * 2)
+    started = time.perf_counter()
+    results = await asyncio.gather(*(login() for _ in range(logins)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await heartbeat
+    assert all(results)
+    return elapsed, max(lags), sorted(lags)[len(lags) // 2]
+
+
+def main():
+    logins = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    hashed = get_password_hash("secreto123")
+    print(f"{logins} logins simultáneos, {password_executor._max_workers} hilos de bcrypt, {os.cpu_count()} CPU")
+    for name, use_pool in (("verify_password", False), ("verify_password_async", True)):
+        elapsed, worst, median = asyncio.run(_run(hashed, logins, use_pool))
+        print(
+            f"  {name:22s} {elapsed:6.2f} s total  "
+            f"atraso del loop: máx {worst * 1000:7.1f} ms, mediana {median * 1000:6.1f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
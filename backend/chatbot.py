@@ -1,24 +1,110 @@
-import httpx
+import asyncio
 import os
-from openai import OpenAI
-from sqlalchemy.orm import Session
+from openai import AsyncOpenAI
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import datetime
-from models import Conversation, Message, Lead
+from models import Conversation, Message
+from services.intent_matcher import IntentMatcher
+from services.dedup import create_deduplicator
+from services.webhook_parser import iter_webhook_messages
+from repositories.chat_repository import ChatRepository
+from repositories.outbox_repository import OutboxRepository
+from services.whatsapp import WhatsAppService
 import re
 
+# ==================== REGLAS DE INTENCIÓN ====================
+# El orden de cada lista es la prioridad: gana la primera regla que aplica.
+
+AUTO_RESPONSE_RULES = [
+    {"intent": "saludo", "keywords": ["hola", "buenas", "buenos días", "buenas tardes", "hi", "hello"], "max_length": 25},
+    {"intent": "que_es_hgw", "keywords": ["qué es hgw", "que es hgw", "qué es", "que es", "empresa", "compañía", "explicame hgw", "sobre hgw", "cuéntame de hgw"]},
+    {"intent": "que_hacer", "keywords": ["qué tengo que hacer", "que tengo que hacer", "qué hago", "que hago", "actividades", "tareas", "trabajo diario", "responsabilidades"]},
+    {"intent": "inversion", "keywords": ["inversión", "inversion", "cuánto cuesta", "cuanto cuesta", "precio", "cuanto necesito", "cuánto necesito", "planes", "membresia", "membresía", "paquetes"]},
+    {"intent": "recuperacion", "keywords": ["recuperar", "recupero", "cuándo recupero", "cuando recupero", "devolver", "regresa", "tiempo de recuperación"]},
+    {"intent": "ganancias", "keywords": ["cuándo gano", "cuando gano", "cuándo empiezo a ganar", "cuando empiezo a ganar", "ganancias", "ganar dinero", "utilidad", "cuanto gano", "cuánto gano", "ingresos"]},
+    {"intent": "resumen", "keywords": ["resumen", "todo", "5 puntos", "5 preguntas", "explicame todo", "todo junto"]},
+    {"intent": "unirse", "keywords": ["unirme", "unir", "inscribirme", "registrarme", "ser parte", "entrar", "quiero empezar", "empezar"]},
+    {"intent": "catalogo", "keywords": ["producto", "qué venden", "qué tienen", "catalogo", "catálogo"], "exclude": ["blueberry", "cafe", "omega", "espirulina", "pasta", "jabon", "shampoo", "toalla", "collar", "termo"]},
+    {"intent": "arandano", "keywords": ["blueberry", "arandano", "arándano"], "exclude": ["fresh", "regaliz"]},
+    {"intent": "fresh_candy", "keywords": ["fresh candy", "regaliz", "caramelo regaliz"]},
+    {"intent": "cafe", "keywords": ["cafe", "café", "ganoderma", "cordyceps", "coffee"]},
+    {"intent": "suplementos", "keywords": ["omega", "espirulina", "suplemento"]},
+    {"intent": "pasta_dental", "keywords": ["pasta dental", "dientes", "toothpaste"]},
+    {"intent": "jabones", "keywords": ["jabon", "jabón", "turmalina", "oliva"]},
+    {"intent": "shampoo", "keywords": ["shampoo", "champú", "keratina", "cabello"]},
+    {"intent": "toallas", "keywords": ["toalla sanitaria", "toallas", "femenino", "menstruacion", "menstruación"]},
+    {"intent": "accesorios", "keywords": ["termo", "collar", "pulsera", "turmalina", "accesorio"]},
+    {"intent": "sin_tiempo", "keywords": ["tiempo", "ocupado", "no tengo tiempo", "trabajo mucho"]},
+    {"intent": "bienestar", "keywords": ["salud", "bienestar", "energía", "cansado", "energia", "vitaminas", "natural"]},
+    {"intent": "contacto_richard", "keywords": ["richard", "llamar", "contacto", "hablar", "agendar", "numero", "número", "telefono", "teléfono"]},
+    {"intent": "testimonios", "keywords": ["testimonio", "experiencia", "funciona", "resultados", "casos de exito"]},
+    {"intent": "dudas", "keywords": ["no sé", "no se", "duda", "pregunta", "no entiendo"]},
+    {"intent": "inscripcion", "keywords": ["inscribir", "registrar", "como me inscribo", "cómo me registro", "como inicio"]},
+    {"intent": "soporte", "keywords": ["no puedo", "no se como", "no sé cómo", "ayuda", "dificultad", "problema", "error"]},
+    {"intent": "app_descarga", "keywords": ["aplicacion", "aplicación", "app", "descargar app", "instalar app", "descargar aplicacion", "movil", "móvil", "celular"]},
+    {"intent": "app_problemas", "keywords": ["ayuda app", "problema app", "no instala", "no funciona app", "error app"]},
+    {"intent": "backoffice", "keywords": ["backoffice", "back office", "ingresar", "login", "iniciar sesion", "iniciar sesión"]},
+    {"intent": "membresia", "keywords": ["membresia", "membresía", "comprar membresia", "adquirir membresia", "activar"]},
+    {"intent": "pedido", "keywords": ["pedido", "comprar productos", "hacer pedido", "ordenar", "comprar"]},
+    {"intent": "comisiones", "keywords": ["comision", "comisión", "cobrar", "ganancias", "retiro", "retirar", "dinero", "pagar"]},
+    {"intent": "referidos", "keywords": ["referido", "enlace", "link", "invitar", "compartir", "reclutar"]},
+    {"intent": "red", "keywords": ["red", "equipo", "socios", "downline", "genealogia", "genealogía"]},
+    {"intent": "material", "keywords": ["material", "catalogo", "catálogo", "folleto", "informacion productos", "información productos"]},
+    {"intent": "datos", "keywords": ["cambiar datos", "actualizar datos", "modificar datos", "direccion", "dirección", "telefono", "teléfono"]},
+    {"intent": "tutoriales", "keywords": ["tutoriales", "videos", "todos los tutoriales", "lista de tutoriales"]},
+]
+
+PROFILE_RULES = [
+    {"intent": "sin_tiempo", "keywords": ["tiempo", "ocupado", "trabajo", "empleado"]},
+    {"intent": "joven_economico", "keywords": ["dinero", "joven", "estudiante", "poco presupuesto"]},
+    {"intent": "bienestar", "keywords": ["salud", "bienestar", "natural", "enfermedad"]},
+    {"intent": "emprendedor", "keywords": ["negocio", "emprender", "ganar", "ingresos", "libertad financiera"]},
+]
+
+INTEREST_RULES = [
+    {"intent": 9, "keywords": ["quiero empezar", "inscribirme", "registrarme", "cuánto cuesta"]},
+    {"intent": 7, "keywords": ["me interesa", "cuéntame más", "información"]},
+    {"intent": 4, "keywords": ["quizás", "tal vez", "no sé"]},
+    {"intent": 1, "keywords": ["no gracias", "no interesa"]},
+]
+
+MENU_OPTIONS = {
+    "1": "qué es hgw", "1️⃣": "qué es hgw",
+    "2": "qué tengo que hacer", "2️⃣": "qué tengo que hacer",
+    "3": "inversión", "3️⃣": "inversión",
+    "4": "recuperar inversión", "4️⃣": "recuperar inversión",
+    "5": "cuándo gano", "5️⃣": "cuándo gano",
+    "6": "productos", "6️⃣": "productos",
+    "7": "richard", "7️⃣": "richard",
+}
+
+# Los autómatas se compilan una sola vez al importar el módulo
+AUTO_RESPONSE_MATCHER = IntentMatcher(AUTO_RESPONSE_RULES)
+PROFILE_MATCHER = IntentMatcher(PROFILE_RULES)
+INTEREST_MATCHER = IntentMatcher(INTEREST_RULES)
+
 class ChatbotService:
     def __init__(self):
-        self.whatsapp_token = os.getenv("WHATSAPP_TOKEN")
-        self.phone_id = os.getenv("WHATSAPP_PHONE_ID")
         self.openai_api_key = os.getenv("OPENAI_API_KEY")
         self.use_openai = os.getenv("USE_OPENAI", "false").lower() == "true"
         
+        self.openai_timeout = float(os.getenv("OPENAI_TIMEOUT", "15"))
+        self.openai_max_concurrency = int(os.getenv("OPENAI_MAX_CONCURRENCY", "4"))
+        
         if self.openai_api_key and self.use_openai:
-            self.openai_client = OpenAI(api_key=self.openai_api_key)
+            self.openai_client = AsyncOpenAI(
+                api_key=self.openai_api_key,
+                timeout=self.openai_timeout,
+                max_retries=0
+            )
         else:
             self.openai_client = None
         
-        self.processed_messages = set()
+        # Limita las llamadas simultáneas a OpenAI para no saturar la cuenta
+        self.openai_semaphore = asyncio.Semaphore(self.openai_max_concurrency)
+        
+        self.processed_messages = create_deduplicator()
         self.business_prompt = """
         Eres un asistente experto de HGW (Health Green World) con Richard Córdoba.
         Tu objetivo es ayudar a las personas a entender claramente el negocio y motivarlas a empezar.
@@ -28,89 +114,154 @@ class ChatbotService:
         Siempre invita a contactar a Richard al +57 305 2490438 para más detalles.
         """
 
-    async def process_message(self, webhook_data: dict, db: Session):
-        """Procesa mensaje entrante de WhatsApp"""
-        message_info = self._parse_webhook(webhook_data)
-        if not message_info:
-            return None
-        
-        phone = message_info["from"]
-        text = message_info["text"]
-        msg_id = message_info["id"]
-        
-        if msg_id in self.processed_messages:
-            return None
-        self.processed_messages.add(msg_id)
-        
-        conversation = self._get_or_create_conversation(db, phone)
-        
-        user_message = Message(
-            conversation_id=conversation.id,
-            role="user",
-            content=text
-        )
-        db.add(user_message)
-        
-        if not conversation.user_name:
-            name = self._extract_name(text)
-            if name:
-                conversation.user_name = name
+    async def process_message(self, webhook_data: dict, db: AsyncSession):
+        """Procesa todos los mensajes entrantes de un webhook de WhatsApp"""
+        return await self.process_messages(self._parse_webhook(webhook_data), db)
+
+    async def process_messages(self, messages: list, db: AsyncSession):
+        """
+        Procesa un lote de mensajes ya parseados en tres fases.
+
+        1. Lectura corta: nombre e historial de las conversaciones existentes.
+        2. Respuestas (reglas u OpenAI, hasta OPENAI_TIMEOUT) sin ninguna
+           transacción abierta: no se retienen conexiones ni filas bloqueadas.
+        3. Una sola transacción de escritura: registro de los IDs como
+           procesados, upsert de conversaciones y leads (sin carreras entre
+           mensajes simultáneos de un número nuevo), los mensajes juntos y
+           las respuestas en el outbox; las envía el despachador
+           (services/outbox.py), que reintenta hasta entregarlas.
+
+        Si la escritura falla se revierte todo y los IDs se liberan.
+        """
+        # Los IDs ya confirmados se descartan antes de generar respuestas
+        messages = [
+            m for m in {m["id"]: m for m in messages}.values()
+            if not self.processed_messages.contains(m["id"])
+        ]
+        if not messages:
+            return []
         
-        conversation.profile_type = self._detect_profile(text)
-        self._update_lead(db, phone, conversation.user_name, text)
+        conversations = await self._read_conversations(messages, db)
+        replies = await self._prepare_replies(messages, conversations)
         
-        response = await self._generate_response(text, conversation, db)
+        claimed = []
+        try:
+            claimed = await self.processed_messages.claim(db, [m["id"] for m in messages])
+            replies = [reply for reply in replies if reply["id"] in claimed]
+            if replies:
+                await self._store_replies(replies, db)
+            await db.commit()
+        except BaseException:
+            # Nada quedó registrado: el reintento de la cola lo procesa de nuevo
+            await db.rollback()
+            self.processed_messages.release(claimed)
+            raise
+        self.processed_messages.confirm(claimed)
+        return [reply["response"] for reply in replies]
+
+    async def _read_conversations(self, messages: list, db: AsyncSession) -> dict:
+        """
+        Lee nombre e historial (solo si hay OpenAI) de las conversaciones del
+        lote y cierra la transacción de lectura.
+
+        Returns:
+            Dict teléfono -> {"user_name", "history"}; los números nuevos no están
+        """
+        phones = {m["from"] for m in messages}
+        rows = (await db.execute(
+            select(Conversation.id, Conversation.phone_number, Conversation.user_name)
+            .where(Conversation.phone_number.in_(phones))
+        )).all()
         
-        bot_message = Message(
-            conversation_id=conversation.id,
-            role="assistant",
-            content=response
-        )
-        db.add(bot_message)
+        conversations = {}
+        for conversation_id, phone, user_name in rows:
+            history = []
+            if self.openai_client and self.use_openai:
+                history = (await db.execute(
+                    select(Message.role, Message.content).where(
+                        Message.conversation_id == conversation_id
+                    ).order_by(Message.timestamp).limit(10)
+                )).all()
+            conversations[phone] = {"user_name": user_name, "history": history}
+        await db.commit()
+        return conversations
+
+    async def _prepare_replies(self, messages: list, conversations: dict) -> list:
+        """
+        Calcula nombre, perfil e interés de cada mensaje en orden y genera
+        las respuestas en paralelo (OpenAI limitado por su semáforo).
+        """
+        names = {phone: c["user_name"] for phone, c in conversations.items()}
+        replies = []
+        for message_info in messages:
+            phone = message_info["from"]
+            text = message_info["text"]
+            if not names.get(phone):
+                names[phone] = self._extract_name(text)
+            replies.append({
+                "id": message_info["id"],
+                "phone": phone,
+                "text": text,
+                "user_name": names[phone],
+                "received_at": datetime.utcnow()
+            })
         
-        conversation.last_interaction = datetime.utcnow()
-        db.commit()
+        responses = await asyncio.gather(*(
+            self._generate_response(
+                reply["text"],
+                reply["user_name"],
+                conversations.get(reply["phone"], {}).get("history", [])
+            )
+            for reply in replies
+        ))
+        for reply, response in zip(replies, responses):
+            reply["response"] = response
+            reply["answered_at"] = datetime.utcnow()
+        return replies
+
+    async def _store_replies(self, replies: list, db: AsyncSession):
+        """Escribe el lote en la transacción de db, sin confirmar"""
+        repository = ChatRepository(db)
+        conversations = await repository.upsert_conversations(r["phone"] for r in replies)
         
-        await self._send_whatsapp_message(phone, response)
-        return response
-
-    def _parse_webhook(self, data: dict):
-        """Parsea el webhook de WhatsApp"""
-        try:
-            entry = data.get("entry", [{}])[0]
-            changes = entry.get("changes", [{}])[0]
-            value = changes.get("value", {})
-            messages = value.get("messages", [])
-            
-            if not messages:
-                return None
+        leads = {}
+        message_rows = []
+        for reply in replies:
+            phone = reply["phone"]
+            conversation = conversations[phone]
+            if not conversation.user_name and reply["user_name"]:
+                conversation.user_name = reply["user_name"]
+            conversation.profile_type = self._detect_profile(reply["text"])
+            conversation.last_interaction = reply["answered_at"]
+            self._update_lead(leads, phone, conversation.user_name, reply["text"])
             
-            message = messages[0]
-            return {
-                "id": message.get("id"),
-                "from": message.get("from"),
-                "text": message.get("text", {}).get("body", ""),
-                "timestamp": message.get("timestamp")
+            message_rows.append({
+                "conversation_id": conversation.id,
+                "role": "user",
+                "content": reply["text"],
+                "timestamp": reply["received_at"]
+            })
+            message_rows.append({
+                "conversation_id": conversation.id,
+                "role": "assistant",
+                "content": reply["response"],
+                "timestamp": reply["answered_at"]
+            })
+        
+        await repository.upsert_leads(leads.values())
+        message_ids = await repository.add_messages(message_rows)
+        await OutboxRepository(db).add([
+            {
+                "phone_number": reply["phone"],
+                "payload": WhatsAppService.text_payload(reply["phone"], reply["response"]),
+                "message_id": message_id
             }
-        except:
-            return None
+            for reply, message_id in zip(replies, message_ids["assistant"])
+        ])
 
-    def _get_or_create_conversation(self, db: Session, phone: str):
-        """Obtiene o crea una conversación"""
-        conversation = db.query(Conversation).filter(
-            Conversation.phone_number == phone
-        ).first()
-        
-        if not conversation:
-            conversation = Conversation(
-                phone_number=phone,
-                status="nuevo",
-                profile_type="otro"
-            )
-            db.add(conversation)
-            db.flush()
-        
-        return conversation
+    def _parse_webhook(self, data: dict):
+        """Parsea el webhook de WhatsApp y devuelve todos sus mensajes"""
+        return list(iter_webhook_messages(data))
 
     def _extract_name(self, text: str):
         """Extrae el nombre del texto"""
@@ -129,87 +280,52 @@ class ChatbotService:
 
     def _detect_profile(self, text: str):
         """Detecta el perfil del usuario"""
-        text_lower = text.lower()
-        
-        if any(w in text_lower for w in ["tiempo", "ocupado", "trabajo", "empleado"]):
-            return "sin_tiempo"
-        elif any(w in text_lower for w in ["dinero", "joven", "estudiante", "poco presupuesto"]):
-            return "joven_economico"
-        elif any(w in text_lower for w in ["salud", "bienestar", "natural", "enfermedad"]):
-            return "bienestar"
-        elif any(w in text_lower for w in ["negocio", "emprender", "ganar", "ingresos", "libertad financiera"]):
-            return "emprendedor"
-        
-        return "otro"
+        return PROFILE_MATCHER.match(text.lower()) or "otro"
 
-    def _update_lead(self, db: Session, phone: str, name: str, text: str):
-        """Actualiza o crea un lead"""
-        lead = db.query(Lead).filter(Lead.phone_number == phone).first()
+    def _update_lead(self, leads: dict, phone: str, name: str, text: str):
+        """Acumula los datos del lead del lote (uno por teléfono) para el upsert"""
         interest = self._detect_interest(text)
+        lead = leads.get(phone)
         
         if not lead:
-            lead = Lead(
-                phone_number=phone,
-                user_name=name,
-                profile_type=self._detect_profile(text),
-                interest_level=interest,
-                status="nuevo"
-            )
-            db.add(lead)
+            leads[phone] = {
+                "phone_number": phone,
+                "user_name": name,
+                "profile_type": self._detect_profile(text),
+                "interest_level": interest
+            }
         else:
-            lead.interest_level = max(lead.interest_level, interest)
-            lead.updated_at = datetime.utcnow()
-            if name and not lead.user_name:
-                lead.user_name = name
+            lead["interest_level"] = max(lead["interest_level"], interest)
+            if name and not lead["user_name"]:
+                lead["user_name"] = name
 
     def _detect_interest(self, text: str):
         """Detecta nivel de interés (0-10)"""
-        text_lower = text.lower()
-        
-        if any(w in text_lower for w in ["quiero empezar", "inscribirme", "registrarme", "cuánto cuesta"]):
-            return 9
-        elif any(w in text_lower for w in ["me interesa", "cuéntame más", "información"]):
-            return 7
-        elif any(w in text_lower for w in ["quizás", "tal vez", "no sé"]):
-            return 4
-        elif any(w in text_lower for w in ["no gracias", "no interesa"]):
-            return 1
-        
-        return 5
+        return INTEREST_MATCHER.match(text.lower()) or 5
 
-    async def _generate_response(self, text: str, conversation, db: Session):
-        """Genera respuesta del chatbot"""
-        auto_response = self._get_auto_response(text, conversation.user_name)
+    async def _generate_response(self, text: str, user_name: str = None, history: list = ()):
+        """Genera respuesta del chatbot (history: (role, content) previos de la conversación)"""
+        auto_response = self._get_auto_response(text, user_name)
         if auto_response:
             return auto_response
         
         if self.openai_client and self.use_openai:
-            return await self._get_ai_response(text, conversation, db)
+            return await self._get_ai_response(text, user_name, history)
         
-        return self._get_default_response(conversation.user_name)
+        return self._get_default_response(user_name)
 
     def _get_auto_response(self, text: str, user_name: str = None):
         """Respuestas automáticas mejoradas - LAS 5 PREGUNTAS CLAVE SON PRIORIDAD"""
         t = text.lower().strip()
         greeting = f"¡Hola {user_name}! 👋" if user_name else "¡Hola! 👋"
 
-        if t in ["1", "1️⃣"]:
-            t = "qué es hgw"
-        elif t in ["2", "2️⃣"]:
-            t = "qué tengo que hacer"
-        elif t in ["3", "3️⃣"]:
-            t = "inversión"
-        elif t in ["4", "4️⃣"]:
-            t = "recuperar inversión"
-        elif t in ["5", "5️⃣"]:
-            t = "cuándo gano"
-        elif t in ["6", "6️⃣"]:
-            t = "productos"
-        elif t in ["7", "7️⃣"]:
-            t = "richard"
-        
+        t = MENU_OPTIONS.get(t, t)
+        intent = AUTO_RESPONSE_MATCHER.match(t)
+        if intent is None:
+            return None
+
         # ============ SALUDO INICIAL MEJORADO ============
-        if any(w in t for w in ["hola", "buenas", "buenos días", "buenas tardes", "hi", "hello"]) and len(t) < 25:
+        if intent == "saludo":
             return f"""{greeting}
 
            ¡Bienvenido a *HGW - Empoderando Líderes* con Richard Córdoba! 🌿
@@ -247,7 +363,7 @@ O dime tu nombre para personalizar tu experiencia 😊"""
 
 
         # ============ 1. ¿QUÉ ES HGW? - RESPUESTA COMPLETA Y DETALLADA ============
-        if any(w in t for w in ["qué es hgw", "que es hgw", "qué es", "que es", "empresa", "compañía", "explicame hgw", "sobre hgw", "cuéntame de hgw"]):
+        if intent == "que_es_hgw":
             return """🌿 *PREGUNTA 1: ¿QUÉ ES HGW (HEALTH GREEN WORLD)?*
 
 Te lo explico de forma clara y completa:
@@ -317,7 +433,7 @@ O habla directo con Richard para más detalles:
 📞 +57 305 2490438"""
 
         # ============ 2. ¿QUÉ TENGO QUE HACER? - ULTRA DETALLADO ============
-        if any(w in t for w in ["qué tengo que hacer", "que tengo que hacer", "qué hago", "que hago", "actividades", "tareas", "trabajo diario", "responsabilidades"]):
+        if intent == "que_hacer":
             return """💼 *PREGUNTA 2: ¿QUÉ TENGO QUE HACER EXACTAMENTE EN HGW?*
 
 Te voy a explicar PASO A PASO tus actividades diarias y cómo funciona todo:
@@ -460,7 +576,7 @@ Richard te explica todo en detalle y te acompaña paso a paso:
 ¿Quieres saber cuánto necesitas INVERTIR? Escribe "3" o "inversión" 💰"""
 
         # ============ 3. INVERSIÓN INICIAL - SÚPER DETALLADO ============
-        if any(w in t for w in ["inversión", "inversion", "cuánto cuesta", "cuanto cuesta", "precio", "cuanto necesito", "cuánto necesito", "planes", "membresia", "membresía", "paquetes"]):
+        if intent == "inversion":
             return """💰 *PREGUNTA 3: ¿CUÁNTO ES LA INVERSIÓN INICIAL?*
 
 Te voy a explicar TODOS los planes disponibles con TODOS los detalles:
@@ -658,7 +774,7 @@ O habla con Richard para elegir el mejor plan para ti:
 📞 +57 305 2490438"""
 
         # ============ 4. RECUPERACIÓN DE INVERSIÓN - MATEMÁTICAS DETALLADAS ============
-        if any(w in t for w in ["recuperar", "recupero", "cuándo recupero", "cuando recupero", "devolver", "regresa", "tiempo de recuperación"]):
+        if intent == "recuperacion":
             return """⏰ *PREGUNTA 4: ¿CUÁNDO RECUPERO MI INVERSIÓN?*
 
 Te voy a explicar EXACTAMENTE cómo y cuándo recuperas cada peso invertido:
@@ -836,7 +952,7 @@ O habla con Richard para ver tu plan personalizado:
 📞 +57 305 2490438"""
 
         # ============ 5. CUÁNDO EMPIEZO A GANAR - CRONOGRAMA COMPLETO ============
-        if any(w in t for w in ["cuándo gano", "cuando gano", "cuándo empiezo a ganar", "cuando empiezo a ganar", "ganancias", "ganar dinero", "utilidad", "cuanto gano", "cuánto gano", "ingresos"]):
+        if intent == "ganancias":
             return """💵 *PREGUNTA 5: ¿CUÁNDO EMPIEZO A GANAR DINERO?*
 
 La respuesta es simple: *DESDE TU PRIMERA VENTA* 🎯
@@ -1082,7 +1198,7 @@ Dile: "Hola Richard, quiero empezar en HGW y ganar dinero"
 ¡Tu futuro financiero comienza AHORA! 🚀"""
 
         # ============ RESUMEN DE LAS 5 PREGUNTAS ============
-        if any(w in t for w in ["resumen", "todo", "5 puntos", "5 preguntas", "explicame todo", "todo junto"]):
+        if intent == "resumen":
             return """📊 *RESUMEN COMPLETO - LAS 5 PREGUNTAS CLAVE DE HGW*
 
 *═══════════════════════════════*
@@ -1221,7 +1337,7 @@ Escribe: "productos", "inscribir", "tutoriales" o tu pregunta específica.
 ¡El momento es AHORA! 🌟"""
 
         # Unirse / Inscribirse con nombre
-        if any(w in t for w in ["unirme", "unir", "inscribirme", "registrarme", "ser parte", "entrar", "quiero empezar", "empezar"]):
+        if intent == "unirse":
             nombre = f"{user_name}" if user_name else "amigo/a"
             return f"""¡Excelente decisión, {nombre}! 🎉
 
@@ -1247,7 +1363,7 @@ Dile: "Hola Richard, {user_name if user_name else 'me interesa'} quiero unirme a
 ¿Tienes alguna pregunta antes de contactarlo? 😊"""
 
         # Productos - Catálogo general
-        if any(w in t for w in ["producto", "qué venden", "qué tienen", "catalogo", "catálogo"]) and not any(x in t for x in ["blueberry", "cafe", "omega", "espirulina", "pasta", "jabon", "shampoo", "toalla", "collar", "termo"]):
+        if intent == "catalogo":
             return """🛒 *Catálogo HGW Colombia*
 
 Tenemos productos 100% naturales certificados:
@@ -1278,7 +1394,7 @@ Escribe el nombre del producto que te interesa para más detalles 😊
 O habla con Richard: +57 305 2490438"""
 
         # Productos específicos - Alimentos
-        if any(w in t for w in ["blueberry", "arandano", "arándano"]) and not any(x in t for x in ["fresh", "regaliz"]):
+        if intent == "arandano":
             return """🍬 *Productos de Arándano HGW*
 
 *Blueberry Candy (Caramelo de arándano)*
@@ -1305,7 +1421,7 @@ O habla con Richard: +57 305 2490438"""
 ¿Quieres ordenar? Habla con Richard:
 📞 +57 305 2490438"""
 
-        if any(w in t for w in ["fresh candy", "regaliz", "caramelo regaliz"]):
+        if intent == "fresh_candy":
             return """🍬 *Fresh Candy sabor Regaliz HGW*
 
 *Caramelos con extracto de regaliz*
@@ -1322,7 +1438,7 @@ Ideal para llevar en tu bolso y cuidar tu salud en cualquier momento.
 Pedidos con Richard:
 📞 +57 305 2490438"""
 
-        if any(w in t for w in ["cafe", "café", "ganoderma", "cordyceps", "coffee"]):
+        if intent == "cafe":
             return """☕ *Cafés Funcionales HGW*
 
 *Café con Ganoderma (Ganoderma Soluble Coffee)*
@@ -1342,7 +1458,7 @@ Pedidos con Richard:
 Precio y pedidos con Richard:
 📞 +57 305 2490438"""
 
-        if any(w in t for w in ["omega", "espirulina", "suplemento"]):
+        if intent == "suplementos":
             return """💊 *Suplementos HGW*
 
 *Omega 3-6-9*
@@ -1365,7 +1481,7 @@ Precio y pedidos con Richard:
 📞 +57 305 2490438"""
 
         # Productos de higiene
-        if any(w in t for w in ["pasta dental", "dientes", "toothpaste"]):
+        if intent == "pasta_dental":
             return """🦷 *Pasta Dental Herbal HGW*
 
 *Herb Toothpaste*
@@ -1382,7 +1498,7 @@ Sin químicos agresivos, toda la familia puede usarla.
 ¿Quieres probarla? Contacta a Richard:
 📞 +57 305 2490438"""
 
-        if any(w in t for w in ["jabon", "jabón", "turmalina", "oliva"]):
+        if intent == "jabones":
             return """🧼 *Jabones Naturales HGW*
 
 *Jabón de Turmalina*
@@ -1402,7 +1518,7 @@ Sin químicos agresivos, toda la familia puede usarla.
 Pedidos con Richard:
 📞 +57 305 2490438"""
 
-        if any(w in t for w in ["shampoo", "champú", "keratina", "cabello"]):
+        if intent == "shampoo":
             return """💇 *Shampoo Keratina HGW*
 
 *Smilife Keratin Shampoo*
@@ -1420,7 +1536,7 @@ Ideal para cabello maltratado, teñido o con tratamientos químicos.
 📞 +57 305 2490438"""
 
         # Productos femeninos
-        if any(w in t for w in ["toalla sanitaria", "toallas", "femenino", "menstruacion", "menstruación"]):
+        if intent == "toallas":
             return """🌸 *Toallas Sanitarias Smilife HGW*
 
 *Toallas día y noche*
@@ -1439,7 +1555,7 @@ Pedidos con Richard:
 📞 +57 305 2490438"""
 
         # Productos de bienestar
-        if any(w in t for w in ["termo", "collar", "pulsera", "turmalina", "accesorio"]):
+        if intent == "accesorios":
             return """💎 *Accesorios de Bienestar HGW*
 
 *Termo con Turmalina Waterson*
@@ -1459,7 +1575,7 @@ Pedidos con Richard:
 📞 +57 305 2490438"""
 
         # Sin tiempo
-        if any(w in t for w in ["tiempo", "ocupado", "no tengo tiempo", "trabajo mucho"]):
+        if intent == "sin_tiempo":
             return """¡Te entiendo perfectamente! ⏰
 
 La buena noticia: solo necesitas 1-2 horas al día para empezar.
@@ -1472,7 +1588,7 @@ Lo mejor: cuando construyes tu equipo, ellos generan ingresos para ti aunque no
 📞 Habla con Richard: +57 305 2490438"""
 
         # Bienestar/Salud
-        if any(w in t for w in ["salud", "bienestar", "energía", "cansado", "energia", "vitaminas", "natural"]):
+        if intent == "bienestar":
             return """¡Excelente! 🌿
 
 Nuestros productos naturales te van a sorprender:
@@ -1490,7 +1606,7 @@ Y si te gustan los resultados, puedes volverte distribuidor y ganar dinero compa
 📞 Richard te asesora: +57 305 2490438"""
 
         # Contacto con Richard
-        if any(w in t for w in ["richard", "llamar", "contacto", "hablar", "agendar", "numero", "número", "telefono", "teléfono"]):
+        if intent == "contacto_richard":
             return """¡Perfecto! 📞
 
 Richard es el líder de *Empoderando Líderes* y mentor personal de distribuidores HGW.
@@ -1509,7 +1625,7 @@ Puedes decirle: "Hola Richard, vengo del bot y me interesa conocer más sobre [l
 ¡Él está esperando tu mensaje! 😊"""
 
         # Testimonios
-        if any(w in t for w in ["testimonio", "experiencia", "funciona", "resultados", "casos de exito"]):
+        if intent == "testimonios":
             return """¡Claro! ⭐
 
 Miles de personas han cambiado su vida con HGW:
@@ -1526,7 +1642,7 @@ Richard puede conectarte con más distribuidores:
 📞 +57 305 2490438"""
 
         # Dudas / No sé
-        if any(w in t for w in ["no sé", "no se", "duda", "pregunta", "no entiendo"]):
+        if intent == "dudas":
             return """¡Tranquilo! 🤔
 
 Es normal tener dudas al principio.
@@ -1542,7 +1658,7 @@ La mejor forma de resolver TODAS tus dudas es hablar con Richard. Sin compromiso
 📞 WhatsApp: +57 305 2490438"""
 
         # Cómo inscribirse - PASO A PASO DETALLADO
-        if any(w in t for w in ["inscribir", "registrar", "como me inscribo", "cómo me registro", "como inicio"]):
+        if intent == "inscripcion":
             return """🚀 *PASO A PASO: Cómo Inscribirse en HGW*
 
 *PASO 1: VER EL TUTORIAL* 📹
@@ -1584,7 +1700,7 @@ O contacta directamente a Richard:
 📞 +57 305 2490438"""
 
         # Cuando dice "no puedo" o tiene dificultades
-        if any(w in t for w in ["no puedo", "no se como", "no sé cómo", "ayuda", "dificultad", "problema", "error"]):
+        if intent == "soporte":
             return """🆘 *¡Estoy Aquí Para Ayudarte!*
 
 Entiendo que el proceso puede tener dudas. Cuéntame específicamente:
@@ -1609,7 +1725,7 @@ Richard puede ayudarte en videollamada:
 ¡No te quedes con dudas! 😊"""
 
         # Tutorial: Descargar aplicación HGW
-        if any(w in t for w in ["aplicacion", "aplicación", "app", "descargar app", "instalar app", "descargar aplicacion", "movil", "móvil", "celular"]):
+        if intent == "app_descarga":
             return """📱 *Cómo Descargar la Aplicación HGW*
 
 La app oficial de HGW te permite gestionar tu negocio desde tu celular.
@@ -1643,7 +1759,7 @@ Escribe "ayuda app" o contacta a Richard:
 ¡Gestiona tu negocio desde cualquier lugar! 📲"""
 
         # Ayuda con problemas de la app
-        if any(w in t for w in ["ayuda app", "problema app", "no instala", "no funciona app", "error app"]):
+        if intent == "app_problemas":
             return """🔧 *Solución de Problemas - App HGW*
 
 *Problemas comunes y soluciones:*
@@ -1674,7 +1790,7 @@ Richard puede ayudarte en videollamada:
 📞 +57 305 2490438"""
 
         # Tutorial: Cómo ingresar al backoffice
-        if any(w in t for w in ["backoffice", "back office", "ingresar", "login", "iniciar sesion", "iniciar sesión"]):
+        if intent == "backoffice":
             return """🔐 *Cómo Ingresar al Backoffice HGW*
 
 El backoffice es tu panel de control donde gestionas todo tu negocio.
@@ -1700,7 +1816,7 @@ Tutorial para cambiarla:
 ¿Necesitas más ayuda?"""
 
         # Tutorial: Cómo comprar membresía
-        if any(w in t for w in ["membresia", "membresía", "comprar membresia", "adquirir membresia", "activar"]):
+        if intent == "membresia":
             return """💎 *Cómo Comprar Tu Membresía HGW*
 
 La membresía te da acceso a TODOS los beneficios de distribuidor.
@@ -1724,7 +1840,7 @@ La membresía te da acceso a TODOS los beneficios de distribuidor.
 ¿Alguna duda con el proceso?"""
 
         # Tutorial: Cómo hacer pedidos
-        if any(w in t for w in ["pedido", "comprar productos", "hacer pedido", "ordenar", "comprar"]):
+        if intent == "pedido":
             return """📦 *Cómo Hacer un Pedido de Productos*
 
 Puedes hacer pedidos para ti o para tus clientes.
@@ -1756,7 +1872,7 @@ Puedes hacer pedidos para ti o para tus clientes.
 Tutorial: https://youtu.be/yBf8VAmaVs4"""
 
         # Tutorial: Cómo cobrar comisiones
-        if any(w in t for w in ["comision", "comisión", "cobrar", "ganancias", "retiro", "retirar", "dinero", "pagar"]):
+        if intent == "comisiones":
             return """💰 *Cómo Cobrar Tus Comisiones*
 
 ¡Es hora de recibir tus ganancias! Aquí te explico cómo.
@@ -1790,7 +1906,7 @@ Tutorial: https://youtu.be/NLCVYvfwtng
 ¿Problemas con el proceso?"""
 
         # Tutorial: Enlace de referido
-        if any(w in t for w in ["referido", "enlace", "link", "invitar", "compartir", "reclutar"]):
+        if intent == "referidos":
             return """🔗 *Tu Enlace de Referido*
 
 Con este enlace invitas a otras personas y ganas comisiones.
@@ -1820,7 +1936,7 @@ Usa tu enlace en:
 ¿Necesitas estrategias para invitar personas?"""
 
         # Tutorial: Ver red de socios
-        if any(w in t for w in ["red", "equipo", "socios", "downline", "genealogia", "genealogía"]):
+        if intent == "red":
             return """👥 *Ver Tu Red de Socios*
 
 Aquí puedes ver toda tu organización y cómo crece.
@@ -1848,7 +1964,7 @@ Esto te ayuda a:
 ¿Quieres tips para hacer crecer tu red?"""
 
         # Tutorial: Material de apoyo
-        if any(w in t for w in ["material", "catalogo", "catálogo", "folleto", "informacion productos", "información productos"]):
+        if intent == "material":
             return """📚 *Material de Apoyo HGW*
 
 Tenemos todo el material que necesitas para vender.
@@ -1881,7 +1997,7 @@ Tenemos todo el material que necesitas para vender.
 ¡Todo el material es GRATIS!"""
 
         # Tutorial: Cambiar datos personales
-        if any(w in t for w in ["cambiar datos", "actualizar datos", "modificar datos", "direccion", "dirección", "telefono", "teléfono"]):
+        if intent == "datos":
             return """✏️ *Actualizar Tus Datos*
 
 Es importante mantener tu información actualizada.
@@ -1915,7 +2031,7 @@ Es importante mantener tu información actualizada.
 ¿Necesitas ayuda con algún cambio específico?"""
 
         # Todos los tutoriales
-        if any(w in t for w in ["tutoriales", "videos", "todos los tutoriales", "lista de tutoriales"]):
+        if intent == "tutoriales":
             return """📲 *TODOS LOS TUTORIALES HGW*
 
 Aquí está la lista completa para que aprendas a usar todo:
@@ -1964,29 +2080,36 @@ Aquí está la lista completa para que aprendas a usar todo:
         # Respuesta por defecto - no hay coincidencia
         return None
 
-    async def _get_ai_response(self, text: str, conversation, db: Session):
-        """Genera respuesta usando OpenAI"""
+    async def _get_ai_response(self, text: str, user_name: str = None, history: list = ()):
+        """Genera respuesta usando OpenAI (el historial ya viene leído)"""
         try:
-            messages = db.query(Message).filter(
-                Message.conversation_id == conversation.id
-            ).order_by(Message.timestamp).limit(10).all()
-            
             chat_history = [{"role": "system", "content": self.business_prompt}]
-            for msg in messages:
-                chat_history.append({"role": msg.role, "content": msg.content})
+            for role, content in history:
+                chat_history.append({"role": role, "content": content})
             chat_history.append({"role": "user", "content": text})
             
-            response = self.openai_client.chat.completions.create(
+            # El timeout cubre la espera del semáforo y la llamada; al vencer se cancela
+            return await asyncio.wait_for(
+                self._request_completion(chat_history),
+                timeout=self.openai_timeout
+            )
+        except asyncio.TimeoutError:
+            print(f"⏱️ OpenAI excedió {self.openai_timeout}s, usando respuesta por defecto")
+            return self._get_default_response(user_name)
+        except Exception as e:
+            print(f"Error en OpenAI: {e}")
+            return self._get_default_response(user_name)
+
+    async def _request_completion(self, chat_history: list):
+        """Llama a OpenAI respetando el límite de concurrencia"""
+        async with self.openai_semaphore:
+            response = await self.openai_client.chat.completions.create(
                 model="gpt-3.5-turbo",
                 messages=chat_history,
                 max_tokens=400,
                 temperature=0.7
             )
-            
-            return response.choices[0].message.content
-        except Exception as e:
-            print(f"Error en OpenAI: {e}")
-            return self._get_default_response(conversation.user_name)
+        return response.choices[0].message.content
 
     def _get_default_response(self, user_name: str = None):
         """Respuesta por defecto mejorada"""
@@ -2008,29 +2131,3 @@ Escribe el número o tu pregunta.
 
 O contacta directo a Richard:
 📞 +57 305 2490438"""
-
-    async def _send_whatsapp_message(self, to: str, message: str):
-        """Envía mensaje por WhatsApp"""
-        if not self.whatsapp_token or not self.phone_id:
-            print("WhatsApp no configurado")
-            return False
-        
-        url = f"https://graph.facebook.com/v18.0/{self.phone_id}/messages"
-        headers = {
-            "Authorization": f"Bearer {self.whatsapp_token}",
-            "Content-Type": "application/json"
-        }
-        data = {
-            "messaging_product": "whatsapp",
-            "to": to,
-            "type": "text",
-            "text": {"body": message}
-        }
-        
-        try:
-            async with httpx.AsyncClient() as client:
-                response = await client.post(url, json=data, headers=headers)
-                return response.status_code == 200
-        except Exception as e:
-            print(f"Error enviando mensaje: {e}")
-            return False
\ No newline at end of file
@@ -26,7 +26,24 @@ class Settings(BaseSettings):
     WHATSAPP_TOKEN: str = os.getenv("WHATSAPP_TOKEN", "")
     WHATSAPP_PHONE_ID: str = os.getenv("WHATSAPP_PHONE_ID", "")
     VERIFY_TOKEN: str = os.getenv("VERIFY_TOKEN", "hgw_verify_2025")
-    WHATSAPP_API_URL: str = "https://graph.facebook.com/v18.0"
+    WHATSAPP_API_URL: str = os.getenv("WHATSAPP_API_URL", "https://graph.facebook.com/v18.0")
+    
+    # Ritmo de envío a la Graph API (mensajes por segundo por número).
+    # Nivel "standard" = 80 (Cloud API por defecto), "high" = 1000 (ampliado por Meta);
+    # WHATSAPP_MESSAGES_PER_SECOND lo reemplaza. Es por proceso: con varias
+    # instancias del servidor se reparte entre ellas.
+    WHATSAPP_THROUGHPUT_TIER: str = os.getenv("WHATSAPP_THROUGHPUT_TIER", "standard")
+    WHATSAPP_MESSAGES_PER_SECOND: Optional[float] = (
+        float(os.getenv("WHATSAPP_MESSAGES_PER_SECOND")) if os.getenv("WHATSAPP_MESSAGES_PER_SECOND") else None
+    )
+    
+    # Cliente HTTP compartido para la Graph API
+    HTTP_TIMEOUT: float = float(os.getenv("HTTP_TIMEOUT", "10"))
+    HTTP_CONNECT_TIMEOUT: float = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))
+    HTTP_MAX_CONNECTIONS: int = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+    HTTP_MAX_KEEPALIVE: int = int(os.getenv("HTTP_MAX_KEEPALIVE", "20"))
+    HTTP_KEEPALIVE_EXPIRY: float = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "60"))
+    HTTP2_ENABLED: bool = os.getenv("HTTP2_ENABLED", "true").lower() == "true"
     
     # OpenAI
     OPENAI_API_KEY: Optional[str] = os.getenv("OPENAI_API_KEY")
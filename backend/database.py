@@ -1,4 +1,5 @@
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 import os
@@ -34,9 +35,42 @@ engine = create_engine(
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
+# ==================== MOTOR ASÍNCRONO ====================
+# psycopg 3 es el mismo driver en modo async; SQLite local requiere aiosqlite
+ASYNC_DATABASE_URL = DATABASE_URL
+async_pool_options = {
+    "pool_size": int(os.getenv("DB_ASYNC_POOL_SIZE", "20")),
+    "max_overflow": int(os.getenv("DB_ASYNC_MAX_OVERFLOW", "20"))
+}
+if ASYNC_DATABASE_URL.startswith("sqlite://"):
+    ASYNC_DATABASE_URL = ASYNC_DATABASE_URL.replace("sqlite://", "sqlite+aiosqlite://", 1)
+    # Un solo escritor a la vez: con muchas transacciones concurrentes la
+    # espera por el candado supera los 5 s por defecto
+    async_pool_options = {"connect_args": {"timeout": 30}}
+
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    pool_pre_ping=True,
+    pool_recycle=3600,
+    echo=False,
+    **async_pool_options
+)
+
+AsyncSessionLocal = async_sessionmaker(
+    bind=async_engine,
+    class_=AsyncSession,
+    autoflush=False,
+    expire_on_commit=False
+)
+
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+async def get_async_db():
+    """Dependencia con AsyncSession para las rutas que no deben bloquear el event loop"""
+    async with AsyncSessionLocal() as db:
+        yield db
\ No newline at end of file
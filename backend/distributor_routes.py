@@ -1,17 +1,21 @@
 # backend/distributor_routes.py
-from fastapi import APIRouter, Depends, HTTPException, Query
+import asyncio
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, UploadFile, File
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import or_
 from typing import List, Optional
 from datetime import datetime, date
-from passlib.context import CryptContext
 from pydantic import BaseModel, EmailStr, Field
-from database import get_db
+from database import get_db, get_async_db, AsyncSessionLocal
 from models import Distributor
-from auth import get_current_user
+from auth import get_current_user, get_password_hash_async
+from services.pagination import KeysetPaginator
+from services.search import search_filter
+from services.distributor_bulk import DistributorImporter, aiter_csv_rows, iter_export_csv
 
 router = APIRouter()
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 # ==================== SCHEMAS ====================
 
@@ -49,8 +53,10 @@ class DistributorUpdate(BaseModel):
 
 @router.get("/")
 async def get_distributors(
+    response: Response,
     skip: int = 0,
     limit: int = 100,
+    cursor: Optional[str] = None,
     search: Optional[str] = None,
     estado: Optional[str] = None,
     nivel: Optional[str] = None,
@@ -61,16 +67,13 @@ async def get_distributors(
     query = db.query(Distributor)
     
     if search:
-        search_filter = f"%{search}%"
-        query = query.filter(
-            or_(
-                Distributor.nombres.ilike(search_filter),
-                Distributor.apellidos.ilike(search_filter),
-                Distributor.telefono.like(search_filter),
-                Distributor.email.ilike(search_filter),
-                Distributor.usuario.ilike(search_filter)
-            )
-        )
+        query = query.filter(search_filter([
+            Distributor.nombres,
+            Distributor.apellidos,
+            Distributor.telefono,
+            Distributor.email,
+            Distributor.usuario
+        ], search))
     
     if estado:
         query = query.filter(Distributor.estado == estado)
@@ -78,7 +81,11 @@ async def get_distributors(
     if nivel:
         query = query.filter(Distributor.nivel == nivel)
     
-    distributors = query.offset(skip).limit(limit).all()
+    # Paginación por cursor (X-Next-Cursor); skip queda por compatibilidad
+    paginator = KeysetPaginator(
+        [Distributor.created_at, Distributor.id], cursor=cursor, limit=limit, skip=skip
+    )
+    distributors = paginator.page(paginator.apply(query).all(), response)
     
     return [{
         "id": d.id,
@@ -100,6 +107,55 @@ async def get_distributors(
     } for d in distributors]
 
 
+# ==================== IMPORTACIÓN / EXPORTACIÓN ====================
+# Rutas de dos segmentos para no chocar con /api/distributors/{distributor_id}
+
+@router.post("/bulk/import")
+async def import_distributors(
+    file: UploadFile = File(..., description="CSV con las columnas del alta de distribuidor"),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Importa distribuidores desde un CSV (separado por coma o punto y coma)
+    
+    Columnas: nombres, apellidos, telefono, email, fecha_ingreso (AAAA-MM-DD),
+    fecha_cumpleanos, usuario, contrasena, contrasena_doble_factor, nivel,
+    estado, notas. Devuelve el resultado de cada fila (número de línea).
+    """
+    if not (file.filename or "").lower().endswith(".csv"):
+        raise HTTPException(status_code=400, detail="El archivo debe ser .csv")
+    
+    try:
+        report = await DistributorImporter(db, DistributorCreate).run(aiter_csv_rows(file.file))
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail="No se pudo leer el archivo (codificación no soportada)")
+    
+    print(f"📥 Importación de distribuidores: {report['created']} creados, {report['failed']} con error")
+    return report
+
+
+@router.get("/bulk/export")
+async def export_distributors(
+    estado: Optional[str] = None,
+    nivel: Optional[str] = None,
+    current_user: dict = Depends(get_current_user)
+):
+    """Exporta los distribuidores a CSV (sin contraseñas), generado por tramos"""
+    filters = []
+    if estado:
+        filters.append(Distributor.estado == estado)
+    if nivel:
+        filters.append(Distributor.nivel == nivel)
+    
+    filename = f"distribuidores_{datetime.utcnow():%Y%m%d}.csv"
+    return StreamingResponse(
+        iter_export_csv(AsyncSessionLocal, *filters),
+        media_type="text/csv; charset=utf-8",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+
 @router.get("/{distributor_id}")
 async def get_distributor(
     distributor_id: int,
@@ -155,6 +211,12 @@ async def create_distributor(
         elif existing.email == distributor.email:
             raise HTTPException(status_code=400, detail="Ya existe un distribuidor con ese email")
 
+    # Los hashes se calculan en el pool de bcrypt, en paralelo
+    passwords = [distributor.contrasena]
+    if distributor.contrasena_doble_factor:
+        passwords.append(distributor.contrasena_doble_factor)
+    hashes = await asyncio.gather(*(get_password_hash_async(p) for p in passwords))
+
     db_distributor = Distributor(
         nombres=distributor.nombres,
         apellidos=distributor.apellidos,
@@ -163,7 +225,7 @@ async def create_distributor(
         fecha_ingreso=distributor.fecha_ingreso,
         fecha_cumpleanos=distributor.fecha_cumpleanos,
         usuario=distributor.usuario,
-        contrasena=pwd_context.hash(distributor.contrasena),
+        contrasena=hashes[0],
         contrasena_texto=distributor.contrasena,  # ✅ texto visible
         nivel=distributor.nivel or "Pre-Junior",
         estado=distributor.estado or "activo",
@@ -171,7 +233,7 @@ async def create_distributor(
     )
 
     if distributor.contrasena_doble_factor:
-        db_distributor.contrasena_doble_factor = pwd_context.hash(distributor.contrasena_doble_factor)
+        db_distributor.contrasena_doble_factor = hashes[1]
         db_distributor.contrasena_2fa_texto = distributor.contrasena_doble_factor  # ✅ texto visible
     
     db.add(db_distributor)
@@ -200,15 +262,20 @@ async def update_distributor(
     
     update_data = distributor_data.dict(exclude_unset=True)
 
-    if "contrasena" in update_data and update_data["contrasena"]:
-        plain_password = update_data["contrasena"]
-        update_data["contrasena"] = pwd_context.hash(plain_password)
-        update_data["contrasena_texto"] = plain_password
+    # Contraseñas nuevas: se hashean en el pool de bcrypt, en paralelo
+    plain = {
+        field: update_data[field]
+        for field in ("contrasena", "contrasena_doble_factor")
+        if update_data.get(field)
+    }
+    hashes = await asyncio.gather(*(get_password_hash_async(p) for p in plain.values()))
+    update_data.update(zip(plain, hashes))
+
+    if "contrasena" in plain:
+        update_data["contrasena_texto"] = plain["contrasena"]
 
-    if "contrasena_doble_factor" in update_data and update_data["contrasena_doble_factor"]:
-        plain_2fa = update_data["contrasena_doble_factor"]
-        update_data["contrasena_doble_factor"] = pwd_context.hash(plain_2fa)
-        update_data["contrasena_2fa_texto"] = plain_2fa
+    if "contrasena_doble_factor" in plain:
+        update_data["contrasena_2fa_texto"] = plain["contrasena_doble_factor"]
 
     for field, value in update_data.items():
         setattr(distributor, field, value)
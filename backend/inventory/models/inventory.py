@@ -1,5 +1,5 @@
 # backend/app/models/inventory.py
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, DECIMAL, Index
+from sqlalchemy import Column, Integer, String, Text, Date, DateTime, ForeignKey, DECIMAL, Index, CheckConstraint
 from sqlalchemy.orm import relationship
 from datetime import datetime
 import sys
@@ -93,6 +93,7 @@ class StockVendedor(Base):
     # Índice único compuesto
     __table_args__ = (
         Index('unico_vendedor_producto', 'vendedor_id', 'producto_id', unique=True),
+        CheckConstraint('cantidad_actual >= 0', name='ck_stock_vendedores_cantidad_actual'),
     )
     
     def to_dict(self):
@@ -124,6 +125,11 @@ class VentaVendedor(Base):
     vendedor = relationship("Vendedor", back_populates="ventas")
     producto = relationship("Producto", back_populates="ventas")
     
+    # Listado paginado por cursor (fecha_venta, id)
+    __table_args__ = (
+        Index('ix_ventas_vendedor_fecha_venta_id', 'fecha_venta', 'id'),
+    )
+    
     def to_dict(self):
         return {
             "id": self.id,
@@ -139,6 +145,38 @@ class VentaVendedor(Base):
         }
 
 
+class VentaDiaria(Base):
+    """
+    Resumen de ventas por día, vendedor y producto.
+
+    Lo mantienen las rutas de ventas (alta, edición y baja) en la misma
+    transacción que la venta, así las estadísticas suman días en lugar de
+    recorrer todas las ventas.
+    """
+    __tablename__ = "ventas_diarias"
+    
+    fecha = Column(Date, primary_key=True)
+    vendedor_id = Column(Integer, ForeignKey("vendedores.id", ondelete="CASCADE"), primary_key=True)
+    producto_id = Column(Integer, ForeignKey("productos.id", ondelete="CASCADE"), primary_key=True)
+    num_ventas = Column(Integer, nullable=False, default=0)
+    unidades = Column(Integer, nullable=False, default=0)
+    valor = Column(DECIMAL(14, 2), nullable=False, default=0)
+    
+    __table_args__ = (
+        Index('ix_ventas_diarias_vendedor_fecha', 'vendedor_id', 'fecha'),
+        Index('ix_ventas_diarias_producto_fecha', 'producto_id', 'fecha'),
+    )
+    
+    def to_dict(self):
+        return {
+            "fecha": self.fecha.isoformat() if self.fecha else None,
+            "vendedor_id": self.vendedor_id,
+            "producto_id": self.producto_id,
+            "num_ventas": self.num_ventas,
+            "unidades": self.unidades,
+            "valor": float(self.valor or 0)
+        }
+
 class AsignacionProductoVendedor(Base):
     __tablename__ = "asignaciones_productos_vendedor"
     
@@ -165,4 +203,102 @@ class AsignacionProductoVendedor(Base):
             "fecha_asignacion": self.fecha_asignacion.isoformat() if self.fecha_asignacion else None,
             "asignado_por": self.asignado_por,
             "notas": self.notas
-        }
\ No newline at end of file
+        }
+
+class AjusteInventarioVendedor(Base):
+    __tablename__ = "ajustes_inventario_vendedor"
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    vendedor_id = Column(Integer, ForeignKey("vendedores.id", ondelete="CASCADE"), nullable=False, index=True)
+    producto_id = Column(Integer, ForeignKey("productos.id", ondelete="CASCADE"), nullable=False)
+    tipo_ajuste = Column(String(20), nullable=False)  # aumento | disminucion
+    cantidad = Column(Integer, nullable=False)
+    cantidad_anterior = Column(Integer, nullable=False)
+    cantidad_nueva = Column(Integer, nullable=False)
+    razon = Column(Text)
+    ajustado_por = Column(Integer)
+    fecha_ajuste = Column(DateTime, default=datetime.utcnow)
+    
+    # Relaciones
+    vendedor = relationship("Vendedor")
+    producto = relationship("Producto")
+    
+    __table_args__ = (
+        Index('ix_ajustes_inventario_fecha_id', 'fecha_ajuste', 'id'),
+    )
+    
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "vendedor_id": self.vendedor_id,
+            "producto_id": self.producto_id,
+            "tipo_ajuste": self.tipo_ajuste,
+            "cantidad": self.cantidad,
+            "cantidad_anterior": self.cantidad_anterior,
+            "cantidad_nueva": self.cantidad_nueva,
+            "razon": self.razon,
+            "ajustado_por": self.ajustado_por,
+            "fecha_ajuste": self.fecha_ajuste.isoformat() if self.fecha_ajuste else None
+        }
+
+
+# Motivos de un movimiento de stock ("inicial" = saldo cargado al crear el libro)
+MOTIVOS_MOVIMIENTO = ("inicial", "asignacion", "venta", "ajuste", "devolucion")
+
+
+class MovimientoStock(Base):
+    """
+    Libro de movimientos de stock: solo se agregan filas, nunca se editan.
+
+    Cada cambio de StockVendedor.cantidad_actual escribe aquí, en la misma
+    transacción, la cantidad con signo, el motivo y el id del registro que
+    lo causó (venta, asignación o ajuste). La suma de los movimientos de un
+    par vendedor/producto es su stock actual.
+    """
+    __tablename__ = "movimientos_stock"
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    vendedor_id = Column(Integer, ForeignKey("vendedores.id", ondelete="CASCADE"), nullable=False)
+    producto_id = Column(Integer, ForeignKey("productos.id", ondelete="CASCADE"), nullable=False)
+    cantidad = Column(Integer, nullable=False)
+    motivo = Column(String(20), nullable=False)
+    referencia_id = Column(Integer)
+    fecha = Column(DateTime, default=datetime.utcnow, nullable=False)
+    
+    __table_args__ = (
+        Index('ix_movimientos_stock_par_id', 'vendedor_id', 'producto_id', 'id'),
+        Index('ix_movimientos_stock_fecha_id', 'fecha', 'id'),
+    )
+    
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "vendedor_id": self.vendedor_id,
+            "producto_id": self.producto_id,
+            "cantidad": self.cantidad,
+            "motivo": self.motivo,
+            "referencia_id": self.referencia_id,
+            "fecha": self.fecha.isoformat() if self.fecha else None
+        }
+
+
+class SnapshotStock(Base):
+    """
+    Foto del stock de un par vendedor/producto: la cantidad después de
+    aplicar todos los movimientos hasta ultimo_movimiento_id. El stock a una
+    fecha se calcula desde el snapshot anterior más los movimientos
+    siguientes, sin recorrer todo el libro.
+    """
+    __tablename__ = "snapshots_stock"
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    vendedor_id = Column(Integer, ForeignKey("vendedores.id", ondelete="CASCADE"), nullable=False)
+    producto_id = Column(Integer, ForeignKey("productos.id", ondelete="CASCADE"), nullable=False)
+    cantidad = Column(Integer, nullable=False)
+    ultimo_movimiento_id = Column(Integer, nullable=False)
+    fecha = Column(DateTime, default=datetime.utcnow, nullable=False)
+    
+    __table_args__ = (
+        Index('ix_snapshots_stock_par_fecha', 'vendedor_id', 'producto_id', 'fecha'),
+        Index('ix_snapshots_stock_ultimo_movimiento', 'ultimo_movimiento_id'),
+    )
@@ -4,7 +4,7 @@ Schemas para el sistema de inventario - Compatible con Pydantic v2
 """
 
 from pydantic import BaseModel, Field
-from typing import Optional
+from typing import List, Optional
 from datetime import datetime
 from decimal import Decimal
 
@@ -82,6 +82,10 @@ class StockCreate(BaseModel):
 class StockUpdate(BaseModel):
     cantidad_actual: int = Field(..., ge=0)
 
+class StockLoteCreate(BaseModel):
+    """Varias asignaciones que se aplican juntas (todas o ninguna)"""
+    items: List[StockCreate] = Field(..., min_length=1, max_length=1000)
+
 class StockResponse(StockBase):
     id: int
     ultima_actualizacion: datetime
@@ -103,6 +107,10 @@ class VentaBase(BaseModel):
 class VentaCreate(VentaBase):
     creado_por: Optional[int] = None
 
+class VentaLoteCreate(BaseModel):
+    """Varias ventas que se registran juntas (todas o ninguna)"""
+    items: List[VentaCreate] = Field(..., min_length=1, max_length=1000)
+
 class VentaUpdate(BaseModel):
     cantidad: Optional[int] = Field(None, gt=0)
     precio_venta: Optional[Decimal] = None
@@ -161,4 +169,25 @@ class AjusteResponse(AjusteBase):
     producto: Optional[ProductoResponse] = None
     
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+# ================ MOVIMIENTOS DE STOCK ================
+
+class MovimientoStockResponse(BaseModel):
+    id: int
+    vendedor_id: int
+    producto_id: int
+    cantidad: int
+    motivo: str
+    referencia_id: Optional[int] = None
+    fecha: datetime
+    
+    class Config:
+        from_attributes = True
+
+class StockHistoricoResponse(BaseModel):
+    vendedor_id: int
+    producto_id: int
+    cantidad: int
+    snapshot: Optional[datetime] = None
+    movimientos: int
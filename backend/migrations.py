@@ -0,0 +1,281 @@
+# backend/migrations.py
+"""
+Migraciones idempotentes que se aplican al arrancar.
+
+create_all() solo crea tablas nuevas; los índices y columnas que se agregan a
+tablas existentes se declaran aquí. Cada sentencia corre en su propia
+transacción y si falla (ya existe, motor sin soporte) se registra y se sigue.
+"""
+
+from sqlalchemy import inspect, text
+
+# (tabla, columna, tipo SQL) - se agregan solo si no existen
+COLUMNS = [
+    ("conversations", "message_count", "INTEGER NOT NULL DEFAULT 0"),
+    ("conversations", "last_message_at", "TIMESTAMP"),
+    ("conversations", "last_user_message_at", "TIMESTAMP"),
+    ("conversations", "last_role", "VARCHAR(20)"),
+]
+
+# (descripción, sentencia SQL, dialectos donde aplica o None para todos)
+MIGRATIONS = [
+    (
+        "Índice de mensajes por conversación",
+        "CREATE INDEX IF NOT EXISTS ix_messages_conversation_id ON messages (conversation_id, id)",
+        None
+    ),
+    (
+        "Índice de conversaciones por último mensaje",
+        "CREATE INDEX IF NOT EXISTS ix_conversations_last_message_at ON conversations (last_message_at)",
+        None
+    ),
+    (
+        "Índice de conversaciones por fecha de creación",
+        "CREATE INDEX IF NOT EXISTS ix_conversations_created_at ON conversations (created_at)",
+        None
+    ),
+    (
+        "Índice de mensajes por fecha",
+        "CREATE INDEX IF NOT EXISTS ix_messages_timestamp ON messages (timestamp)",
+        None
+    ),
+    (
+        "Índice de leads por fecha de creación",
+        "CREATE INDEX IF NOT EXISTS ix_leads_created_at ON leads (created_at)",
+        None
+    ),
+    # Paginación por cursor: (columna de orden, id)
+    (
+        "Índice del listado de conversaciones por última interacción",
+        "CREATE INDEX IF NOT EXISTS ix_conversations_last_interaction_id ON conversations (last_interaction, id)",
+        None
+    ),
+    (
+        "Índice del listado de conversaciones por último mensaje",
+        "CREATE INDEX IF NOT EXISTS ix_conversations_last_message_at_id ON conversations (last_message_at, id)",
+        None
+    ),
+    (
+        "Índice del listado de conversaciones por fecha de creación",
+        "CREATE INDEX IF NOT EXISTS ix_conversations_created_at_id ON conversations (created_at, id)",
+        None
+    ),
+    (
+        "Índice del listado de leads",
+        "CREATE INDEX IF NOT EXISTS ix_leads_interest_updated_id ON leads (interest_level, updated_at, id)",
+        None
+    ),
+    (
+        "Índice del listado de distribuidores",
+        "CREATE INDEX IF NOT EXISTS ix_distributors_created_at_id ON distributors (created_at, id)",
+        None
+    ),
+    (
+        "Índice del listado de ventas",
+        "CREATE INDEX IF NOT EXISTS ix_ventas_vendedor_fecha_venta_id ON ventas_vendedor (fecha_venta, id)",
+        None
+    ),
+    # Outbox: la reserva busca la fila pendiente anterior del mismo teléfono
+    (
+        "Índice del outbox por teléfono",
+        "CREATE INDEX IF NOT EXISTS ix_outbound_messages_phone_status_id ON outbound_messages (phone_number, status, id)",
+        None
+    ),
+    # Búsqueda: índices de trigramas para ILIKE '%term%' (services/search.py)
+    (
+        "Extensión pg_trgm",
+        "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+        ("postgresql",)
+    ),
+    (
+        "Índice de búsqueda conversations.phone_number",
+        "CREATE INDEX IF NOT EXISTS ix_conversations_phone_number_trgm ON conversations USING gin (phone_number gin_trgm_ops)",
+        ("postgresql",)
+    ),
+    (
+        "Índice de búsqueda conversations.user_name",
+        "CREATE INDEX IF NOT EXISTS ix_conversations_user_name_trgm ON conversations USING gin (user_name gin_trgm_ops)",
+        ("postgresql",)
+    ),
+    (
+        "Índice de búsqueda leads.phone_number",
+        "CREATE INDEX IF NOT EXISTS ix_leads_phone_number_trgm ON leads USING gin (phone_number gin_trgm_ops)",
+        ("postgresql",)
+    ),
+    (
+        "Índice de búsqueda leads.user_name",
+        "CREATE INDEX IF NOT EXISTS ix_leads_user_name_trgm ON leads USING gin (user_name gin_trgm_ops)",
+        ("postgresql",)
+    ),
+    (
+        "Índice de búsqueda leads.email",
+        "CREATE INDEX IF NOT EXISTS ix_leads_email_trgm ON leads USING gin (email gin_trgm_ops)",
+        ("postgresql",)
+    ),
+    (
+        "Índice de búsqueda distributors.nombres",
+        "CREATE INDEX IF NOT EXISTS ix_distributors_nombres_trgm ON distributors USING gin (nombres gin_trgm_ops)",
+        ("postgresql",)
+    ),
+    (
+        "Índice de búsqueda distributors.apellidos",
+        "CREATE INDEX IF NOT EXISTS ix_distributors_apellidos_trgm ON distributors USING gin (apellidos gin_trgm_ops)",
+        ("postgresql",)
+    ),
+    (
+        "Índice de búsqueda distributors.telefono",
+        "CREATE INDEX IF NOT EXISTS ix_distributors_telefono_trgm ON distributors USING gin (telefono gin_trgm_ops)",
+        ("postgresql",)
+    ),
+    (
+        "Índice de búsqueda distributors.email",
+        "CREATE INDEX IF NOT EXISTS ix_distributors_email_trgm ON distributors USING gin (email gin_trgm_ops)",
+        ("postgresql",)
+    ),
+    (
+        "Índice de búsqueda distributors.usuario",
+        "CREATE INDEX IF NOT EXISTS ix_distributors_usuario_trgm ON distributors USING gin (usuario gin_trgm_ops)",
+        ("postgresql",)
+    ),
+    (
+        "Índice de búsqueda vendedores.nombre",
+        "CREATE INDEX IF NOT EXISTS ix_vendedores_nombre_trgm ON vendedores USING gin (nombre gin_trgm_ops)",
+        ("postgresql",)
+    ),
+    (
+        "Índice de búsqueda vendedores.telefono",
+        "CREATE INDEX IF NOT EXISTS ix_vendedores_telefono_trgm ON vendedores USING gin (telefono gin_trgm_ops)",
+        ("postgresql",)
+    ),
+    (
+        "Índice de búsqueda vendedores.email",
+        "CREATE INDEX IF NOT EXISTS ix_vendedores_email_trgm ON vendedores USING gin (email gin_trgm_ops)",
+        ("postgresql",)
+    ),
+    (
+        "Índice de búsqueda productos.nombre",
+        "CREATE INDEX IF NOT EXISTS ix_productos_nombre_trgm ON productos USING gin (nombre gin_trgm_ops)",
+        ("postgresql",)
+    ),
+    (
+        "Índice de búsqueda productos.codigo",
+        "CREATE INDEX IF NOT EXISTS ix_productos_codigo_trgm ON productos USING gin (codigo gin_trgm_ops)",
+        ("postgresql",)
+    ),
+    (
+        "Índice de búsqueda productos.descripcion",
+        "CREATE INDEX IF NOT EXISTS ix_productos_descripcion_trgm ON productos USING gin (descripcion gin_trgm_ops)",
+        ("postgresql",)
+    ),
+    # Texto completo de mensajes: misma expresión que services/search.message_match
+    (
+        "Índice de texto completo de mensajes",
+        "CREATE INDEX IF NOT EXISTS ix_messages_content_fts ON messages "
+        "USING gin (to_tsvector('spanish'::regconfig, content))",
+        ("postgresql",)
+    ),
+    # El stock no puede quedar negativo (NOT VALID: no revisa filas anteriores)
+    (
+        "Restricción de stock no negativo",
+        """
+        DO $$ BEGIN
+            IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conname = 'ck_stock_vendedores_cantidad_actual') THEN
+                ALTER TABLE stock_vendedores ADD CONSTRAINT ck_stock_vendedores_cantidad_actual
+                    CHECK (cantidad_actual >= 0) NOT VALID;
+            END IF;
+        END $$
+        """,
+        ("postgresql",)
+    ),
+    # Marca de agua de los snapshots de stock (StockLedgerRepository.take_snapshots)
+    (
+        "Índice de snapshots de stock por último movimiento",
+        "CREATE INDEX IF NOT EXISTS ix_snapshots_stock_ultimo_movimiento ON snapshots_stock (ultimo_movimiento_id)",
+        None
+    ),
+    # Saldo inicial del libro de movimientos de stock (solo si está vacío).
+    # Con varios workers arrancando a la vez dos procesos podrían ver el libro
+    # vacío: en PostgreSQL el candado consultivo serializa la carga y el
+    # INSERT (nueva instantánea) ve la del otro; en SQLite el INSERT toma el
+    # candado de escritura antes de leer.
+    (
+        "Saldo inicial de movimientos de stock",
+        """
+        DO $$ BEGIN
+            PERFORM pg_advisory_xact_lock(hashtext('movimientos_stock_saldo_inicial'));
+            INSERT INTO movimientos_stock (vendedor_id, producto_id, cantidad, motivo, fecha)
+            SELECT vendedor_id, producto_id, cantidad_actual, 'inicial', CURRENT_TIMESTAMP
+            FROM stock_vendedores
+            WHERE NOT EXISTS (SELECT 1 FROM movimientos_stock);
+        END $$
+        """,
+        ("postgresql",)
+    ),
+    (
+        "Saldo inicial de movimientos de stock",
+        """
+        INSERT INTO movimientos_stock (vendedor_id, producto_id, cantidad, motivo, fecha)
+        SELECT vendedor_id, producto_id, cantidad_actual, 'inicial', CURRENT_TIMESTAMP
+        FROM stock_vendedores
+        WHERE NOT EXISTS (SELECT 1 FROM movimientos_stock)
+        """,
+        ("sqlite",)
+    ),
+    # Carga inicial del resumen diario de ventas (solo si la tabla está vacía),
+    # serializada entre workers igual que el saldo inicial de stock
+    (
+        "Resumen diario de ventas",
+        """
+        DO $$ BEGIN
+            PERFORM pg_advisory_xact_lock(hashtext('ventas_diarias_carga_inicial'));
+            INSERT INTO ventas_diarias (fecha, vendedor_id, producto_id, num_ventas, unidades, valor)
+            SELECT CAST(fecha_venta AS DATE), vendedor_id, producto_id,
+                   COUNT(id), SUM(cantidad), SUM(cantidad * COALESCE(precio_venta, 0))
+            FROM ventas_vendedor
+            WHERE NOT EXISTS (SELECT 1 FROM ventas_diarias)
+            GROUP BY CAST(fecha_venta AS DATE), vendedor_id, producto_id;
+        END $$
+        """,
+        ("postgresql",)
+    ),
+    (
+        "Resumen diario de ventas",
+        """
+        INSERT INTO ventas_diarias (fecha, vendedor_id, producto_id, num_ventas, unidades, valor)
+        SELECT date(fecha_venta), vendedor_id, producto_id,
+               COUNT(id), SUM(cantidad), SUM(cantidad * COALESCE(precio_venta, 0))
+        FROM ventas_vendedor
+        WHERE NOT EXISTS (SELECT 1 FROM ventas_diarias)
+        GROUP BY date(fecha_venta), vendedor_id, producto_id
+        """,
+        ("sqlite",)
+    ),
+]
+
+
+def run_migrations(engine):
+    """Aplica las migraciones pendientes sobre el engine dado"""
+    dialect = engine.dialect.name
+    
+    existing = {}
+    for table, column, column_type in COLUMNS:
+        if table not in existing:
+            existing[table] = {c["name"] for c in inspect(engine).get_columns(table)}
+        if column in existing[table]:
+            continue
+        try:
+            with engine.begin() as connection:
+                connection.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}"))
+            existing[table].add(column)
+            print(f"✅ Columna {table}.{column} agregada")
+        except Exception as e:
+            print(f"⚠️ No se pudo agregar {table}.{column}: {e}")
+    
+    for description, statement, dialects in MIGRATIONS:
+        if dialects and dialect not in dialects:
+            continue
+        try:
+            with engine.begin() as connection:
+                connection.execute(text(statement))
+        except Exception as e:
+            print(f"⚠️ Migración omitida ({description}): {e}")
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Date
+from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Date, Index, JSON, UniqueConstraint
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from database import Base
@@ -14,9 +14,22 @@ class Conversation(Base):
     status = Column(String(50), default="nuevo")
     profile_type = Column(String(50), default="otro")
     last_interaction = Column(DateTime, default=datetime.utcnow)
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+    
+    # Contadores desnormalizados (los mantiene el chatbot al guardar mensajes)
+    message_count = Column(Integer, nullable=False, default=0, server_default="0")
+    last_message_at = Column(DateTime, index=True)
+    last_user_message_at = Column(DateTime)
+    last_role = Column(String(20))
     
     messages = relationship("Message", back_populates="conversation")
+    
+    # Índices del listado paginado por cursor (columna de orden, id)
+    __table_args__ = (
+        Index("ix_conversations_last_interaction_id", "last_interaction", "id"),
+        Index("ix_conversations_last_message_at_id", "last_message_at", "id"),
+        Index("ix_conversations_created_at_id", "created_at", "id"),
+    )
 
 class Message(Base):
     __tablename__ = "messages"
@@ -25,9 +38,13 @@ class Message(Base):
     conversation_id = Column(Integer, ForeignKey("conversations.id"), nullable=False)
     role = Column(String(20), nullable=False)
     content = Column(Text, nullable=False)
-    timestamp = Column(DateTime, default=datetime.utcnow)
+    timestamp = Column(DateTime, default=datetime.utcnow, index=True)
     
     conversation = relationship("Conversation", back_populates="messages")
+    
+    __table_args__ = (
+        Index("ix_messages_conversation_id", "conversation_id", "id"),
+    )
 
 class Lead(Base):
     __tablename__ = "leads"
@@ -40,8 +57,98 @@ class Lead(Base):
     interest_level = Column(Integer, default=5)
     status = Column(String(50), default="nuevo")
     notes = Column(Text)
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
     updated_at = Column(DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        Index("ix_leads_interest_updated_id", "interest_level", "updated_at", "id"),
+    )
+
+class ProcessedMessage(Base):
+    """IDs de mensajes de WhatsApp ya procesados (deduplicación compartida)"""
+    __tablename__ = "processed_messages"
+    
+    message_id = Column(String(128), primary_key=True)
+    processed_at = Column(DateTime, default=datetime.utcnow, nullable=False, index=True)
+
+class OutboundMessage(Base):
+    """
+    Outbox de envíos a WhatsApp.
+
+    El chatbot escribe aquí cada respuesta en la misma transacción que el
+    mensaje, y el despachador (services/outbox.py) la envía y reintenta
+    hasta entregarla. next_attempt_at es a la vez el momento del próximo
+    intento y el plazo de reserva mientras un worker la está enviando.
+    """
+    __tablename__ = "outbound_messages"
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    phone_number = Column(String(20), nullable=False)
+    payload = Column(JSON, nullable=False)  # cuerpo del POST a la Graph API
+    message_id = Column(Integer, ForeignKey("messages.id"))
+    status = Column(String(20), nullable=False, default="pending")  # pending | sent | failed
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    last_error = Column(Text)
+    wa_message_id = Column(String(128))
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    sent_at = Column(DateTime)
+    
+    __table_args__ = (
+        Index("ix_outbound_messages_status_next_attempt", "status", "next_attempt_at"),
+        Index("ix_outbound_messages_phone_status_id", "phone_number", "status", "id"),
+    )
+
+class Campaign(Base):
+    """
+    Difusión de una plantilla a los leads que cumplen los filtros.
+
+    El runner (services/campaigns.py) recorre la audiencia por id de lead y
+    guarda en last_lead_id el punto hasta el que todo quedó registrado: al
+    reanudar se sigue desde ahí. lease_owner y lease_until reservan la
+    campaña para una sola instancia del servidor mientras la envía.
+    """
+    __tablename__ = "campaigns"
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    name = Column(String(200), nullable=False)
+    template_name = Column(String(200), nullable=False)
+    language = Column(String(10), nullable=False, default="es")
+    parameters = Column(JSON)  # textos del cuerpo de la plantilla
+    filters = Column(JSON)  # status, profile_type, min_interest, max_interest
+    status = Column(String(20), nullable=False, default="draft")  # draft | running | paused | completed | cancelled
+    total_recipients = Column(Integer)
+    sent_count = Column(Integer, nullable=False, default=0)
+    failed_count = Column(Integer, nullable=False, default=0)
+    last_lead_id = Column(Integer, nullable=False, default=0)
+    lease_owner = Column(String(64))
+    lease_until = Column(DateTime)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    started_at = Column(DateTime)
+    finished_at = Column(DateTime)
+    
+    __table_args__ = (
+        Index("ix_campaigns_status_lease_until", "status", "lease_until"),
+    )
+
+class CampaignRecipient(Base):
+    """Resultado del envío de una campaña a un lead (una fila por lead)"""
+    __tablename__ = "campaign_recipients"
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    campaign_id = Column(Integer, ForeignKey("campaigns.id"), nullable=False)
+    lead_id = Column(Integer, nullable=False)
+    phone_number = Column(String(20), nullable=False)
+    status = Column(String(20), nullable=False)  # sent | failed
+    wa_message_id = Column(String(128))
+    error = Column(Text)
+    attempts = Column(Integer, nullable=False, default=1)
+    sent_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    
+    __table_args__ = (
+        UniqueConstraint("campaign_id", "lead_id", name="uq_campaign_recipients_campaign_lead"),
+        Index("ix_campaign_recipients_campaign_status_id", "campaign_id", "status", "id"),
+    )
 
 # =================== MODELOS DEL ADMIN (NUEVOS) ===================
 
@@ -83,6 +190,10 @@ class Distributor(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
+    __table_args__ = (
+        Index("ix_distributors_created_at_id", "created_at", "id"),
+    )
+    
     def to_dict(self, include_sensitive=False):
         """Convierte el modelo a diccionario"""
         data = {
@@ -0,0 +1,159 @@
+# backend/repositories/campaign_repository.py
+"""Campañas de difusión: audiencia, reserva y checkpoints (campaigns, campaign_recipients)"""
+
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+from sqlalchemy import exists, func, insert, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models import Campaign, CampaignRecipient, Lead
+
+
+def audience_filters(filters: Optional[dict]) -> list:
+    """
+    Condiciones sobre leads a partir de los filtros guardados en la campaña.
+
+    status y profile_type son listas de valores aceptados; min_interest y
+    max_interest acotan interest_level. Un filtro ausente no restringe.
+    """
+    filters = filters or {}
+    conditions = []
+    if filters.get("status"):
+        conditions.append(Lead.status.in_(filters["status"]))
+    if filters.get("profile_type"):
+        conditions.append(Lead.profile_type.in_(filters["profile_type"]))
+    if filters.get("min_interest") is not None:
+        conditions.append(Lead.interest_level >= filters["min_interest"])
+    if filters.get("max_interest") is not None:
+        conditions.append(Lead.interest_level <= filters["max_interest"])
+    return conditions
+
+
+class CampaignRepository:
+    """
+    Operaciones del runner de campañas.
+
+    claim() reserva una campaña en curso para una instancia (lease_owner)
+    hasta lease_until, con SELECT ... FOR UPDATE SKIP LOCKED como el outbox.
+    checkpoint() registra en una sola transacción los resultados del tramo,
+    los contadores y el último lead hasta el que todo quedó registrado, y
+    renueva la reserva: si el proceso muere, otra instancia (o el mismo al
+    reiniciar) retoma desde ese punto cuando la reserva vence.
+    """
+
+    def __init__(self, db: AsyncSession):
+        self.db = db
+
+    async def count_audience(self, filters: Optional[dict]) -> int:
+        return await self.db.scalar(select(func.count(Lead.id)).where(*audience_filters(filters)))
+
+    async def audience_page(self, campaign: Campaign, after_lead_id: int, limit: int) -> list:
+        """
+        Siguiente tramo de destinatarios pendientes (keyset por id de lead).
+
+        Se excluyen los leads que ya tienen resultado registrado más allá del
+        checkpoint (terminaron fuera de orden antes de una interrupción).
+        """
+        already_sent = exists().where(
+            CampaignRecipient.campaign_id == campaign.id,
+            CampaignRecipient.lead_id == Lead.id
+        )
+        return (await self.db.execute(
+            select(Lead.id, Lead.phone_number)
+            .where(Lead.id > after_lead_id, ~already_sent, *audience_filters(campaign.filters))
+            .order_by(Lead.id)
+            .limit(limit)
+        )).all()
+
+    async def claim(self, owner: str, lease_seconds: float) -> Optional[Campaign]:
+        """Reserva la campaña en curso más antigua que nadie tenga reservada y confirma"""
+        now = datetime.utcnow()
+        available = or_(Campaign.lease_until.is_(None), Campaign.lease_until < now)
+        campaign_id = await self.db.scalar(
+            select(Campaign.id)
+            .where(Campaign.status == "running", available)
+            .order_by(Campaign.id)
+            .limit(1)
+            .with_for_update(skip_locked=True)
+        )
+        if campaign_id is None:
+            await self.db.commit()
+            return None
+
+        campaign = await self.db.scalar(
+            update(Campaign)
+            .where(Campaign.id == campaign_id, Campaign.status == "running", available)
+            .values(
+                lease_owner=owner,
+                lease_until=now + timedelta(seconds=lease_seconds),
+                started_at=func.coalesce(Campaign.started_at, now)
+            )
+            .returning(Campaign)
+            .execution_options(synchronize_session=False)
+        )
+        if campaign is not None and campaign.total_recipients is None:
+            campaign.total_recipients = await self.count_audience(campaign.filters)
+            await self.db.execute(
+                update(Campaign)
+                .where(Campaign.id == campaign.id)
+                .values(total_recipients=campaign.total_recipients)
+            )
+        await self.db.commit()
+        return campaign
+
+    async def checkpoint(
+        self,
+        campaign_id: int,
+        owner: str,
+        last_lead_id: int,
+        results: List[dict],
+        lease_seconds: float
+    ) -> Optional[str]:
+        """
+        Registra un tramo de resultados con un INSERT multi-fila y confirma.
+
+        Returns:
+            Estado actual de la campaña (el admin pudo pausarla o cancelarla),
+            o None si la reserva ya no es de owner (no se registra nada)
+        """
+        sent = sum(1 for result in results if result["status"] == "sent")
+        status = await self.db.scalar(
+            update(Campaign)
+            .where(Campaign.id == campaign_id, Campaign.lease_owner == owner)
+            .values(
+                last_lead_id=last_lead_id,
+                sent_count=Campaign.sent_count + sent,
+                failed_count=Campaign.failed_count + (len(results) - sent),
+                lease_until=datetime.utcnow() + timedelta(seconds=lease_seconds)
+            )
+            .returning(Campaign.status)
+        )
+        if status is None:
+            await self.db.rollback()
+            return None
+        if results:
+            await self.db.execute(
+                insert(CampaignRecipient),
+                [{"campaign_id": campaign_id, **result} for result in results]
+            )
+        await self.db.commit()
+        return status
+
+    async def finish(self, campaign_id: int, owner: str):
+        """Marca la campaña como completada (si sigue en curso) y libera la reserva"""
+        await self.db.execute(
+            update(Campaign)
+            .where(Campaign.id == campaign_id, Campaign.lease_owner == owner, Campaign.status == "running")
+            .values(status="completed", finished_at=datetime.utcnow())
+        )
+        await self.release(campaign_id, owner)
+
+    async def release(self, campaign_id: int, owner: str):
+        """Libera la reserva para que se pueda retomar sin esperar a que venza"""
+        await self.db.execute(
+            update(Campaign)
+            .where(Campaign.id == campaign_id, Campaign.lease_owner == owner)
+            .values(lease_owner=None, lease_until=None)
+        )
+        await self.db.commit()
@@ -0,0 +1,184 @@
+# backend/repositories/chat_repository.py
+"""Acceso a datos del chatbot: conversaciones, leads y mensajes en pocas sentencias"""
+
+from datetime import datetime
+from typing import Dict, Iterable, List
+
+from sqlalchemy import case, func, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models import Conversation, Lead, Message
+
+
+class ChatRepository:
+    """
+    Escrituras del chatbot pensadas para lotes.
+
+    En PostgreSQL (y SQLite) usa INSERT ... ON CONFLICT, de modo que dos
+    mensajes simultáneos de un número nuevo no chocan con la restricción
+    única de phone_number: el segundo simplemente toma la fila existente.
+    """
+
+    def __init__(self, db: AsyncSession):
+        self.db = db
+        self.dialect = db.get_bind().dialect.name
+
+    def _upsert(self, model):
+        """Devuelve el insert con soporte ON CONFLICT del dialecto, o None"""
+        if self.dialect == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        elif self.dialect == "sqlite":
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        else:
+            return None
+        return dialect_insert(model)
+
+    async def upsert_conversations(self, phones: Iterable[str]) -> Dict[str, Conversation]:
+        """
+        Obtiene o crea las conversaciones de los teléfonos en una sola sentencia.
+
+        Returns:
+            Dict teléfono -> Conversation (objetos ORM de la sesión)
+        """
+        phones = sorted(set(phones))
+        if not phones:
+            return {}
+
+        now = datetime.utcnow()
+        stmt = self._upsert(Conversation)
+        if stmt is None:
+            return await self._get_or_create_conversations(phones, now)
+
+        stmt = stmt.values([
+            {
+                "phone_number": phone,
+                "status": "nuevo",
+                "profile_type": "otro",
+                "last_interaction": now,
+                "created_at": now
+            }
+            for phone in phones
+        ])
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[Conversation.phone_number],
+            set_={"last_interaction": stmt.excluded.last_interaction}
+        ).returning(Conversation)
+
+        conversations = (await self.db.scalars(
+            stmt, execution_options={"populate_existing": True}
+        )).all()
+        return {c.phone_number: c for c in conversations}
+
+    async def _get_or_create_conversations(self, phones: List[str], now: datetime) -> Dict[str, Conversation]:
+        """Alternativa sin ON CONFLICT: SELECT ... IN y alta de las faltantes"""
+        result = await self.db.scalars(
+            select(Conversation).where(Conversation.phone_number.in_(phones))
+        )
+        conversations = {c.phone_number: c for c in result.all()}
+        missing = [phone for phone in phones if phone not in conversations]
+        for phone in missing:
+            conversations[phone] = Conversation(
+                phone_number=phone,
+                status="nuevo",
+                profile_type="otro",
+                last_interaction=now
+            )
+            self.db.add(conversations[phone])
+        if missing:
+            await self.db.flush()
+        return conversations
+
+    async def upsert_leads(self, leads: Iterable[dict]):
+        """
+        Crea o actualiza leads en una sola sentencia.
+
+        Cada dict trae phone_number, user_name, profile_type e interest_level.
+        En un lead existente se conserva el mayor interés y el nombre previo
+        si ya tenía uno; profile_type solo se usa al crear.
+        """
+        now = datetime.utcnow()
+        rows = [
+            {
+                "phone_number": lead["phone_number"],
+                "user_name": lead.get("user_name"),
+                "profile_type": lead.get("profile_type"),
+                "interest_level": lead.get("interest_level", 5),
+                "status": "nuevo",
+                "created_at": now,
+                "updated_at": now
+            }
+            for lead in leads
+        ]
+        if not rows:
+            return
+
+        stmt = self._upsert(Lead)
+        if stmt is None:
+            await self._update_leads(rows, now)
+            return
+
+        stmt = stmt.values(rows)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[Lead.phone_number],
+            set_={
+                "interest_level": case(
+                    (Lead.interest_level > stmt.excluded.interest_level, Lead.interest_level),
+                    else_=stmt.excluded.interest_level
+                ),
+                "user_name": func.coalesce(Lead.user_name, stmt.excluded.user_name),
+                "updated_at": stmt.excluded.updated_at
+            }
+        )
+        await self.db.execute(stmt)
+
+    async def _update_leads(self, rows: List[dict], now: datetime):
+        """Alternativa sin ON CONFLICT para leads"""
+        phones = [row["phone_number"] for row in rows]
+        result = await self.db.scalars(select(Lead).where(Lead.phone_number.in_(phones)))
+        existing = {lead.phone_number: lead for lead in result.all()}
+        for row in rows:
+            lead = existing.get(row["phone_number"])
+            if not lead:
+                self.db.add(Lead(**row))
+                continue
+            lead.interest_level = max(lead.interest_level or 0, row["interest_level"])
+            lead.updated_at = now
+            if row["user_name"] and not lead.user_name:
+                lead.user_name = row["user_name"]
+
+    async def add_messages(self, messages: List[dict]) -> Dict[str, List[int]]:
+        """
+        Inserta todos los mensajes del lote con un INSERT multi-fila y
+        actualiza los contadores de cada conversación en la misma transacción.
+
+        message_count se incrementa en SQL (message_count + n), así dos
+        procesos que escriben a la vez en la misma conversación no pierden
+        mensajes del conteo.
+
+        Returns:
+            Dict rol -> ids de los mensajes de ese rol, en el orden de messages
+        """
+        ids_by_role: Dict[str, List[int]] = {}
+        if not messages:
+            return ids_by_role
+        ids = (await self.db.scalars(
+            insert(Message).returning(Message.id, sort_by_parameter_order=True), messages
+        )).all()
+        for message, message_id in zip(messages, ids):
+            ids_by_role.setdefault(message["role"], []).append(message_id)
+
+        by_conversation: Dict[int, List[dict]] = {}
+        for message in messages:
+            by_conversation.setdefault(message["conversation_id"], []).append(message)
+
+        for conversation_id, rows in by_conversation.items():
+            # La conversación ya está en la sesión (upsert_conversations): no hay SELECT
+            conversation = await self.db.get(Conversation, conversation_id)
+            last = max(rows, key=lambda m: m["timestamp"])
+            conversation.message_count = Conversation.message_count + len(rows)
+            conversation.last_message_at = last["timestamp"]
+            conversation.last_role = last["role"]
+            user_times = [m["timestamp"] for m in rows if m["role"] == "user"]
+            if user_times:
+                conversation.last_user_message_at = max(user_times)
+        return ids_by_role
@@ -0,0 +1,349 @@
+# backend/repositories/inventory_repository.py
+"""Movimientos de stock y mantenimiento del resumen diario de ventas (ventas_diarias)"""
+
+from datetime import datetime
+from decimal import Decimal
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import and_, delete, func, insert, select, tuple_, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from inventory.models.inventory import MovimientoStock, SnapshotStock, StockVendedor, VentaDiaria
+
+
+class StockRepository:
+    """
+    Cambios de stock con un UPDATE condicional atómico y su movimiento en el libro.
+
+    La disponibilidad se verifica en el WHERE del mismo UPDATE
+    (cantidad_actual >= n): dos ventas simultáneas no pueden pasar ambas la
+    verificación, la segunda no encuentra fila y se rechaza.
+    """
+
+    def __init__(self, db: AsyncSession):
+        self.db = db
+
+    async def move(
+        self,
+        vendedor_id: int,
+        producto_id: int,
+        delta: int,
+        motivo: Optional[str] = None,
+        referencia_id: Optional[int] = None
+    ) -> Optional[int]:
+        """
+        Suma delta a cantidad_actual (negativo = descuenta).
+
+        Args:
+            motivo: Si se indica, registra el movimiento en el libro. Sin
+                motivo el llamador debe registrarlo con record()
+
+        Returns:
+            La cantidad resultante, o None si no hay stock asignado o no alcanza
+        """
+        stmt = (
+            update(StockVendedor)
+            .where(
+                StockVendedor.vendedor_id == vendedor_id,
+                StockVendedor.producto_id == producto_id
+            )
+            .values(
+                cantidad_actual=StockVendedor.cantidad_actual + delta,
+                ultima_actualizacion=datetime.utcnow()
+            )
+            .returning(StockVendedor.cantidad_actual)
+        )
+        if delta < 0:
+            stmt = stmt.where(StockVendedor.cantidad_actual >= -delta)
+        cantidad = await self.db.scalar(stmt)
+        if cantidad is not None and motivo:
+            await self.record([{
+                "vendedor_id": vendedor_id,
+                "producto_id": producto_id,
+                "cantidad": delta,
+                "motivo": motivo,
+                "referencia_id": referencia_id
+            }])
+        return cantidad
+
+    async def record(self, movimientos: List[dict]):
+        """
+        Agrega movimientos al libro con un INSERT multi-fila.
+
+        Cada dict trae vendedor_id, producto_id, cantidad (con signo), motivo
+        y referencia_id. Debe llamarse en la transacción que cambia el stock.
+        """
+        if not movimientos:
+            return
+        now = datetime.utcnow()
+        await self.db.execute(
+            insert(MovimientoStock),
+            [{"fecha": now, "referencia_id": None, **movimiento} for movimiento in movimientos]
+        )
+
+    async def available(self, vendedor_id: int, producto_id: int) -> Optional[int]:
+        """Cantidad actual, o None si no hay stock asignado (para el mensaje de error)"""
+        return await self.db.scalar(
+            select(StockVendedor.cantidad_actual).where(
+                StockVendedor.vendedor_id == vendedor_id,
+                StockVendedor.producto_id == producto_id
+            )
+        )
+
+
+class StockLedgerRepository:
+    """Snapshots del libro de movimientos y consulta del stock a una fecha"""
+
+    def __init__(self, db: AsyncSession):
+        self.db = db
+
+    async def take_snapshots(self, batch_size: int = 500) -> int:
+        """
+        Toma un snapshot de cada par con movimientos desde la corrida anterior.
+
+        La marca de agua es el mayor ultimo_movimiento_id ya fotografiado
+        (índice ix_snapshots_stock_ultimo_movimiento): solo se leen los
+        movimientos con id mayor, así el costo depende de lo nuevo y no del
+        tamaño del libro. Un movimiento de id menor confirmado después de la
+        corrida anterior queda en la cola de su par hasta su próximo snapshot;
+        stock_at sigue siendo exacto porque suma la cola de cada par.
+
+        Por tramo se bloquean las filas de stock (FOR UPDATE): todo cambio de
+        stock actualiza esa fila, así mientras dura el bloqueo no hay
+        movimientos en curso y cantidad_actual coincide exactamente con el
+        último movimiento confirmado del par.
+
+        Returns:
+            Cantidad de snapshots creados
+        """
+        marca = await self.db.scalar(select(func.max(SnapshotStock.ultimo_movimiento_id))) or 0
+        # Rango sobre la clave primaria; los pares repetidos se descartan aquí
+        pendientes = list(dict.fromkeys((await self.db.execute(
+            select(MovimientoStock.vendedor_id, MovimientoStock.producto_id)
+            .where(MovimientoStock.id > marca)
+            .order_by(MovimientoStock.id)
+        )).all()))
+
+        total = 0
+        for start in range(0, len(pendientes), batch_size):
+            pares = [tuple(par) for par in pendientes[start:start + batch_size]]
+            bloqueadas = (await self.db.execute(
+                select(StockVendedor.vendedor_id, StockVendedor.producto_id, StockVendedor.cantidad_actual)
+                .where(tuple_(StockVendedor.vendedor_id, StockVendedor.producto_id).in_(pares))
+                .order_by(StockVendedor.id)
+                .with_for_update()
+            )).all()
+            stock = {(vendedor_id, producto_id): cantidad for vendedor_id, producto_id, cantidad in bloqueadas}
+            # Último movimiento de cada par: una búsqueda en ix_movimientos_stock_par_id
+            ultimo_movimiento = select(func.max(MovimientoStock.id)).where(
+                MovimientoStock.vendedor_id == StockVendedor.vendedor_id,
+                MovimientoStock.producto_id == StockVendedor.producto_id
+            ).scalar_subquery()
+            ultimos_movimientos = (await self.db.execute(
+                select(StockVendedor.vendedor_id, StockVendedor.producto_id, ultimo_movimiento)
+                .where(tuple_(StockVendedor.vendedor_id, StockVendedor.producto_id).in_(pares))
+            )).all()
+            now = datetime.utcnow()
+            filas = [
+                {
+                    "vendedor_id": vendedor_id,
+                    "producto_id": producto_id,
+                    "cantidad": stock[(vendedor_id, producto_id)],
+                    "ultimo_movimiento_id": ultimo,
+                    "fecha": now
+                }
+                for vendedor_id, producto_id, ultimo in ultimos_movimientos
+                if (vendedor_id, producto_id) in stock
+            ]
+            if filas:
+                await self.db.execute(insert(SnapshotStock), filas)
+            await self.db.commit()
+            total += len(filas)
+        return total
+
+    async def stock_at(
+        self,
+        fecha: datetime,
+        vendedor_id: Optional[int] = None,
+        producto_id: Optional[int] = None
+    ) -> List[dict]:
+        """
+        Stock de cada par a la fecha dada: el último snapshot anterior más
+        los movimientos posteriores a él hasta esa fecha.
+
+        Se recorre el catálogo de pares (stock_vendedores: todo movimiento
+        cambia la fila de su par). Por par, el snapshot sale de una búsqueda
+        en ix_snapshots_stock_par_fecha y la cola es un rango
+        (vendedor_id, producto_id, id > ultimo_movimiento_id) sobre
+        ix_movimientos_stock_par_id; los pares sin snapshot a esa fecha suman
+        su cola desde el principio. El libro nunca se recorre entero.
+
+        Returns:
+            Lista de {vendedor_id, producto_id, cantidad, snapshot, movimientos}
+            donde snapshot es la fecha del snapshot usado (o None) y
+            movimientos la cantidad de movimientos sumados después de él
+        """
+        filters = []
+        if vendedor_id:
+            filters.append(StockVendedor.vendedor_id == vendedor_id)
+        if producto_id:
+            filters.append(StockVendedor.producto_id == producto_id)
+        ultimo_snapshot = select(SnapshotStock.id).where(
+            SnapshotStock.vendedor_id == StockVendedor.vendedor_id,
+            SnapshotStock.producto_id == StockVendedor.producto_id,
+            SnapshotStock.fecha <= fecha
+        ).order_by(SnapshotStock.fecha.desc(), SnapshotStock.id.desc()).limit(1).scalar_subquery()
+        pares = select(
+            StockVendedor.vendedor_id,
+            StockVendedor.producto_id,
+            ultimo_snapshot.label("snapshot_id")
+        ).where(*filters).subquery()
+
+        # Solo la cola del libro: movimientos del par posteriores a su snapshot
+        cola = and_(
+            MovimientoStock.vendedor_id == pares.c.vendedor_id,
+            MovimientoStock.producto_id == pares.c.producto_id,
+            MovimientoStock.id > func.coalesce(SnapshotStock.ultimo_movimiento_id, 0),
+            MovimientoStock.fecha <= fecha
+        )
+        filas = (await self.db.execute(
+            select(
+                pares.c.vendedor_id,
+                pares.c.producto_id,
+                SnapshotStock.cantidad,
+                SnapshotStock.fecha,
+                select(func.sum(MovimientoStock.cantidad)).where(cola).scalar_subquery(),
+                select(func.count(MovimientoStock.id)).where(cola).scalar_subquery()
+            )
+            .outerjoin(SnapshotStock, SnapshotStock.id == pares.c.snapshot_id)
+            .order_by(pares.c.vendedor_id, pares.c.producto_id)
+        )).all()
+
+        return [
+            {
+                "vendedor_id": vendedor_id,
+                "producto_id": producto_id,
+                "cantidad": (cantidad or 0) + int(suma or 0),
+                "snapshot": snapshot_fecha,
+                "movimientos": movimientos
+            }
+            for vendedor_id, producto_id, cantidad, snapshot_fecha, suma, movimientos in filas
+            # Pares que a esa fecha todavía no tenían stock
+            if snapshot_fecha is not None or movimientos
+        ]
+
+
+class SalesRollupRepository:
+    """
+    Suma o resta ventas en el resumen por día, vendedor y producto.
+
+    Los incrementos se hacen en SQL (columna + delta) con INSERT ... ON
+    CONFLICT, así dos ventas simultáneas del mismo día no se pisan. Debe
+    llamarse dentro de la misma transacción que escribe la venta.
+    """
+
+    def __init__(self, db: AsyncSession):
+        self.db = db
+        self.dialect = db.get_bind().dialect.name
+
+    def _upsert(self):
+        """Devuelve el insert con soporte ON CONFLICT del dialecto, o None"""
+        if self.dialect == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        elif self.dialect == "sqlite":
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        else:
+            return None
+        return dialect_insert(VentaDiaria)
+
+    async def add_sale(
+        self,
+        vendedor_id: int,
+        producto_id: int,
+        fecha_venta: Optional[datetime],
+        cantidad: int,
+        precio_venta: Optional[Decimal],
+        sign: int = 1
+    ):
+        """
+        Registra (sign=1) o descuenta (sign=-1) una venta en su día.
+
+        Args:
+            fecha_venta: Fecha de la venta (None = ahora, igual que el default de la tabla)
+            precio_venta: Precio unitario; sin precio la venta suma 0 al valor
+        """
+        await self.add_sales([{
+            "vendedor_id": vendedor_id,
+            "producto_id": producto_id,
+            "fecha_venta": fecha_venta,
+            "cantidad": cantidad,
+            "precio_venta": precio_venta
+        }], sign=sign)
+
+    async def add_sales(self, ventas: Iterable[dict], sign: int = 1):
+        """
+        Registra o descuenta varias ventas: se agrupan por día, vendedor y
+        producto y se aplican con un solo INSERT ... ON CONFLICT multi-fila.
+
+        Cada dict trae vendedor_id, producto_id, fecha_venta, cantidad y precio_venta.
+        """
+        deltas: Dict[tuple, dict] = {}
+        for venta in ventas:
+            key = (
+                (venta.get("fecha_venta") or datetime.utcnow()).date(),
+                venta["vendedor_id"],
+                venta["producto_id"]
+            )
+            delta = deltas.setdefault(key, {"num_ventas": 0, "unidades": 0, "valor": Decimal(0)})
+            delta["num_ventas"] += sign
+            delta["unidades"] += sign * venta["cantidad"]
+            delta["valor"] += sign * venta["cantidad"] * Decimal(venta.get("precio_venta") or 0)
+        if not deltas:
+            return
+
+        rows = [
+            {"fecha": fecha, "vendedor_id": vendedor_id, "producto_id": producto_id, **delta}
+            for (fecha, vendedor_id, producto_id), delta in sorted(deltas.items())
+        ]
+
+        stmt = self._upsert()
+        if stmt is None:
+            for row in rows:
+                key = {k: row[k] for k in ("fecha", "vendedor_id", "producto_id")}
+                await self._add_sale_fallback(key, {k: row[k] for k in ("num_ventas", "unidades", "valor")})
+        else:
+            stmt = stmt.values(rows)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[VentaDiaria.fecha, VentaDiaria.vendedor_id, VentaDiaria.producto_id],
+                set_={
+                    "num_ventas": VentaDiaria.num_ventas + stmt.excluded.num_ventas,
+                    "unidades": VentaDiaria.unidades + stmt.excluded.unidades,
+                    "valor": VentaDiaria.valor + stmt.excluded.valor
+                }
+            )
+            await self.db.execute(stmt)
+
+        if sign < 0:
+            # Un día sin ventas no necesita fila
+            await self.db.execute(
+                delete(VentaDiaria).where(
+                    tuple_(VentaDiaria.fecha, VentaDiaria.vendedor_id, VentaDiaria.producto_id).in_(
+                        [(row["fecha"], row["vendedor_id"], row["producto_id"]) for row in rows]
+                    ),
+                    VentaDiaria.num_ventas <= 0
+                ).execution_options(synchronize_session=False)
+            )
+
+    async def _add_sale_fallback(self, key: dict, delta: dict):
+        """Alternativa sin ON CONFLICT: SELECT ... FOR UPDATE y suma en Python"""
+        row = await self.db.scalar(
+            select(VentaDiaria).filter_by(**key).with_for_update()
+        )
+        if not row:
+            self.db.add(VentaDiaria(**key, **delta))
+            await self.db.flush()
+            return
+        row.num_ventas += delta["num_ventas"]
+        row.unidades += delta["unidades"]
+        row.valor += delta["valor"]
+        await self.db.flush()
@@ -0,0 +1,123 @@
+# backend/repositories/outbox_repository.py
+"""Outbox de mensajes salientes de WhatsApp (outbound_messages)"""
+
+from datetime import datetime, timedelta
+from typing import List
+
+from sqlalchemy import exists, insert, select, update
+from sqlalchemy.orm import aliased
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models import OutboundMessage
+
+
+class OutboxRepository:
+    """
+    Escritura y reserva de envíos pendientes.
+
+    add() se llama en la transacción que guarda el mensaje, así la respuesta
+    queda registrada para envío si y solo si el mensaje se confirmó.
+    claim() reparte los pendientes entre workers con SELECT ... FOR UPDATE
+    SKIP LOCKED: cada worker toma filas distintas sin esperar a los demás,
+    y de cada teléfono solo la más antigua sin resolver, así los mensajes
+    de un número salen en orden.
+    """
+
+    def __init__(self, db: AsyncSession):
+        self.db = db
+
+    async def add(self, messages: List[dict]):
+        """
+        Agrega envíos con un INSERT multi-fila (sin commit).
+
+        Cada dict trae phone_number, payload y opcionalmente message_id.
+        """
+        if not messages:
+            return
+        now = datetime.utcnow()
+        await self.db.execute(insert(OutboundMessage), [
+            {
+                "message_id": None,
+                **message,
+                "status": "pending",
+                "attempts": 0,
+                "next_attempt_at": now,
+                "created_at": now
+            }
+            for message in messages
+        ])
+
+    async def claim(self, limit: int, lease_seconds: float) -> List[OutboundMessage]:
+        """
+        Reserva hasta limit envíos vencidos y confirma la reserva.
+
+        La reserva corre next_attempt_at al final del plazo: si el worker
+        muere a mitad del envío, la fila vuelve a estar disponible al vencer.
+        El UPDATE repite la condición de vencimiento, así en motores sin
+        SKIP LOCKED (SQLite) dos workers tampoco reservan la misma fila.
+
+        Una fila no se reserva mientras su teléfono tenga otra anterior
+        pendiente (en espera de reintento o reservada por otro worker): hay
+        a lo sumo un envío en vuelo por número y siempre en orden de id. Si
+        esa primera fila está en backoff, el número queda en espera entero
+        hasta que se entregue o quede failed; el resto de los números no.
+        """
+        now = datetime.utcnow()
+        earlier = aliased(OutboundMessage)
+        earlier_pending = exists().where(
+            earlier.phone_number == OutboundMessage.phone_number,
+            earlier.status == "pending",
+            earlier.id < OutboundMessage.id
+        )
+        ids = (await self.db.scalars(
+            select(OutboundMessage.id)
+            .where(
+                OutboundMessage.status == "pending",
+                OutboundMessage.next_attempt_at <= now,
+                ~earlier_pending
+            )
+            .order_by(OutboundMessage.next_attempt_at, OutboundMessage.id)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+        )).all()
+        if not ids:
+            await self.db.commit()
+            return []
+
+        claimed = (await self.db.scalars(
+            update(OutboundMessage)
+            .where(
+                OutboundMessage.id.in_(ids),
+                OutboundMessage.status == "pending",
+                OutboundMessage.next_attempt_at <= now
+            )
+            .values(
+                next_attempt_at=now + timedelta(seconds=lease_seconds),
+                attempts=OutboundMessage.attempts + 1
+            )
+            .returning(OutboundMessage)
+            .execution_options(synchronize_session=False)
+        )).all()
+        await self.db.commit()
+        return sorted(claimed, key=lambda message: message.id)
+
+    async def mark_sent(self, outbound_id: int, wa_message_id: str):
+        await self.db.execute(
+            update(OutboundMessage)
+            .where(OutboundMessage.id == outbound_id)
+            .values(status="sent", wa_message_id=wa_message_id, sent_at=datetime.utcnow(), last_error=None)
+        )
+
+    async def mark_retry(self, outbound_id: int, delay_seconds: float, error: str):
+        await self.db.execute(
+            update(OutboundMessage)
+            .where(OutboundMessage.id == outbound_id)
+            .values(next_attempt_at=datetime.utcnow() + timedelta(seconds=delay_seconds), last_error=error)
+        )
+
+    async def mark_failed(self, outbound_id: int, error: str):
+        await self.db.execute(
+            update(OutboundMessage)
+            .where(OutboundMessage.id == outbound_id)
+            .values(status="failed", last_error=error)
+        )
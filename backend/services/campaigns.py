@@ -0,0 +1,283 @@
+# backend/services/campaigns.py
+"""Runner de campañas: envía plantillas a la audiencia con checkpoints"""
+
+import asyncio
+import logging
+import os
+import socket
+import uuid
+from collections import deque
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from models import Campaign
+from repositories.campaign_repository import CampaignRepository
+from services.whatsapp import PRIORITY_CAMPAIGN, WhatsAppService
+
+logger = logging.getLogger(__name__)
+
+
+class _CampaignRun:
+    """Estado de una campaña en curso dentro del runner"""
+
+    def __init__(self, campaign: Campaign, concurrency: int):
+        self.campaign = campaign
+        # Acotada: no se leen más destinatarios de los que se alcanzan a enviar
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=concurrency * 2)
+        self.issued: deque = deque()  # ids encolados, en orden, aún no cubiertos por el checkpoint
+        self.done: set = set()        # ids de issued que ya tienen resultado
+        self.results: list = []       # resultados sin registrar
+        self.last_lead_id = campaign.last_lead_id
+        self.flush_needed = asyncio.Event()
+        self.halted = False
+
+
+class CampaignRunner:
+    """
+    Envía las campañas en curso (status running) en segundo plano.
+
+    La audiencia se lee por tramos (keyset por id de lead) y pasa por una
+    cola acotada a concurrency workers que envían en el carril de campañas
+    del planificador, así las respuestas del chatbot nunca esperan detrás de
+    una difusión. Los resultados se registran por tramos (flush_size filas o
+    cada flush_interval segundos) junto con el checkpoint: el mayor id de
+    lead hasta el cual todos tienen resultado. La memoria no depende del
+    tamaño de la audiencia.
+
+    Al reanudar se sigue desde el checkpoint. Lo único que se puede repetir
+    tras una caída es lo que estaba en vuelo o enviado sin registrar (a lo
+    sumo un tramo); pausar, cancelar y stop() esperan los envíos en vuelo y
+    los registran antes de soltar la campaña.
+    """
+
+    def __init__(
+        self,
+        session_factory,
+        send: Callable[[Dict[str, Any], int], Awaitable[Dict[str, Any]]],
+        concurrency: int = 10,
+        flush_size: int = 200,
+        flush_interval: float = 2.0,
+        fetch_size: int = 500,
+        poll_interval: float = 5.0,
+        lease_seconds: float = 120.0,
+        max_attempts: int = 3,
+        retry_delay: float = 2.0
+    ):
+        self.session_factory = session_factory
+        self.send = send
+        self.concurrency = concurrency
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.fetch_size = fetch_size
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.owner = f"{socket.gethostname()[:40]}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._stopping = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None:
+            self._stopping.clear()
+            self._task = asyncio.create_task(self._run(), name="campaign-runner")
+            logger.info("CampaignRunner started")
+
+    async def stop(self, timeout: float = 30.0):
+        """Termina los envíos en vuelo, registra el checkpoint y suelta la campaña"""
+        if self._task is None:
+            return
+        self._stopping.set()
+        try:
+            await asyncio.wait_for(asyncio.shield(self._task), timeout=timeout)
+        except asyncio.TimeoutError:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+        logger.info("CampaignRunner stopped")
+
+    async def _run(self):
+        while not self._stopping.is_set():
+            campaign = None
+            try:
+                async with self.session_factory() as db:
+                    campaign = await CampaignRepository(db).claim(self.owner, self.lease_seconds)
+                if campaign is not None:
+                    await self.run_campaign(campaign)
+            except Exception as e:
+                logger.error(f"CampaignRunner failed: {e}")
+                campaign = None
+            # Con una campaña recién terminada se busca la siguiente sin esperar
+            if campaign is not None:
+                continue
+            try:
+                await asyncio.wait_for(self._stopping.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def run_campaign(self, campaign: Campaign) -> str:
+        """
+        Envía una campaña ya reservada hasta terminarla o detenerla.
+
+        Returns:
+            Estado con el que quedó: completed, paused, cancelled, running
+            (stop() del runner) o lost (otra instancia tomó la reserva)
+        """
+        logger.info(f"Campaign {campaign.id} running from lead {campaign.last_lead_id}")
+        run = _CampaignRun(campaign, self.concurrency)
+        producer = asyncio.create_task(self._produce(run))
+        workers = [asyncio.create_task(self._work(run)) for _ in range(self.concurrency)]
+        drained = asyncio.create_task(self._drained(run, producer))
+        status = "running"
+        try:
+            while not drained.done():
+                flush_needed = asyncio.create_task(run.flush_needed.wait())
+                await asyncio.wait(
+                    [drained, flush_needed], timeout=self.flush_interval, return_when=asyncio.FIRST_COMPLETED
+                )
+                flush_needed.cancel()
+                run.flush_needed.clear()
+
+                status = await self._flush(run)
+                if status != "running" or self._stopping.is_set() or self._failed(producer):
+                    self._halt(run, producer)
+            await drained
+            status = await self._flush(run)
+        except BaseException:
+            for task in (producer, drained, *workers):
+                task.cancel()
+            await asyncio.gather(producer, drained, *workers, return_exceptions=True)
+            # Lo que alcanzó a enviarse se registra igual, así no se repite al reanudar
+            try:
+                await self._flush(run)
+                async with self.session_factory() as db:
+                    await CampaignRepository(db).release(campaign.id, self.owner)
+            except Exception as e:
+                logger.error(f"Campaign {campaign.id} could not save its checkpoint: {e}")
+            raise
+        finally:
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+
+        if self._failed(producer):
+            async with self.session_factory() as db:
+                await CampaignRepository(db).release(campaign.id, self.owner)
+            raise producer.exception()
+        if status is None:
+            logger.warning(f"Campaign {campaign.id} lease lost, another instance took over")
+            return "lost"
+
+        async with self.session_factory() as db:
+            repository = CampaignRepository(db)
+            if status == "running" and not run.halted:
+                await repository.finish(campaign.id, self.owner)
+                status = "completed"
+            else:
+                await repository.release(campaign.id, self.owner)
+        logger.info(f"Campaign {campaign.id} {status} at lead {run.last_lead_id}")
+        return status
+
+    @staticmethod
+    def _failed(producer: asyncio.Task) -> bool:
+        return producer.done() and not producer.cancelled() and producer.exception() is not None
+
+    async def _produce(self, run: _CampaignRun):
+        """
+        Lee la audiencia por tramos de fetch_size, cada uno con su propia sesión.
+
+        Ninguna transacción de lectura queda abierta mientras se envía: la
+        cola llena frena la lectura sin retener un snapshot ni bloquear los
+        checkpoints.
+        """
+        last_lead_id = run.campaign.last_lead_id
+        while True:
+            async with self.session_factory() as db:
+                rows = await CampaignRepository(db).audience_page(run.campaign, last_lead_id, self.fetch_size)
+            if not rows:
+                return
+            for lead_id, phone_number in rows:
+                run.issued.append(lead_id)
+                await run.queue.put((lead_id, phone_number))
+            last_lead_id = rows[-1][0]
+
+    async def _drained(self, run: _CampaignRun, producer: asyncio.Task):
+        """Termina cuando el productor terminó y cada destinatario encolado tiene resultado"""
+        await asyncio.wait([producer])
+        await run.queue.join()
+
+    def _halt(self, run: _CampaignRun, producer: asyncio.Task):
+        """Deja de leer la audiencia y descarta lo encolado; lo que está en vuelo termina"""
+        if run.halted:
+            return
+        run.halted = True
+        producer.cancel()
+        while True:
+            try:
+                run.queue.get_nowait()
+            except asyncio.QueueEmpty:
+                break
+            run.queue.task_done()
+
+    async def _work(self, run: _CampaignRun):
+        while True:
+            lead_id, phone_number = await run.queue.get()
+            try:
+                run.results.append(await self._send(run.campaign, lead_id, phone_number))
+                run.done.add(lead_id)
+                if len(run.results) >= self.flush_size:
+                    run.flush_needed.set()
+            finally:
+                run.queue.task_done()
+
+    async def _send(self, campaign: Campaign, lead_id: int, phone_number: str) -> dict:
+        """Envía la plantilla a un lead; reintenta solo errores transitorios"""
+        payload = WhatsAppService.template_payload(
+            phone_number, campaign.template_name, campaign.parameters, campaign.language
+        )
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                result = await self.send(payload, PRIORITY_CAMPAIGN)
+            except Exception as e:
+                result = {"ok": False, "error": str(e) or type(e).__name__, "retryable": True}
+            if result["ok"] or not result.get("retryable") or attempt == self.max_attempts:
+                break
+            await asyncio.sleep(max(result.get("retry_after") or 0, self.retry_delay * 2 ** (attempt - 1)))
+
+        return {
+            "lead_id": lead_id,
+            "phone_number": phone_number,
+            "status": "sent" if result["ok"] else "failed",
+            "wa_message_id": result.get("message_id"),
+            "error": None if result["ok"] else result.get("error"),
+            "attempts": attempt,
+            "sent_at": datetime.utcnow()
+        }
+
+    async def _flush(self, run: _CampaignRun) -> Optional[str]:
+        """
+        Registra los resultados pendientes y avanza el checkpoint.
+
+        El checkpoint solo avanza sobre el prefijo de ids encolados que ya
+        tienen resultado: un envío lento no deja atrás a un lead sin registrar.
+        """
+        covered, last_lead_id = 0, run.last_lead_id
+        for lead_id in run.issued:
+            if lead_id not in run.done:
+                break
+            covered, last_lead_id = covered + 1, lead_id
+        batch = run.results[:]
+
+        async with self.session_factory() as db:
+            status = await CampaignRepository(db).checkpoint(
+                run.campaign.id, self.owner, last_lead_id, batch, self.lease_seconds
+            )
+        if status is None:
+            return None
+
+        # Los workers pudieron agregar resultados mientras se registraba el tramo
+        del run.results[:len(batch)]
+        for _ in range(covered):
+            run.done.discard(run.issued.popleft())
+        run.last_lead_id = last_lead_id
+        return status
@@ -0,0 +1,220 @@
+# backend/services/dedup.py
+"""Registro de IDs de mensajes ya procesados para descartar reenvíos de Meta"""
+
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Iterable, List, Optional
+
+from sqlalchemy import delete, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+logger = logging.getLogger(__name__)
+
+
+class MemoryDeduplicator:
+    """
+    Registro en memoria con expiración (TTL) y tamaño máximo.
+
+    Las entradas se guardan en orden de llegada; como el TTL es igual para
+    todas, las más antiguas siempre están al principio y se expiran o
+    desalojan de a una, sin vaciar todo el registro de golpe.
+    """
+
+    def __init__(self, ttl_seconds: int = 86400, max_entries: int = 50000):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, float]" = OrderedDict()
+
+    def _expire(self, now: float):
+        while self._entries:
+            message_id, expires_at = next(iter(self._entries.items()))
+            if expires_at > now:
+                break
+            self._entries.popitem(last=False)
+
+    def contains(self, message_id: str) -> bool:
+        """Indica si el mensaje ya fue procesado (sin marcarlo)"""
+        now = time.monotonic()
+        self._expire(now)
+        return message_id in self._entries
+
+    def check_and_mark(self, message_id: str) -> bool:
+        """
+        Marca el mensaje como procesado.
+
+        Returns:
+            bool: True si ya estaba registrado (es duplicado)
+        """
+        if self.contains(message_id):
+            return True
+        self._entries[message_id] = time.monotonic() + self.ttl_seconds
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return False
+
+    async def claim(self, db: AsyncSession, message_ids: Iterable[str]) -> List[str]:
+        """
+        Marca los IDs como procesados (db no se usa; misma interfaz que SqlDeduplicator).
+
+        Returns:
+            Los IDs que no estaban registrados, en orden
+        """
+        return [m for m in dict.fromkeys(message_ids) if not self.check_and_mark(m)]
+
+    def confirm(self, message_ids: Iterable[str]):
+        """Nada que confirmar: claim() ya los dejó registrados"""
+
+    def release(self, message_ids: Iterable[str]):
+        """Quita los IDs registrados por un claim() cuya transacción se revirtió"""
+        for message_id in message_ids:
+            self._entries.pop(message_id, None)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SqlDeduplicator:
+    """
+    Registro compartido en la tabla processed_messages.
+
+    Sirve para varios workers de uvicorn y sobrevive reinicios. claim()
+    inserta los IDs con la sesión del request, en la misma transacción que
+    los mensajes: si esa transacción se revierte, el registro también, y el
+    reintento de la cola (o un reenvío de Meta) se vuelve a procesar. La clave primaria sobre message_id
+    hace que solo el primer INSERT gane; delante hay una caché en memoria
+    con los IDs ya confirmados para no consultar la base con cada reenvío.
+    Los errores de la base se propagan: sin registro no hay deduplicación.
+    Los vencidos se eliminan con purge() desde una tarea periódica
+    (run_purge_loop).
+    """
+
+    def __init__(self, ttl_seconds: int = 86400, max_entries: int = 50000):
+        self.ttl_seconds = ttl_seconds
+        self._cache = MemoryDeduplicator(ttl_seconds, max_entries)
+
+    def contains(self, message_id: str) -> bool:
+        """Indica si el mensaje ya fue confirmado en este proceso (solo la caché local)"""
+        return self._cache.contains(message_id)
+
+    async def claim(self, db: AsyncSession, message_ids: Iterable[str]) -> List[str]:
+        """
+        Registra los IDs en la transacción de db, sin confirmarla.
+
+        Un registro vencido que nadie purgó todavía se toma de nuevo. Si otra
+        transacción está registrando el mismo ID, el INSERT espera a que
+        termine (PostgreSQL) y solo una de las dos lo obtiene.
+
+        Returns:
+            Los IDs registrados por esta transacción (los nuevos), en orden
+        """
+        from models import ProcessedMessage
+
+        candidates = [m for m in dict.fromkeys(message_ids) if not self._cache.contains(m)]
+        if not candidates:
+            return []
+
+        now = datetime.utcnow()
+        stmt = _dialect_insert(db, ProcessedMessage)
+        if stmt is None:
+            claimed = await self._claim_each(db, candidates, now)
+        else:
+            stmt = stmt.values([{"message_id": m, "processed_at": now} for m in candidates])
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[ProcessedMessage.message_id],
+                set_={"processed_at": stmt.excluded.processed_at},
+                where=ProcessedMessage.processed_at < self._cutoff()
+            ).returning(ProcessedMessage.message_id)
+            claimed = set((await db.scalars(stmt)).all())
+        return [m for m in candidates if m in claimed]
+
+    async def _claim_each(self, db: AsyncSession, message_ids: List[str], now: datetime) -> set:
+        """Alternativa sin ON CONFLICT: un SAVEPOINT por ID"""
+        from models import ProcessedMessage
+
+        claimed = set()
+        for message_id in message_ids:
+            try:
+                async with db.begin_nested():
+                    db.add(ProcessedMessage(message_id=message_id, processed_at=now))
+            except IntegrityError:
+                result = await db.execute(
+                    update(ProcessedMessage)
+                    .where(
+                        ProcessedMessage.message_id == message_id,
+                        ProcessedMessage.processed_at < self._cutoff()
+                    )
+                    .values(processed_at=now)
+                )
+                if result.rowcount == 0:
+                    continue
+            claimed.add(message_id)
+        return claimed
+
+    def confirm(self, message_ids: Iterable[str]):
+        """Anota en la caché los IDs cuya transacción ya se confirmó"""
+        for message_id in message_ids:
+            self._cache.check_and_mark(message_id)
+
+    def release(self, message_ids: Iterable[str]):
+        """Nada que deshacer: el rollback de la transacción quita el registro"""
+
+    async def purge(self, db: AsyncSession) -> int:
+        """Elimina los registros vencidos y confirma"""
+        from models import ProcessedMessage
+
+        result = await db.execute(
+            delete(ProcessedMessage).where(ProcessedMessage.processed_at < self._cutoff())
+        )
+        await db.commit()
+        return result.rowcount
+
+    def _cutoff(self) -> datetime:
+        return datetime.utcnow() - timedelta(seconds=self.ttl_seconds)
+
+
+def _dialect_insert(db: AsyncSession, model):
+    """Insert con soporte ON CONFLICT del dialecto de db, o None"""
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    else:
+        return None
+    return dialect_insert(model)
+
+
+async def run_purge_loop(deduplicator: SqlDeduplicator, session_factory, interval: float):
+    """Cada interval segundos elimina los IDs vencidos con su propia sesión"""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            async with session_factory() as db:
+                deleted = await deduplicator.purge(db)
+            if deleted:
+                logger.info(f"Processed messages purged: {deleted}")
+        except Exception as e:
+            logger.error(f"Processed messages purge failed: {e}")
+
+
+def create_deduplicator(backend: Optional[str] = None):
+    """
+    Crea el registro según DEDUP_BACKEND (memory | sql).
+
+    Variables:
+        DEDUP_TTL_SECONDS: vigencia de cada ID (por defecto 24 h)
+        DEDUP_MAX_ENTRIES: tope de IDs en memoria (por defecto 50000)
+    """
+    backend = (backend or os.getenv("DEDUP_BACKEND", "memory")).lower()
+    ttl_seconds = int(os.getenv("DEDUP_TTL_SECONDS", "86400"))
+    max_entries = int(os.getenv("DEDUP_MAX_ENTRIES", "50000"))
+
+    if backend == "sql":
+        return SqlDeduplicator(ttl_seconds, max_entries)
+
+    return MemoryDeduplicator(ttl_seconds, max_entries)
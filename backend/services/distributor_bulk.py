@@ -0,0 +1,284 @@
+# backend/services/distributor_bulk.py
+"""Importación y exportación masiva de distribuidores en CSV"""
+
+import csv
+import io
+import itertools
+from datetime import datetime
+from typing import AsyncIterable, AsyncIterator, BinaryIO, Dict, Iterator, List, Tuple, Type
+
+from pydantic import BaseModel, ValidationError
+from sqlalchemy import insert, or_, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
+
+from auth import hash_passwords_bulk
+from models import Distributor
+
+# Filas que se validan, verifican e insertan juntas
+IMPORT_BATCH_SIZE = 500
+EXPORT_CHUNK_SIZE = 1000
+
+UNIQUE_FIELDS = ("telefono", "usuario", "email")
+
+# Columnas del CSV exportado (las contraseñas nunca se exportan)
+EXPORT_COLUMNS = [
+    "id", "nombres", "apellidos", "telefono", "email", "usuario", "nivel", "estado",
+    "fecha_ingreso", "fecha_cumpleanos", "notas", "created_at"
+]
+
+
+def _detect_encoding(file: BinaryIO) -> str:
+    """UTF-8 (con o sin BOM) o, si no decodifica, Windows-1252 (Excel en español)"""
+    sample = file.read(65536)
+    file.seek(0)
+    try:
+        sample.decode("utf-8")
+    except UnicodeDecodeError as e:
+        # Un carácter cortado al final de la muestra no cuenta
+        if e.start < len(sample) - 3:
+            return "cp1252"
+    return "utf-8-sig"
+
+
+def iter_csv_rows(file: BinaryIO) -> Iterator[Dict[str, str]]:
+    """
+    Lee el CSV fila por fila sin cargarlo completo en memoria.
+
+    Acepta separador "," o ";" (se detecta en el encabezado); los nombres de
+    columna se normalizan a minúsculas y las celdas vacías quedan en None.
+    """
+    text = io.TextIOWrapper(file, encoding=_detect_encoding(file), newline="")
+    try:
+        header = text.readline()
+        delimiter = ";" if header.count(";") > header.count(",") else ","
+        reader = csv.DictReader(itertools.chain([header], text), delimiter=delimiter)
+        for row in reader:
+            yield {
+                key.strip().lower(): (value.strip() or None) if isinstance(value, str) else value
+                for key, value in row.items()
+                if key
+            }
+    finally:
+        text.detach()
+
+
+async def aiter_csv_rows(file: BinaryIO, chunk_size: int = IMPORT_BATCH_SIZE) -> AsyncIterator[Dict[str, str]]:
+    """
+    iter_csv_rows para rutas async: la lectura del archivo (UploadFile.file
+    puede estar en disco) y el parseo corren en el threadpool, de a
+    chunk_size filas por salto, sin bloquear el event loop.
+    """
+    rows = iter_csv_rows(file)
+    while True:
+        chunk = await run_in_threadpool(lambda: list(itertools.islice(rows, chunk_size)))
+        if not chunk:
+            return
+        for row in chunk:
+            yield row
+
+
+class DistributorImporter:
+    """
+    Crea distribuidores por lotes.
+
+    Por cada lote: valida con el schema de alta, descarta duplicados dentro
+    del archivo, verifica unicidad contra la base con una sola consulta
+    (IN sobre teléfono, usuario y email), hashea las contraseñas en paralelo
+    e inserta con un INSERT multi-fila. Cada lote se confirma por separado,
+    así un error no descarta lo ya importado.
+    """
+
+    def __init__(self, db: AsyncSession, schema: Type[BaseModel]):
+        self.db = db
+        self.schema = schema
+        self._seen = {field: set() for field in UNIQUE_FIELDS}
+
+    async def run(self, rows: AsyncIterable[Dict[str, str]]) -> dict:
+        """
+        Args:
+            rows: Filas del archivo (aiter_csv_rows)
+
+        Returns:
+            Dict con total, created, failed y results (una entrada por fila)
+        """
+        results = []
+        batch: List[Tuple[int, dict]] = []
+        # La línea 1 es el encabezado
+        line = 1
+        async for row in rows:
+            line += 1
+            batch.append((line, row))
+            if len(batch) >= IMPORT_BATCH_SIZE:
+                results.extend(await self._import_batch(batch))
+                batch = []
+        if batch:
+            results.extend(await self._import_batch(batch))
+
+        created = sum(1 for r in results if r["status"] == "created")
+        return {
+            "total": len(results),
+            "created": created,
+            "failed": len(results) - created,
+            "results": results
+        }
+
+    def _validate(self, line: int, row: dict) -> Tuple[dict, dict]:
+        """Devuelve (datos, None) o (None, resultado de error)"""
+        try:
+            # Las celdas vacías no se envían, así aplican los valores por defecto del schema
+            data = self.schema(**{k: v for k, v in row.items() if v is not None}).model_dump()
+        except ValidationError as e:
+            errors = [
+                f"{'.'.join(str(part) for part in error['loc'])}: {error['msg']}"
+                for error in e.errors()
+            ]
+            return None, {"line": line, "status": "error", "usuario": row.get("usuario"), "errors": errors}
+
+        duplicated = [f for f in UNIQUE_FIELDS if data.get(f) and data[f] in self._seen[f]]
+        if duplicated:
+            return None, {
+                "line": line, "status": "error", "usuario": data["usuario"],
+                "errors": [f"{f}: repetido en el archivo" for f in duplicated]
+            }
+        for f in UNIQUE_FIELDS:
+            if data.get(f):
+                self._seen[f].add(data[f])
+        return data, None
+
+    async def _existing_values(self, valid: List[Tuple[int, dict]]) -> Dict[str, set]:
+        """Valores únicos del lote que ya existen en la base (una consulta)"""
+        values = {f: {data[f] for _, data in valid if data.get(f)} for f in UNIQUE_FIELDS}
+        conditions = [getattr(Distributor, f).in_(v) for f, v in values.items() if v]
+        existing = {f: set() for f in UNIQUE_FIELDS}
+        if not conditions:
+            return existing
+        rows = (await self.db.execute(
+            select(Distributor.telefono, Distributor.usuario, Distributor.email).where(or_(*conditions))
+        )).all()
+        for row in rows:
+            for f in UNIQUE_FIELDS:
+                if getattr(row, f) in values[f]:
+                    existing[f].add(getattr(row, f))
+        return existing
+
+    async def _import_batch(self, batch: List[Tuple[int, dict]]) -> List[dict]:
+        results: Dict[int, dict] = {}
+        valid = []
+        for line, row in batch:
+            data, error = self._validate(line, row)
+            if error:
+                results[line] = error
+            else:
+                valid.append((line, data))
+
+        existing = await self._existing_values(valid)
+        pending = []
+        for line, data in valid:
+            conflicts = [f for f in UNIQUE_FIELDS if data.get(f) and data[f] in existing[f]]
+            if conflicts:
+                results[line] = {
+                    "line": line, "status": "error", "usuario": data["usuario"],
+                    "errors": [f"{f}: ya existe un distribuidor con ese valor" for f in conflicts]
+                }
+            else:
+                pending.append((line, data))
+
+        if pending:
+            for line, outcome in zip([l for l, _ in pending], await self._insert(pending)):
+                results[line] = outcome
+
+        return [results[line] for line, _ in batch]
+
+    async def _insert(self, pending: List[Tuple[int, dict]]) -> List[dict]:
+        # Contraseña y doble factor de todo el lote en una sola tanda
+        passwords = [data["contrasena"] for _, data in pending]
+        second = [data["contrasena_doble_factor"] for _, data in pending if data.get("contrasena_doble_factor")]
+        hashes = await hash_passwords_bulk(passwords + second)
+        password_hashes, second_hashes = iter(hashes[:len(passwords)]), iter(hashes[len(passwords):])
+
+        now = datetime.utcnow()
+        rows = []
+        for _, data in pending:
+            has_second = bool(data.get("contrasena_doble_factor"))
+            rows.append({
+                "nombres": data["nombres"],
+                "apellidos": data["apellidos"],
+                "telefono": data["telefono"],
+                "email": data.get("email"),
+                "fecha_ingreso": data["fecha_ingreso"],
+                "fecha_cumpleanos": data.get("fecha_cumpleanos"),
+                "usuario": data["usuario"],
+                "contrasena": next(password_hashes),
+                "contrasena_texto": data["contrasena"],
+                "contrasena_doble_factor": next(second_hashes) if has_second else None,
+                "contrasena_2fa_texto": data["contrasena_doble_factor"] if has_second else None,
+                "nivel": data.get("nivel") or "Pre-Junior",
+                "estado": data.get("estado") or "activo",
+                "notas": data.get("notas"),
+                "created_at": now,
+                "updated_at": now
+            })
+
+        stmt = insert(Distributor).returning(Distributor.id, sort_by_parameter_order=True)
+        try:
+            ids = (await self.db.scalars(stmt, rows)).all()
+            await self.db.commit()
+        except IntegrityError:
+            # Otro proceso insertó alguno de estos valores entre la verificación
+            # y el INSERT: se reintenta fila por fila para aislar las que fallan
+            await self.db.rollback()
+            return await self._insert_one_by_one(pending, rows)
+
+        return [
+            {"line": line, "status": "created", "id": new_id, "usuario": data["usuario"]}
+            for (line, data), new_id in zip(pending, ids)
+        ]
+
+    async def _insert_one_by_one(self, pending, rows) -> List[dict]:
+        outcomes = []
+        for (line, data), row in zip(pending, rows):
+            try:
+                async with self.db.begin_nested():
+                    new_id = await self.db.scalar(insert(Distributor).returning(Distributor.id), row)
+                outcomes.append({"line": line, "status": "created", "id": new_id, "usuario": data["usuario"]})
+            except IntegrityError:
+                outcomes.append({
+                    "line": line, "status": "error", "usuario": data["usuario"],
+                    "errors": ["ya existe un distribuidor con ese teléfono, usuario o email"]
+                })
+        await self.db.commit()
+        return outcomes
+
+
+def _csv_line(values) -> str:
+    buffer = io.StringIO()
+    csv.writer(buffer).writerow(values)
+    return buffer.getvalue()
+
+
+async def iter_export_csv(session_factory, *filters) -> AsyncIterator[str]:
+    """
+    Genera el CSV por tramos de EXPORT_CHUNK_SIZE filas (keyset por id),
+    con su propia sesión porque se consume después de terminar el request.
+    """
+    columns = [getattr(Distributor, name) for name in EXPORT_COLUMNS]
+    # BOM para que Excel abra el archivo como UTF-8
+    yield "\ufeff" + _csv_line(EXPORT_COLUMNS)
+
+    last_id = 0
+    async with session_factory() as db:
+        while True:
+            rows = (await db.execute(
+                select(*columns).where(Distributor.id > last_id, *filters)
+                .order_by(Distributor.id).limit(EXPORT_CHUNK_SIZE)
+            )).all()
+            if not rows:
+                break
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            for row in rows:
+                writer.writerow(["" if value is None else value for value in row])
+            yield buffer.getvalue()
+            last_id = rows[-1].id
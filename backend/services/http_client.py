@@ -0,0 +1,61 @@
+# backend/services/http_client.py
+"""Cliente HTTP compartido (keep-alive + HTTP/2) para todos los envíos a la Graph API"""
+
+import httpx
+import logging
+from typing import Optional
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+# HTTP/2 requiere el paquete h2 (httpx[http2]); sin él se usa HTTP/1.1 con keep-alive
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+_client: Optional[httpx.AsyncClient] = None
+
+
+def _build_client() -> httpx.AsyncClient:
+    """Crea el cliente con pool de conexiones y timeouts configurables"""
+    return httpx.AsyncClient(
+        http2=settings.HTTP2_ENABLED and HTTP2_AVAILABLE,
+        timeout=httpx.Timeout(settings.HTTP_TIMEOUT, connect=settings.HTTP_CONNECT_TIMEOUT),
+        limits=httpx.Limits(
+            max_connections=settings.HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.HTTP_MAX_KEEPALIVE,
+            keepalive_expiry=settings.HTTP_KEEPALIVE_EXPIRY
+        )
+    )
+
+
+async def start_http_client() -> httpx.AsyncClient:
+    """Abre el cliente compartido (llamar en el evento startup)"""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = _build_client()
+        logger.info(f"HTTP client started (http2={settings.HTTP2_ENABLED and HTTP2_AVAILABLE})")
+    return _client
+
+
+async def close_http_client():
+    """Cierra el cliente compartido y sus conexiones (llamar en el evento shutdown)"""
+    global _client
+    if _client is not None and not _client.is_closed:
+        await _client.aclose()
+        logger.info("HTTP client closed")
+    _client = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """
+    Devuelve el cliente compartido.
+
+    Si se usa fuera de la aplicación (scripts, consola) se crea bajo demanda.
+    """
+    global _client
+    if _client is None or _client.is_closed:
+        _client = _build_client()
+    return _client
@@ -0,0 +1,107 @@
+# backend/services/intent_matcher.py
+"""Motor compilado de detección de intenciones por palabras clave"""
+
+from collections import deque
+from typing import Dict, List, Optional, Set
+
+
+class IntentMatcher:
+    """
+    Detecta la intención de un texto con un autómata Aho-Corasick.
+
+    Cada regla es un diccionario con:
+        - intent: identificador de la intención
+        - keywords: palabras clave que activan la regla (basta una)
+        - exclude: palabras clave que anulan la regla (opcional)
+        - max_length: la regla solo aplica si len(texto) < max_length (opcional)
+
+    La prioridad es el orden de la lista: gana la primera regla que cumple,
+    igual que una cadena de if/elif con `any(w in texto for w in [...])`.
+    El texto se recorre una sola vez sin importar cuántas reglas existan.
+    """
+
+    def __init__(self, rules: List[Dict]):
+        self.rules = rules
+        self._keyword_ids: Dict[str, int] = {}
+        self._rules_by_keyword: List[Set[int]] = []
+        self._exclusions: List[Set[int]] = []
+
+        for priority, rule in enumerate(rules):
+            for keyword in rule["keywords"]:
+                self._rules_by_keyword[self._add_keyword(keyword)].add(priority)
+            self._exclusions.append({
+                self._add_keyword(keyword) for keyword in rule.get("exclude", [])
+            })
+
+        self._build_automaton(self._keyword_ids)
+
+    def _add_keyword(self, keyword: str) -> int:
+        """Registra una palabra clave y devuelve su id"""
+        if keyword not in self._keyword_ids:
+            self._keyword_ids[keyword] = len(self._keyword_ids)
+            self._rules_by_keyword.append(set())
+        return self._keyword_ids[keyword]
+
+    def _build_automaton(self, keyword_ids: Dict[str, int]):
+        """Construye el trie con enlaces de fallo y salidas acumuladas"""
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[Set[int]] = [set()]
+
+        for keyword, keyword_id in keyword_ids.items():
+            state = 0
+            for char in keyword:
+                next_state = self._goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self._goto)
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._output.append(set())
+                    self._goto[state][char] = next_state
+                state = next_state
+            self._output[state].add(keyword_id)
+
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[next_state] = self._goto[fallback].get(char, 0)
+                self._output[next_state] |= self._output[self._fail[next_state]]
+
+    def scan(self, text: str) -> Set[int]:
+        """Devuelve los ids de todas las palabras clave presentes en el texto"""
+        goto, fail, output = self._goto, self._fail, self._output
+        found: Set[int] = set()
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if output[state]:
+                found |= output[state]
+        return found
+
+    def match(self, text: str) -> Optional[str]:
+        """Devuelve la intención de mayor prioridad que aplica al texto"""
+        found = self.scan(text)
+        if not found:
+            return None
+
+        candidates = set()
+        for keyword_id in found:
+            candidates |= self._rules_by_keyword[keyword_id]
+
+        for priority in sorted(candidates):
+            rule = self.rules[priority]
+            max_length = rule.get("max_length")
+            if max_length is not None and len(text) >= max_length:
+                continue
+            if self._exclusions[priority] & found:
+                continue
+            return rule["intent"]
+
+        return None
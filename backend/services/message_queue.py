@@ -0,0 +1,153 @@
+# backend/services/message_queue.py
+"""Cola de trabajo en segundo plano para procesar los webhooks de WhatsApp"""
+
+import asyncio
+import logging
+import zlib
+from typing import Any, Awaitable, Callable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class MessageQueue:
+    """
+    Pool de workers asyncio que procesa mensajes fuera del request del webhook.
+
+    Cada worker tiene su propia cola y los mensajes se reparten por un hash
+    estable de la clave (el teléfono), así los mensajes de un mismo número se
+    procesan siempre en orden y por el mismo worker, mientras que números
+    distintos avanzan en paralelo.
+
+    Meta ya recibió su 200 y no reenvía: si el handler falla, el worker
+    reintenta el mismo elemento hasta max_attempts veces con espera
+    exponencial (retry_delay, 2 * retry_delay, ... hasta max_retry_delay)
+    antes de pasar al siguiente, así el orden por número se mantiene. Lo
+    que se descarta (reintentos agotados o cola sin drenar al detener) se
+    registra en el log con la descripción de describe (los IDs de mensaje).
+    """
+
+    def __init__(
+        self,
+        handler: Callable[[Any], Awaitable[Any]],
+        workers: int = 4,
+        maxsize: int = 1000,
+        max_attempts: int = 5,
+        retry_delay: float = 1.0,
+        max_retry_delay: float = 30.0,
+        describe: Callable[[Any], Any] = repr
+    ):
+        self.handler = handler
+        self.workers = max(1, workers)
+        self.maxsize = maxsize
+        self.max_attempts = max(1, max_attempts)
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.describe = describe
+        self._queues: List[asyncio.Queue] = []
+        self._tasks: List[asyncio.Task] = []
+        self._current: List[Any] = []
+        self._accepting = False
+
+    def start(self):
+        """Crea las colas y lanza los workers"""
+        if self._tasks:
+            return
+        per_worker = max(1, self.maxsize // self.workers) if self.maxsize else 0
+        self._queues = [asyncio.Queue(maxsize=per_worker) for _ in range(self.workers)]
+        self._current = [None] * self.workers
+        self._tasks = [
+            asyncio.create_task(self._worker(i, queue), name=f"message-worker-{i}")
+            for i, queue in enumerate(self._queues)
+        ]
+        self._accepting = True
+        logger.info(f"MessageQueue started with {self.workers} workers")
+
+    def enqueue(self, key: Optional[str], item: Any) -> bool:
+        """
+        Encola un elemento sin bloquear.
+
+        Returns:
+            bool: False si la cola está llena o detenida (el webhook debe
+            responder error para que Meta reintente)
+        """
+        if not self._accepting:
+            return False
+        index = zlib.crc32((key or "").encode()) % self.workers
+        try:
+            self._queues[index].put_nowait(item)
+            return True
+        except asyncio.QueueFull:
+            logger.warning(f"MessageQueue worker {index} full, rejecting message")
+            return False
+
+    def qsize(self) -> int:
+        """Total de elementos pendientes en todas las colas"""
+        return sum(queue.qsize() for queue in self._queues)
+
+    async def _worker(self, index: int, queue: asyncio.Queue):
+        while True:
+            item = await queue.get()
+            self._current[index] = item
+            try:
+                await self._process(index, item)
+            finally:
+                self._current[index] = None
+                queue.task_done()
+
+    async def _process(self, index: int, item: Any):
+        """Ejecuta el handler con reintentos; al agotarlos registra el elemento descartado"""
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                await self.handler(item)
+                return
+            except Exception as e:
+                if attempt == self.max_attempts:
+                    logger.error(
+                        f"MessageQueue worker {index} dropped {self.describe(item)} "
+                        f"after {attempt} attempts: {e}"
+                    )
+                    return
+                delay = min(self.retry_delay * 2 ** (attempt - 1), self.max_retry_delay)
+                logger.warning(
+                    f"MessageQueue worker {index} failed processing {self.describe(item)} "
+                    f"(attempt {attempt}/{self.max_attempts}), retrying in {delay:.1f}s: {e}"
+                )
+                await asyncio.sleep(delay)
+
+    def _drain_pending(self) -> List[Any]:
+        """Saca de las colas lo que no se llegó a procesar, incluido lo que está en curso"""
+        pending = [item for item in self._current if item is not None]
+        for queue in self._queues:
+            while not queue.empty():
+                pending.append(queue.get_nowait())
+                queue.task_done()
+        return pending
+
+    async def stop(self, timeout: float = 30):
+        """
+        Deja de aceptar mensajes, espera a que se vacíen las colas y detiene los workers.
+
+        Lo que quede sin procesar al vencer el plazo se registra en el log,
+        elemento por elemento, antes de cancelar los workers.
+
+        Args:
+            timeout: Segundos máximos para drenar lo que quede pendiente
+        """
+        self._accepting = False
+        if not self._tasks:
+            return
+        try:
+            await asyncio.wait_for(
+                asyncio.gather(*(queue.join() for queue in self._queues)),
+                timeout=timeout
+            )
+        except asyncio.TimeoutError:
+            pending = self._drain_pending()
+            logger.error(f"MessageQueue stopped with {len(pending)} items unprocessed")
+            for item in pending:
+                logger.error(f"MessageQueue dropped unprocessed {self.describe(item)}")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        logger.info("MessageQueue stopped")
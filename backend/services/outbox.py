@@ -0,0 +1,140 @@
+# backend/services/outbox.py
+"""Despachador del outbox: entrega los mensajes salientes con reintentos"""
+
+import asyncio
+import logging
+import random
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from models import OutboundMessage
+from repositories.outbox_repository import OutboxRepository
+from services.whatsapp import PRIORITY_FOLLOW_UP, PRIORITY_INTERACTIVE
+
+logger = logging.getLogger(__name__)
+
+
+class OutboxDispatcher:
+    """
+    Drena outbound_messages en segundo plano.
+
+    Cada vuelta reserva un lote (OutboxRepository.claim), lo envía en
+    paralelo y guarda el resultado de cada fila: el wamid si se entregó, el
+    próximo intento con backoff exponencial y jitter si el error es
+    transitorio, o failed si es definitivo o se agotaron los intentos.
+    Varias instancias del servidor pueden correrlo a la vez: la reserva con
+    SKIP LOCKED reparte las filas sin que dos workers envíen la misma.
+
+    Orden por teléfono: claim solo entrega la fila más antigua sin resolver
+    de cada número, así un lote nunca trae dos del mismo teléfono. Eso
+    bloquea la cola de ese número: mientras su primera fila espera un
+    reintento, los mensajes siguientes no salen hasta que se entregue o
+    quede failed (a lo sumo max_attempts intentos, con esperas de hasta
+    max_delay). Los demás números siguen saliendo mientras tanto.
+    """
+
+    def __init__(
+        self,
+        session_factory,
+        send: Callable[[Dict[str, Any], int], Awaitable[Dict[str, Any]]],
+        batch_size: int = 20,
+        poll_interval: float = 2.0,
+        lease_seconds: float = 60.0,
+        max_attempts: int = 8,
+        base_delay: float = 2.0,
+        max_delay: float = 600.0
+    ):
+        self.session_factory = session_factory
+        self.send = send
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="outbox-dispatcher")
+            logger.info("OutboxDispatcher started")
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+        logger.info("OutboxDispatcher stopped")
+
+    def notify(self):
+        """Despierta al despachador (llamar después de confirmar nuevos envíos)"""
+        self._wakeup.set()
+
+    def backoff(self, attempts: int, retry_after: Optional[float] = None) -> float:
+        """Espera antes del próximo intento: exponencial con jitter, nunca menor que Retry-After"""
+        delay = min(self.max_delay, self.base_delay * 2 ** max(0, attempts - 1))
+        delay = random.uniform(delay / 2, delay)
+        return max(delay, retry_after or 0)
+
+    async def _run(self):
+        while True:
+            try:
+                delivered = await self.drain_once()
+            except Exception as e:
+                logger.error(f"OutboxDispatcher failed draining: {e}")
+                delivered = 0
+            # Hubo envíos: puede haber más pendientes (p. ej. el siguiente
+            # mensaje de un número que acaba de salir), se sigue sin esperar
+            if delivered:
+                continue
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    async def _send(self, message: OutboundMessage) -> Dict[str, Any]:
+        """Envía una fila; una excepción cuenta como error transitorio"""
+        # Primer intento en el carril de respuestas; los reintentos ya van
+        # tarde y ceden el paso a las respuestas nuevas
+        try:
+            return await self.send(
+                message.payload,
+                PRIORITY_INTERACTIVE if message.attempts == 1 else PRIORITY_FOLLOW_UP
+            )
+        except Exception as e:
+            return {"ok": False, "error": str(e) or type(e).__name__, "retryable": True}
+
+    async def drain_once(self) -> int:
+        """
+        Reserva y envía un lote.
+
+        Returns:
+            Cantidad de envíos reservados en esta vuelta
+        """
+        async with self.session_factory() as db:
+            repository = OutboxRepository(db)
+            claimed = await repository.claim(self.batch_size, self.lease_seconds)
+            if not claimed:
+                return 0
+
+            # A lo sumo una fila por teléfono (ver claim): todas salen a la vez
+            results = await asyncio.gather(*(self._send(message) for message in claimed))
+
+            # La sesión no admite sentencias concurrentes: se registra al final
+            for message, result in zip(claimed, results):
+                if result["ok"]:
+                    await repository.mark_sent(message.id, result.get("message_id"))
+                elif result.get("retryable") and message.attempts < self.max_attempts:
+                    delay = self.backoff(message.attempts, result.get("retry_after"))
+                    await repository.mark_retry(message.id, delay, result.get("error"))
+                    logger.warning(
+                        f"Outbound {message.id} to {message.phone_number} failed "
+                        f"(attempt {message.attempts}), retrying in {delay:.0f}s"
+                    )
+                else:
+                    await repository.mark_failed(message.id, result.get("error"))
+                    logger.error(f"Outbound {message.id} to {message.phone_number} failed permanently")
+            await db.commit()
+            return len(claimed)
@@ -0,0 +1,142 @@
+# backend/services/pagination.py
+"""Paginación por cursor (keyset) para los listados"""
+
+import base64
+import json
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Callable, List, Optional, Sequence
+
+from fastapi import HTTPException, Response
+from sqlalchemy import and_, false, or_, tuple_
+
+# Header donde se devuelve el cursor de la página siguiente
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def _encode_value(value: Any) -> Any:
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
+
+
+def _decode_value(column, value: Any) -> Any:
+    if value is None:
+        return None
+    python_type = column.type.python_type
+    if python_type is datetime:
+        return datetime.fromisoformat(value)
+    if python_type is date:
+        return date.fromisoformat(value)
+    return python_type(value)
+
+
+class KeysetPaginator:
+    """
+    Pagina con WHERE (columnas de orden) después del último elemento visto.
+
+    A diferencia de OFFSET, la base no recorre ni descarta las filas de las
+    páginas anteriores: con un índice compuesto sobre las mismas columnas
+    cada página cuesta lo mismo. El cursor es opaco para el cliente (base64
+    de los valores de la última fila) y se devuelve en el header
+    X-Next-Cursor solo cuando hay más resultados.
+
+    La última columna debe ser única (el id) para desempatar. Todas se
+    ordenan en la misma dirección; los NULL van primero en orden
+    descendente y al final en ascendente, como los recorre un índice
+    B-tree de PostgreSQL.
+
+    skip (OFFSET) se mantiene para clientes anteriores y se ignora si
+    llega un cursor.
+    """
+
+    def __init__(
+        self,
+        columns: Sequence,
+        cursor: Optional[str] = None,
+        limit: int = 100,
+        skip: int = 0,
+        descending: bool = True
+    ):
+        self.columns = list(columns)
+        self.limit = limit
+        self.skip = skip
+        self.descending = descending
+        self.signature = [column.key for column in self.columns]
+        self.values = self._decode(cursor) if cursor else None
+
+    def _decode(self, cursor: str) -> List[Any]:
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            if payload["k"] != self.signature or len(payload["v"]) != len(self.columns):
+                raise ValueError("cursor de otro listado u orden")
+            return [_decode_value(c, v) for c, v in zip(self.columns, payload["v"])]
+        except Exception:
+            raise HTTPException(status_code=400, detail="Cursor de paginación inválido")
+
+    def encode(self, values: Sequence[Any]) -> str:
+        payload = {"k": self.signature, "v": [_encode_value(v) for v in values]}
+        return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+
+    def _after(self, column, value):
+        """Filas que van después de value en una sola columna"""
+        if self.descending:
+            return column.isnot(None) if value is None else column < value
+        return false() if value is None else or_(column > value, column.is_(None))
+
+    def _equal(self, column, value):
+        return column.is_(None) if value is None else column == value
+
+    def _after_cursor(self):
+        """Condición lexicográfica sobre todas las columnas"""
+        if all(v is not None for v in self.values):
+            # Comparación de filas: PostgreSQL la resuelve con un rango del índice
+            if self.descending:
+                return tuple_(*self.columns) < tuple_(*self.values)
+            return tuple_(*self.columns) > tuple_(*self.values)
+
+        conditions = []
+        for i, (column, value) in enumerate(zip(self.columns, self.values)):
+            prefix = [self._equal(c, v) for c, v in zip(self.columns[:i], self.values[:i])]
+            conditions.append(and_(*prefix, self._after(column, value)))
+        return or_(*conditions)
+
+    def apply(self, query):
+        """Agrega orden, condición del cursor (u OFFSET) y límite (+1 para saber si hay más)"""
+        if self.descending:
+            order = [column.desc().nulls_first() for column in self.columns]
+        else:
+            order = [column.asc().nulls_last() for column in self.columns]
+        query = query.order_by(*order)
+
+        if self.values is not None:
+            query = query.where(self._after_cursor())
+        elif self.skip:
+            query = query.offset(self.skip)
+        return query.limit(self.limit + 1)
+
+    def page(
+        self,
+        rows: Sequence[Any],
+        response: Optional[Response] = None,
+        item: Callable[[Any], Any] = lambda row: row
+    ) -> List[Any]:
+        """
+        Recorta la fila extra y publica el cursor siguiente en el response.
+
+        Args:
+            item: Extrae el objeto ORM de cada fila (para selects de varias columnas)
+        """
+        rows = list(rows)
+        if len(rows) <= self.limit:
+            return rows
+
+        rows = rows[:self.limit]
+        if response is not None:
+            last = item(rows[-1])
+            response.headers[NEXT_CURSOR_HEADER] = self.encode(
+                [getattr(last, column.key) for column in self.columns]
+            )
+        return rows
@@ -0,0 +1,187 @@
+# backend/services/search.py
+"""Búsqueda de texto para listados y búsqueda global del panel"""
+
+import html
+import re
+from typing import Dict, List, Optional, Sequence
+
+from sqlalchemy import and_, case, func, literal_column, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models import Conversation, Distributor, Lead, Message
+from inventory.models.inventory import Producto, Vendedor
+
+# Columnas en las que busca cada entidad. En PostgreSQL cada una tiene un
+# índice GIN gin_trgm_ops (ver migrations.py), que resuelve ILIKE '%term%'
+# sin recorrer la tabla.
+SEARCH_FIELDS = {
+    "conversations": (Conversation, [Conversation.phone_number, Conversation.user_name]),
+    "leads": (Lead, [Lead.phone_number, Lead.user_name, Lead.email]),
+    "distributors": (Distributor, [
+        Distributor.nombres, Distributor.apellidos, Distributor.telefono,
+        Distributor.email, Distributor.usuario
+    ]),
+    "vendedores": (Vendedor, [Vendedor.nombre, Vendedor.telefono, Vendedor.email]),
+    "productos": (Producto, [Producto.nombre, Producto.codigo, Producto.descripcion]),
+}
+
+# Campos que devuelve la búsqueda global por entidad
+RESULT_FIELDS = {
+    "conversations": ["phone_number", "user_name", "status"],
+    "leads": ["phone_number", "user_name", "email", "status", "interest_level"],
+    "distributors": ["nombres", "apellidos", "usuario", "telefono", "estado"],
+    "vendedores": ["nombre", "telefono", "ciudad", "estado"],
+    "productos": ["nombre", "codigo", "precio_unitario", "estado"],
+}
+
+
+def _like_pattern(term: str) -> str:
+    """%term% con los comodines del usuario escapados"""
+    escaped = term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
+
+
+def search_filter(columns: Sequence, term: str):
+    """
+    Condición "alguna columna contiene el término" (sin distinguir mayúsculas).
+
+    Se usa ILIKE sobre la columna tal cual (sin lower()) para que PostgreSQL
+    pueda usar los índices de trigramas; en SQLite es un LIKE normal.
+    """
+    pattern = _like_pattern(term.strip())
+    return or_(*[column.ilike(pattern, escape="\\") for column in columns])
+
+
+def search_rank(columns: Sequence, term: str, dialect: str):
+    """
+    Puntaje de relevancia entre 0 y 1 (mayor es mejor).
+
+    PostgreSQL: word_similarity de pg_trgm, la mejor entre las columnas.
+    Otros motores: 1 coincidencia exacta, 0.75 prefijo, 0.5 contiene.
+    """
+    term = term.strip()
+    if dialect == "postgresql":
+        scores = [func.coalesce(func.word_similarity(term, column), 0) for column in columns]
+        return func.greatest(*scores) if len(scores) > 1 else scores[0]
+
+    lowered = term.lower()
+    scores = [
+        case(
+            (func.lower(column) == lowered, 1.0),
+            (func.lower(column).like(_like_pattern(lowered)[1:], escape="\\"), 0.75),
+            (column.ilike(_like_pattern(lowered), escape="\\"), 0.5),
+            else_=0.0
+        )
+        for column in columns
+    ]
+    # max() con varios argumentos es escalar en SQLite
+    return func.max(*scores) if len(scores) > 1 else scores[0]
+
+
+async def search_all(
+    db: AsyncSession,
+    term: str,
+    entities: Sequence[str] = tuple(SEARCH_FIELDS),
+    limit: int = 10
+) -> Dict[str, List[dict]]:
+    """
+    Busca el término en cada entidad y devuelve los mejores resultados primero.
+
+    Returns:
+        Dict entidad -> lista de {id, score, ...campos de RESULT_FIELDS}
+    """
+    dialect = db.get_bind().dialect.name
+    results = {}
+    for entity in entities:
+        model, columns = SEARCH_FIELDS[entity]
+        fields = [getattr(model, field) for field in RESULT_FIELDS[entity]]
+        rank = search_rank(columns, term, dialect).label("score")
+        rows = (await db.execute(
+            select(model.id, *fields, rank)
+            .where(search_filter(columns, term))
+            .order_by(rank.desc(), model.id.desc())
+            .limit(limit)
+        )).all()
+        results[entity] = [
+            {
+                "id": row.id,
+                **{field: getattr(row, field) for field in RESULT_FIELDS[entity]},
+                "score": round(float(row.score or 0), 3)
+            }
+            for row in rows
+        ]
+    return results
+
+
+# ==================== MENSAJES (TEXTO COMPLETO) ====================
+# En PostgreSQL la búsqueda usa el índice GIN sobre
+# to_tsvector('spanish', content) (ver migrations.py). La configuración va
+# como literal y no como parámetro: así la expresión coincide con la del
+# índice y el planificador lo usa.
+
+MESSAGE_TS_CONFIG = literal_column("'spanish'::regconfig")
+
+# Marcadores internos del resaltado: se reemplazan por <mark> después de
+# escapar el HTML del mensaje
+_HIGHLIGHT_START = "\x02"
+_HIGHLIGHT_STOP = "\x03"
+_HEADLINE_OPTIONS = (
+    f"StartSel={_HIGHLIGHT_START}, StopSel={_HIGHLIGHT_STOP}, "
+    "MaxWords=30, MinWords=10, MaxFragments=2, FragmentDelimiter= … "
+)
+SNIPPET_LENGTH = 160
+
+
+def _message_terms(term: str) -> List[str]:
+    return [word.strip('"') for word in term.split() if word.strip('"')]
+
+
+def message_match(term: str, dialect: str):
+    """Condición de búsqueda sobre Message.content"""
+    if dialect == "postgresql":
+        return func.to_tsvector(MESSAGE_TS_CONFIG, Message.content).op("@@")(
+            func.websearch_to_tsquery(MESSAGE_TS_CONFIG, term)
+        )
+    # Otros motores: todas las palabras deben aparecer (sin stemming)
+    return and_(*[
+        Message.content.ilike(_like_pattern(word), escape="\\")
+        for word in _message_terms(term)
+    ])
+
+
+def message_headline(term: str, dialect: str):
+    """Fragmento resaltado calculado por la base (solo PostgreSQL), o None"""
+    if dialect != "postgresql":
+        return None
+    return func.ts_headline(
+        MESSAGE_TS_CONFIG,
+        Message.content,
+        func.websearch_to_tsquery(MESSAGE_TS_CONFIG, term),
+        _HEADLINE_OPTIONS
+    )
+
+
+def _mark_terms(content: str, term: str) -> str:
+    """Resaltado en Python para motores sin ts_headline: recorta alrededor del primer término"""
+    words = _message_terms(term)
+    pattern = re.compile("|".join(re.escape(word) for word in words), re.IGNORECASE)
+    found = pattern.search(content)
+    start = max(0, found.start() - SNIPPET_LENGTH // 3) if found else 0
+    fragment = content[start:start + SNIPPET_LENGTH]
+    fragment = pattern.sub(lambda m: f"{_HIGHLIGHT_START}{m.group(0)}{_HIGHLIGHT_STOP}", fragment)
+    prefix = "… " if start > 0 else ""
+    suffix = " …" if start + SNIPPET_LENGTH < len(content) else ""
+    return f"{prefix}{fragment}{suffix}"
+
+
+def render_snippet(content: str, term: str, headline: Optional[str] = None) -> str:
+    """
+    Fragmento listo para mostrar: el texto del mensaje escapado como HTML y
+    los términos encontrados entre <mark></mark>.
+    """
+    snippet = headline if headline is not None else _mark_terms(content or "", term)
+    return (
+        html.escape(snippet)
+        .replace(_HIGHLIGHT_START, "<mark>")
+        .replace(_HIGHLIGHT_STOP, "</mark>")
+    )
@@ -0,0 +1,118 @@
+# backend/services/stats_cache.py
+"""Caché en memoria de corta duración para las estadísticas del dashboard"""
+
+import asyncio
+import inspect
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterable, Set, Tuple, Union
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+
+class StatsCache:
+    """
+    Guarda resultados por clave durante unos segundos.
+
+    Cada entrada declara de qué tablas depende; cualquier commit que escriba
+    en esas tablas la invalida (ver los listeners al final del módulo). Un
+    candado por clave hace que, si llegan muchas peticiones a la vez con la
+    caché vacía, solo una consulte la base y el resto espere su resultado.
+
+    Cada tabla lleva un contador de generación que sube al invalidarla: un
+    cálculo que empezó antes de una invalidación de sus tablas se devuelve
+    a quien lo pidió pero no se guarda, así un resultado viejo no tapa la
+    escritura que se confirmó mientras se calculaba.
+    """
+
+    def __init__(self, ttl_seconds: float = 15):
+        self.ttl_seconds = ttl_seconds
+        self._entries: Dict[str, Tuple[float, Any, Set[str]]] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._generations: Dict[str, int] = {}
+
+    def _generation(self, tables: Set[str]) -> Tuple[int, ...]:
+        return tuple(self._generations.get(table, 0) for table in sorted(tables))
+
+    async def get_or_compute(
+        self,
+        key: str,
+        tables: Iterable[str],
+        compute: Callable[[], Union[Any, Awaitable[Any]]]
+    ) -> Any:
+        """Devuelve el valor en caché o lo calcula con compute() (sync o async)"""
+        entry = self._entries.get(key)
+        if entry and entry[0] > time.monotonic():
+            return entry[1]
+
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] > time.monotonic():
+                return entry[1]
+
+            tables = set(tables)
+            generation = self._generation(tables)
+            value = compute()
+            if inspect.isawaitable(value):
+                value = await value
+            if self._generation(tables) == generation:
+                self._entries[key] = (time.monotonic() + self.ttl_seconds, value, tables)
+            return value
+
+    def invalidate(self, tables: Iterable[str]):
+        """Elimina las entradas que dependen de alguna de las tablas"""
+        tables = set(tables)
+        for table in tables:
+            self._generations[table] = self._generations.get(table, 0) + 1
+        for key, (_, _, depends_on) in list(self._entries.items()):
+            if depends_on & tables:
+                self._entries.pop(key, None)
+
+    def clear(self):
+        self._entries.clear()
+
+
+stats_cache = StatsCache(ttl_seconds=float(os.getenv("STATS_CACHE_TTL", "15")))
+
+
+# ==================== INVALIDACIÓN AUTOMÁTICA ====================
+# Se anotan las tablas escritas por cada sesión (unit of work y sentencias
+# insert/update/delete, ORM o Core, incluidos los upserts) y se invalida al
+# confirmar.
+
+def _mark_tables(session: Session, tables: Iterable[str]):
+    session.info.setdefault("written_tables", set()).update(tables)
+
+
+@event.listens_for(Session, "after_flush")
+def _track_flush(session, flush_context):
+    _mark_tables(session, {
+        obj.__table__.name
+        for obj in list(session.new) + list(session.dirty) + list(session.deleted)
+        if hasattr(obj, "__table__")
+    })
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _track_statement(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        # update(tabla) / insert(tabla) de Core no tienen mapper: se usa la tabla de la sentencia
+        table = getattr(orm_execute_state.statement, "table", None)
+        if table is not None:
+            _mark_tables(orm_execute_state.session, {table.name})
+        elif orm_execute_state.bind_mapper is not None:
+            _mark_tables(orm_execute_state.session, {orm_execute_state.bind_mapper.local_table.name})
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_on_commit(session):
+    tables = session.info.pop("written_tables", None)
+    if tables:
+        stats_cache.invalidate(tables)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_on_rollback(session):
+    session.info.pop("written_tables", None)
@@ -0,0 +1,27 @@
+# backend/services/stock_snapshots.py
+"""Tarea periódica que toma los snapshots del libro de movimientos de stock"""
+
+import asyncio
+import logging
+
+from repositories.inventory_repository import StockLedgerRepository
+
+logger = logging.getLogger(__name__)
+
+
+async def run_snapshot_loop(session_factory, interval: float):
+    """
+    Cada interval segundos toma los snapshots pendientes con su propia sesión.
+
+    Si varias instancias del servidor coinciden, a lo sumo se repite un
+    snapshot con los mismos valores, lo que no afecta las consultas.
+    """
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            async with session_factory() as db:
+                total = await StockLedgerRepository(db).take_snapshots()
+            if total:
+                logger.info(f"Stock snapshots taken: {total}")
+        except Exception as e:
+            logger.error(f"Stock snapshot task failed: {e}")
@@ -0,0 +1,47 @@
+# backend/services/webhook_parser.py
+"""Lectura de los payloads de webhook de WhatsApp Business"""
+
+from typing import Any, Dict, Iterator
+
+
+def iter_webhook_messages(data: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    """
+    Recorre todos los mensajes de un webhook, en todas sus entries y changes.
+
+    Meta puede agrupar varios mensajes (y de varios números) en una sola
+    entrega; los elementos con estructura inválida se ignoran sin cortar el
+    resto del lote.
+
+    Yields:
+        Dict con id, from, text, timestamp, type y name (perfil del contacto)
+    """
+    if not isinstance(data, dict):
+        return
+
+    for entry in data.get("entry") or []:
+        if not isinstance(entry, dict):
+            continue
+        for change in entry.get("changes") or []:
+            if not isinstance(change, dict):
+                continue
+            value = change.get("value") or {}
+            if not isinstance(value, dict):
+                continue
+
+            contacts = {
+                contact.get("wa_id"): (contact.get("profile") or {}).get("name")
+                for contact in value.get("contacts") or []
+                if isinstance(contact, dict)
+            }
+
+            for message in value.get("messages") or []:
+                if not isinstance(message, dict) or not message.get("id") or not message.get("from"):
+                    continue
+                yield {
+                    "id": message.get("id"),
+                    "from": message.get("from"),
+                    "text": (message.get("text") or {}).get("body", ""),
+                    "timestamp": message.get("timestamp"),
+                    "type": message.get("type", "text"),
+                    "name": contacts.get(message.get("from"))
+                }
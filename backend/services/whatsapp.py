@@ -1,13 +1,145 @@
-# backend/app/services/whatsapp.py
+# backend/services/whatsapp.py
 """Servicio para interactuar con la API de WhatsApp Business"""
 
+import asyncio
 import httpx
 import logging
-from typing import Optional, Dict, Any
-from ..config import settings
+import time
+from collections import deque
+from typing import Optional, Dict, Any, Iterator, List
+from config import settings
+from services.http_client import get_http_client
+from services.dedup import create_deduplicator
+from services.webhook_parser import iter_webhook_messages
 
 logger = logging.getLogger(__name__)
 
+# Códigos de error de la Graph API por límite de envío: se pueden reintentar
+RATE_LIMIT_ERROR_CODES = {4, 80007, 130429, 131048, 131056}
+# Los de ritmo de la cuenta o el número (no de un destinatario) frenan todos los envíos
+THROUGHPUT_ERROR_CODES = {4, 80007, 130429}
+
+# Mensajes por segundo de cada nivel de throughput de la Cloud API
+THROUGHPUT_TIERS = {"standard": 80, "high": 1000}
+
+# Carriles del planificador, de mayor a menor prioridad
+PRIORITY_INTERACTIVE = 0  # respuestas a un mensaje recién recibido
+PRIORITY_FOLLOW_UP = 1    # seguimientos y envíos sueltos
+PRIORITY_CAMPAIGN = 2     # difusiones masivas
+PRIORITY_LANES = ("interactive", "follow_up", "campaign")
+
+
+class OutboundScheduler:
+    """
+    Ritmo global de envíos a la Graph API: un token bucket por proceso con
+    carriles de prioridad.
+
+    Cada envío toma un token; los tokens se reponen a rate por segundo hasta
+    burst. Cuando no hay token los envíos esperan en su carril y, al
+    reponerse, se atiende primero el carril de mayor prioridad: una campaña
+    en curso nunca demora las respuestas del chatbot. Un 429 (o error de
+    throughput) pausa todos los carriles durante el Retry-After.
+    """
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self.rate = float(rate)
+        self.burst = float(burst or rate)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lanes: List[deque] = [deque() for _ in PRIORITY_LANES]
+        self._pump_task: Optional[asyncio.Task] = None
+        self._stats = [{"sent": 0, "wait_total": 0.0, "wait_max": 0.0} for _ in PRIORITY_LANES]
+
+    def _refill(self, now: float):
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def _record(self, priority: int, waited: float):
+        stats = self._stats[priority]
+        stats["sent"] += 1
+        stats["wait_total"] += waited
+        stats["wait_max"] = max(stats["wait_max"], waited)
+
+    async def acquire(self, priority: int = PRIORITY_INTERACTIVE):
+        """Espera el turno de un envío en el carril indicado"""
+        priority = min(max(priority, 0), len(PRIORITY_LANES) - 1)
+        now = time.monotonic()
+        self._refill(now)
+        # Sin nadie esperando y con token disponible no hay cola
+        if not any(self._lanes) and self._tokens >= 1 and now >= self._paused_until:
+            self._tokens -= 1
+            self._record(priority, 0.0)
+            return
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._lanes[priority].append((now, future))
+        if self._pump_task is None or self._pump_task.done() or self._pump_task.get_loop() is not loop:
+            self._pump_task = loop.create_task(self._pump(), name="outbound-scheduler")
+        await future
+
+    async def _pump(self):
+        """Entrega los tokens a los que esperan, carril de mayor prioridad primero"""
+        while any(self._lanes):
+            now = time.monotonic()
+            if now < self._paused_until:
+                await asyncio.sleep(self._paused_until - now)
+                continue
+            self._refill(now)
+            if self._tokens < 1:
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+                continue
+            priority = next(i for i, lane in enumerate(self._lanes) if lane)
+            enqueued, future = self._lanes[priority].popleft()
+            if future.done():  # el que esperaba se canceló
+                continue
+            self._tokens -= 1
+            self._record(priority, now - enqueued)
+            future.set_result(None)
+
+    def pause(self, seconds: float):
+        """Detiene todos los envíos durante seconds (Retry-After de la Graph API)"""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        # El bucket vuelve a llenarse recién desde el fin de la pausa
+        self._tokens = 0
+        self._updated = self._paused_until
+        logger.warning(f"Outbound scheduler paused for {seconds:.1f}s")
+
+    def stats(self) -> Dict[str, Any]:
+        """Profundidad de cada carril y tiempos de espera (segundos)"""
+        now = time.monotonic()
+        self._refill(now)
+        lanes = {}
+        for name, lane, stats in zip(PRIORITY_LANES, self._lanes, self._stats):
+            lanes[name] = {
+                "queued": len(lane),
+                "oldest_wait": round(now - lane[0][0], 3) if lane else 0.0,
+                "sent": stats["sent"],
+                "avg_wait": round(stats["wait_total"] / stats["sent"], 3) if stats["sent"] else 0.0,
+                "max_wait": round(stats["wait_max"], 3)
+            }
+        return {
+            "rate_per_second": self.rate,
+            "burst": self.burst,
+            "tokens": round(self._tokens, 2),
+            "paused_for": round(max(0.0, self._paused_until - now), 3),
+            "lanes": lanes
+        }
+
+
+outbound_scheduler = OutboundScheduler(
+    settings.WHATSAPP_MESSAGES_PER_SECOND
+    or THROUGHPUT_TIERS.get(settings.WHATSAPP_THROUGHPUT_TIER, THROUGHPUT_TIERS["standard"])
+)
+
+def _retry_after(response: httpx.Response) -> Optional[float]:
+    """Segundos del header Retry-After, si viene"""
+    try:
+        return float(response.headers["Retry-After"])
+    except (KeyError, ValueError):
+        return None
+
 class WhatsAppService:
     """Servicio para manejar la comunicación con WhatsApp Business API"""
     
@@ -15,96 +147,116 @@ class WhatsAppService:
         self.token = settings.WHATSAPP_TOKEN
         self.phone_id = settings.WHATSAPP_PHONE_ID
         self.api_url = f"{settings.WHATSAPP_API_URL}/{self.phone_id}/messages"
-        self.processed_messages = set()  # Para evitar duplicados
-        
-    async def send_message(self, to: str, message: str) -> bool:
-        """
-        Envía un mensaje de WhatsApp
-        
-        Args:
-            to: Número de teléfono del destinatario
-            message: Texto del mensaje
-            
-        Returns:
-            bool: True si se envió correctamente, False si hubo error
-        """
-        if not self.token or not self.phone_id:
-            logger.error("WhatsApp credentials not configured")
-            return False
-            
-        headers = {
-            "Authorization": f"Bearer {self.token}",
-            "Content-Type": "application/json"
-        }
+        # parse_webhook es síncrono: registro en memoria del proceso; el registro
+        # compartido (DEDUP_BACKEND=sql) lo usa el chatbot dentro de su transacción
+        self.processed_messages = create_deduplicator("memory")  # Para evitar duplicados
         
-        data = {
+    @staticmethod
+    def text_payload(to: str, message: str) -> Dict[str, Any]:
+        """Cuerpo del POST para un mensaje de texto"""
+        return {
             "messaging_product": "whatsapp",
             "to": to,
             "type": "text",
             "text": {"body": message}
         }
+    
+    @staticmethod
+    def template_payload(to: str, template_name: str, parameters: list = None, language: str = "es") -> Dict[str, Any]:
+        """Cuerpo del POST para una plantilla (los parámetros van al cuerpo)"""
+        data = {
+            "messaging_product": "whatsapp",
+            "to": to,
+            "type": "template",
+            "template": {
+                "name": template_name,
+                "language": {"code": language}
+            }
+        }
         
-        try:
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    self.api_url,
-                    json=data,
-                    headers=headers
-                )
-                
-                if response.status_code == 200:
-                    logger.info(f"Message sent successfully to {to}")
-                    return True
-                else:
-                    logger.error(f"Error sending message: {response.text}")
-                    return False
-                    
-        except Exception as e:
-            logger.error(f"Exception sending message: {str(e)}")
-            return False
+        # Agregar parámetros si existen
+        if parameters:
+            data["template"]["components"] = [{
+                "type": "body",
+                "parameters": [{"type": "text", "text": p} for p in parameters]
+            }]
+        return data
     
-    def send_message_sync(self, to: str, message: str) -> bool:
+    async def post_message(self, data: Dict[str, Any], priority: int = PRIORITY_INTERACTIVE) -> Dict[str, Any]:
         """
-        Versión síncrona para enviar mensaje (para compatibilidad)
+        Envía un cuerpo ya armado a la Graph API y clasifica el resultado
+        
+        Args:
+            data: Cuerpo del POST (ver text_payload)
+            priority: Carril del planificador (PRIORITY_*)
+            
+        Returns:
+            Dict con ok, message_id (wamid), status_code, error, retryable
+            (error de red, 5xx o límite de envío) y retry_after (segundos)
         """
         if not self.token or not self.phone_id:
             logger.error("WhatsApp credentials not configured")
-            return False
-            
+            return {"ok": False, "message_id": None, "status_code": None,
+                    "error": "WhatsApp credentials not configured", "retryable": False, "retry_after": None}
+        
         headers = {
             "Authorization": f"Bearer {self.token}",
             "Content-Type": "application/json"
         }
         
-        data = {
-            "messaging_product": "whatsapp",
-            "to": to,
-            "type": "text",
-            "text": {"body": message}
-        }
-        
+        await outbound_scheduler.acquire(priority)
         try:
-            response = httpx.post(
+            client = get_http_client()
+            response = await client.post(
                 self.api_url,
                 json=data,
-                headers=headers,
-                timeout=10
+                headers=headers
             )
-            
-            if response.status_code == 200:
-                logger.info(f"Message sent successfully to {to}")
-                return True
-            else:
-                logger.error(f"Error sending message: {response.text}")
-                return False
-                
         except Exception as e:
             logger.error(f"Exception sending message: {str(e)}")
-            return False
+            return {"ok": False, "message_id": None, "status_code": None,
+                    "error": str(e) or type(e).__name__, "retryable": True, "retry_after": None}
+        
+        try:
+            body = response.json()
+        except ValueError:
+            body = {}
+        
+        if response.status_code == 200:
+            messages = body.get("messages") or [{}]
+            logger.info(f"Message sent successfully to {data.get('to')}")
+            return {"ok": True, "message_id": messages[0].get("id"), "status_code": 200,
+                    "error": None, "retryable": False, "retry_after": None}
+        
+        error_code = (body.get("error") or {}).get("code")
+        retryable = (
+            response.status_code == 429
+            or response.status_code >= 500
+            or error_code in RATE_LIMIT_ERROR_CODES
+        )
+        if response.status_code == 429 or error_code in THROUGHPUT_ERROR_CODES:
+            outbound_scheduler.pause(_retry_after(response) or 1.0)
+        logger.error(f"Error sending message: {response.text}")
+        return {"ok": False, "message_id": None, "status_code": response.status_code,
+                "error": response.text[:1000], "retryable": retryable, "retry_after": _retry_after(response)}
+    
+    async def send_message(self, to: str, message: str, priority: int = PRIORITY_FOLLOW_UP) -> bool:
+        """
+        Envía un mensaje de WhatsApp
+        
+        Args:
+            to: Número de teléfono del destinatario
+            message: Texto del mensaje
+            priority: Carril del planificador (PRIORITY_*)
+            
+        Returns:
+            bool: True si se envió correctamente, False si hubo error
+        """
+        return (await self.post_message(self.text_payload(to, message), priority))["ok"]
     
     def parse_webhook(self, data: Dict[Any, Any]) -> Optional[Dict[str, Any]]:
         """
-        Parsea el webhook de WhatsApp y extrae la información del mensaje
+        Parsea el webhook de WhatsApp y extrae el primer mensaje no procesado
         
         Args:
             data: Datos del webhook
@@ -112,50 +264,27 @@ class WhatsAppService:
         Returns:
             Dict con la información del mensaje o None si no es válido
         """
-        try:
-            # Verificar estructura del webhook
-            if "entry" not in data or not data["entry"]:
-                return None
-                
-            entry = data["entry"][0]
-            if "changes" not in entry or not entry["changes"]:
-                return None
-                
-            change = entry["changes"][0]
-            if "value" not in change:
-                return None
-                
-            value = change["value"]
-            if "messages" not in value or not value["messages"]:
-                return None
-                
-            message = value["messages"][0]
-            message_id = message.get("id")
-            
-            # Verificar si ya procesamos este mensaje
-            if message_id in self.processed_messages:
-                logger.info(f"Message {message_id} already processed, skipping")
-                return None
-                
-            # Marcar como procesado
-            self.processed_messages.add(message_id)
-            
-            # Limpiar mensajes antiguos del set (mantener solo últimos 1000)
-            if len(self.processed_messages) > 1000:
-                self.processed_messages.clear()
-            
-            # Extraer información del mensaje
-            return {
-                "id": message_id,
-                "from": message.get("from"),
-                "text": message.get("text", {}).get("body", ""),
-                "timestamp": message.get("timestamp"),
-                "type": message.get("type", "text")
-            }
+        return next(self.parse_webhook_messages(data), None)
+    
+    def parse_webhook_messages(self, data: Dict[Any, Any]) -> Iterator[Dict[str, Any]]:
+        """
+        Recorre todos los mensajes del webhook (todas las entries y changes)
+        
+        Args:
+            data: Datos del webhook
             
+        Yields:
+            Dict con la información de cada mensaje que no sea duplicado
+        """
+        try:
+            for message in iter_webhook_messages(data):
+                # Verificar si ya procesamos este mensaje (y marcarlo como procesado)
+                if self.processed_messages.check_and_mark(message["id"]):
+                    logger.info(f"Message {message['id']} already processed, skipping")
+                    continue
+                yield message
         except Exception as e:
             logger.error(f"Error parsing webhook: {str(e)}")
-            return None
     
     def verify_webhook(self, token: str, challenge: str) -> Optional[str]:
         """
@@ -194,7 +323,13 @@ class WhatsAppService:
             
         return phone
     
-    async def send_template_message(self, to: str, template_name: str, parameters: list = None) -> bool:
+    async def send_template_message(
+        self,
+        to: str,
+        template_name: str,
+        parameters: list = None,
+        priority: int = PRIORITY_FOLLOW_UP
+    ) -> bool:
         """
         Envía un mensaje usando una plantilla de WhatsApp
         
@@ -202,54 +337,12 @@ class WhatsAppService:
             to: Número de destino
             template_name: Nombre de la plantilla
             parameters: Parámetros de la plantilla
+            priority: Carril del planificador (PRIORITY_*)
             
         Returns:
             bool: True si se envió correctamente
         """
-        if not self.token or not self.phone_id:
-            logger.error("WhatsApp credentials not configured")
-            return False
-            
-        headers = {
-            "Authorization": f"Bearer {self.token}",
-            "Content-Type": "application/json"
-        }
-        
-        data = {
-            "messaging_product": "whatsapp",
-            "to": to,
-            "type": "template",
-            "template": {
-                "name": template_name,
-                "language": {"code": "es"}
-            }
-        }
-        
-        # Agregar parámetros si existen
-        if parameters:
-            data["template"]["components"] = [{
-                "type": "body",
-                "parameters": [{"type": "text", "text": p} for p in parameters]
-            }]
-        
-        try:
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    self.api_url,
-                    json=data,
-                    headers=headers
-                )
-                
-                if response.status_code == 200:
-                    logger.info(f"Template message sent successfully to {to}")
-                    return True
-                else:
-                    logger.error(f"Error sending template message: {response.text}")
-                    return False
-                    
-        except Exception as e:
-            logger.error(f"Exception sending template message: {str(e)}")
-            return False
+        return (await self.post_message(self.template_payload(to, template_name, parameters), priority))["ok"]
     
     def is_message_duplicate(self, message_id: str) -> bool:
         """
@@ -261,4 +354,4 @@ class WhatsAppService:
         Returns:
             bool: True si es duplicado, False si no
         """
-        return message_id in self.processed_messages
+        return self.processed_messages.contains(message_id)
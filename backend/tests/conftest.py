@@ -0,0 +1,26 @@
+# backend/tests/conftest.py
+"""
+Configuración común de las pruebas.
+
+Corren sobre una base SQLite temporal (aiosqlite para la sesión asíncrona)
+o, si se define TEST_DATABASE_URL, sobre esa base (p. ej. un PostgreSQL
+desechable, para probar los bloqueos de filas reales); DATABASE_URL se fija
+antes de importar cualquier módulo del backend.
+Ejecutar desde backend/: python -m pytest tests
+"""
+
+import os
+import sys
+import tempfile
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+_db_dir = tempfile.mkdtemp(prefix="hgw-tests-")
+os.environ["DATABASE_URL"] = os.getenv("TEST_DATABASE_URL") or f"sqlite:///{os.path.join(_db_dir, 'test.db')}"
+os.environ["DEDUP_BACKEND"] = "memory"
+os.environ["USE_NGROK"] = "false"
+os.environ["USE_OPENAI"] = "false"
+os.environ["WHATSAPP_TOKEN"] = ""
+os.environ["WHATSAPP_PHONE_ID"] = ""
@@ -0,0 +1,116 @@
+# backend/tests/test_async_load.py
+"""
+Carga sobre la ruta asíncrona del chatbot (get_async_db + process_messages).
+
+Muchos lotes simultáneos, con ambos registros de deduplicación, mientras un
+latido mide el atraso del event loop. Además se vigila el engine síncrono:
+cualquier sentencia suya ejecutada desde el hilo del loop (como hacía el
+registro SQL de IDs con SessionLocal) bloquea todas las demás corrutinas.
+"""
+
+import asyncio
+import time
+
+import pytest
+from sqlalchemy import delete, event, func, select
+
+from chatbot import ChatbotService
+from database import AsyncSessionLocal, Base, SessionLocal, async_engine, engine, get_async_db
+from models import Conversation, Lead, Message, OutboundMessage, ProcessedMessage
+from services.dedup import create_deduplicator
+
+PHONES = 20
+BATCHES_PER_PHONE = 5
+TICK = 0.01
+
+
+def _count(model):
+    db = SessionLocal()
+    try:
+        return db.scalar(select(func.count()).select_from(model))
+    finally:
+        db.close()
+
+
+@pytest.fixture(params=["memory", "sql"])
+def chatbot(request):
+    Base.metadata.create_all(bind=engine)
+    service = ChatbotService()
+    service.processed_messages = create_deduplicator(request.param)
+    yield service
+    db = SessionLocal()
+    for model in (OutboundMessage, Message, Conversation, Lead, ProcessedMessage):
+        db.execute(delete(model))
+    db.commit()
+    db.close()
+
+
+@pytest.fixture()
+def sync_on_loop():
+    """Sentencias del engine síncrono ejecutadas con un event loop corriendo en el hilo"""
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    yield statements
+    event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+
+async def _heartbeat(lags: list, stop: asyncio.Event):
+    while not stop.is_set():
+        expected = time.perf_counter() + TICK
+        await asyncio.sleep(TICK)
+        lags.append(max(0.0, time.perf_counter() - expected))
+
+
+async def _webhook_batch(chatbot, phone: str, batch: int):
+    """Igual que process_webhook_batch en app.py, con la dependencia de las rutas"""
+    messages = [
+        {"id": f"wamid.{phone}.{batch}.{n}", "from": phone, "text": text, "type": "text"}
+        for n, text in enumerate(("hola", "precio"))
+    ]
+    # Meta reenvía parte de los mensajes: el duplicado no se vuelve a guardar
+    if batch % 2:
+        messages.append(dict(messages[0]))
+    async for db in get_async_db():
+        return await chatbot.process_messages(messages, db)
+
+
+def test_concurrent_batches_do_not_block_the_event_loop(chatbot, sync_on_loop):
+    async def scenario():
+        lags, stop = [], asyncio.Event()
+        heartbeat = asyncio.create_task(_heartbeat(lags, stop))
+        try:
+            results = await asyncio.gather(*(
+                _webhook_batch(chatbot, f"57300{phone:05d}", batch)
+                for phone in range(PHONES)
+                for batch in range(BATCHES_PER_PHONE)
+            ))
+            # Reenvío completo de un lote ya confirmado
+            results.append(await _webhook_batch(chatbot, "5730000000", 0))
+        finally:
+            stop.set()
+            await heartbeat
+            await async_engine.dispose()
+        return results, lags
+
+    results, lags = asyncio.run(scenario())
+
+    assert sync_on_loop == []
+    assert results[-1] == []
+    assert all(len(responses) == 2 for responses in results[:-1])
+
+    batches = PHONES * BATCHES_PER_PHONE
+    assert _count(Message) == batches * 4
+    assert _count(OutboundMessage) == batches * 2
+    assert _count(Conversation) == PHONES
+    if hasattr(chatbot.processed_messages, "purge"):
+        assert _count(ProcessedMessage) == batches * 2
+    # Holgado para una sola CPU: solo detecta bloqueos largos del loop
+    assert max(lags) < 0.5
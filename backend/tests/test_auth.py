@@ -0,0 +1,64 @@
+# backend/tests/test_auth.py
+"""Login contra ADMIN_PASSWORD y bcrypt en el pool de hilos (auth.py)"""
+
+import asyncio
+import threading
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import delete
+
+import app as app_module
+import auth
+from auth import get_password_hash, get_password_hash_async, verify_password_async
+from database import SessionLocal
+from models import AdminUser
+
+
+@pytest.fixture()
+def client(monkeypatch):
+    monkeypatch.setenv("ADMIN_PASSWORD", "clave-env")
+    with TestClient(app_module.app) as client:
+        yield client
+
+
+def _login(client, username, password):
+    return client.post("/api/auth/login", data={"username": username, "password": password})
+
+
+def test_login_with_env_admin_password(client):
+    assert _login(client, "admin", "clave-env").status_code == 200
+    assert _login(client, "admin", "admin123").status_code == 401
+
+
+def test_admin_users_rows_do_not_grant_login(client):
+    db = SessionLocal()
+    db.add(AdminUser(username="richard", password=get_password_hash("secreto123")))
+    db.commit()
+    try:
+        assert _login(client, "richard", "secreto123").status_code == 401
+    finally:
+        db.execute(delete(AdminUser))
+        db.commit()
+        db.close()
+
+
+def test_hash_and_verify_run_in_password_pool(monkeypatch):
+    threads = []
+    originals = {name: getattr(auth, name) for name in ("get_password_hash", "verify_password")}
+
+    def spy(name):
+        def wrapper(*args):
+            threads.append(threading.current_thread().name)
+            return originals[name](*args)
+        return wrapper
+
+    for name in originals:
+        monkeypatch.setattr(auth, name, spy(name))
+
+    async def scenario():
+        hashed = await get_password_hash_async("secreto123")
+        return await verify_password_async("secreto123", hashed), await verify_password_async("otra", hashed)
+
+    assert asyncio.run(scenario()) == (True, False)
+    assert len(threads) == 3 and all(name.startswith("bcrypt") for name in threads)
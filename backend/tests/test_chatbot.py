@@ -0,0 +1,133 @@
+# backend/tests/test_chatbot.py
+"""
+Transacciones del chatbot: las respuestas se generan sin transacción abierta
+y el registro de IDs va en la misma transacción que el lote.
+"""
+
+import asyncio
+
+import pytest
+from sqlalchemy import delete, func, select
+
+from chatbot import ChatbotService
+from database import AsyncSessionLocal, Base, SessionLocal, async_engine, engine
+from models import Conversation, Lead, Message, OutboundMessage, ProcessedMessage
+from repositories.chat_repository import ChatRepository
+from services.dedup import create_deduplicator
+
+PHONE = "573001112233"
+
+
+def _message(message_id, text="hola"):
+    return {"id": message_id, "from": PHONE, "text": text, "type": "text"}
+
+
+def _count(model):
+    db = SessionLocal()
+    try:
+        return db.scalar(select(func.count()).select_from(model))
+    finally:
+        db.close()
+
+
+def _run(coroutine):
+    async def scenario():
+        try:
+            return await coroutine
+        finally:
+            # Cada asyncio.run usa su propio loop: no se reutilizan conexiones
+            await async_engine.dispose()
+    return asyncio.run(scenario())
+
+
+@pytest.fixture(params=["memory", "sql"])
+def chatbot(request):
+    Base.metadata.create_all(bind=engine)
+    service = ChatbotService()
+    service.processed_messages = create_deduplicator(request.param)
+    yield service
+    db = SessionLocal()
+    for model in (OutboundMessage, Message, Conversation, Lead, ProcessedMessage):
+        db.execute(delete(model))
+    db.commit()
+    db.close()
+
+
+async def _process(chatbot, messages):
+    async with AsyncSessionLocal() as db:
+        return await chatbot.process_messages(messages, db)
+
+
+def test_redelivery_is_processed_after_rollback(chatbot, monkeypatch):
+    async def broken(self, messages):
+        raise RuntimeError("database unavailable")
+
+    with monkeypatch.context() as patched:
+        patched.setattr(ChatRepository, "add_messages", broken)
+        with pytest.raises(RuntimeError):
+            _run(_process(chatbot, [_message("wamid.1")]))
+
+    assert _count(Message) == 0
+    assert _count(ProcessedMessage) == 0
+
+    # Meta reenvía el mismo mensaje: no se descarta como duplicado
+    assert len(_run(_process(chatbot, [_message("wamid.1")]))) == 1
+    assert _count(Message) == 2
+    assert _count(OutboundMessage) == 1
+
+
+def test_redelivery_after_commit_is_skipped(chatbot):
+    assert len(_run(_process(chatbot, [_message("wamid.1"), _message("wamid.1")]))) == 1
+    assert _run(_process(chatbot, [_message("wamid.1")])) == []
+    assert _count(Message) == 2
+    assert _count(OutboundMessage) == 1
+
+
+def test_sql_registry_is_shared_between_workers(chatbot):
+    if not hasattr(chatbot.processed_messages, "purge"):
+        pytest.skip("solo DEDUP_BACKEND=sql")
+    _run(_process(chatbot, [_message("wamid.1")]))
+    assert _count(ProcessedMessage) == 1
+
+    # Otro worker: caché local vacía, el registro está en la base
+    other = ChatbotService()
+    other.processed_messages = create_deduplicator("sql")
+    assert _run(_process(other, [_message("wamid.1"), _message("wamid.2", "precio")])) != []
+    assert _count(Message) == 4
+
+
+def test_replies_are_generated_without_an_open_transaction(chatbot, monkeypatch):
+    _run(_process(chatbot, [_message("wamid.1", "soy Richard")]))
+    states = []
+    original = ChatbotService._generate_response
+
+    async def spy(self, text, user_name=None, history=()):
+        states.append((session.in_transaction(), user_name))
+        return await original(self, text, user_name, history)
+
+    async def scenario():
+        nonlocal session
+        async with AsyncSessionLocal() as session:
+            return await chatbot.process_messages([_message("wamid.2", "precio")], session)
+
+    session = None
+    monkeypatch.setattr(ChatbotService, "_generate_response", spy)
+    assert len(_run(scenario())) == 1
+    # El nombre se leyó antes y la transacción de lectura ya estaba cerrada
+    assert states == [(False, "Richard")]
+    assert _count(Message) == 4
+
+
+def test_outbox_rows_point_to_their_assistant_messages(chatbot):
+    _run(_process(chatbot, [_message("wamid.1", "hola"), _message("wamid.2", "precio")]))
+    db = SessionLocal()
+    try:
+        rows = db.execute(
+            select(OutboundMessage.payload, Message.role, Message.content)
+            .join(Message, Message.id == OutboundMessage.message_id)
+            .order_by(OutboundMessage.id)
+        ).all()
+    finally:
+        db.close()
+    assert [role for _, role, _ in rows] == ["assistant", "assistant"]
+    assert all(payload["text"]["body"] == content for payload, _, content in rows)
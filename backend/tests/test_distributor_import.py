@@ -0,0 +1,79 @@
+# backend/tests/test_distributor_import.py
+"""Importación masiva de distribuidores: el CSV se lee fuera del event loop"""
+
+import asyncio
+import io
+import threading
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import delete, select
+
+import app as app_module
+from auth import create_access_token
+from database import SessionLocal
+from models import Distributor
+from services import distributor_bulk
+
+CSV = (
+    "nombres;apellidos;telefono;email;fecha_ingreso;usuario;contrasena\n"
+    "Ana;Gómez;3001234567;ana@example.com;2024-01-15;anagomez;secreto1\n"
+    "Luis;Pérez;3007654321;;2024-02-01;luisperez;secreto2\n"
+    "Eva;Ruiz;3001234567;;2024-03-01;evaruiz;secreto3\n"
+    "X;Y;123;;fecha;xy;corta\n"
+)
+
+
+@pytest.fixture()
+def client():
+    try:
+        with TestClient(app_module.app) as client:
+            client.headers["Authorization"] = f"Bearer {create_access_token({'sub': 'admin', 'role': 'admin'})}"
+            yield client
+    finally:
+        db = SessionLocal()
+        db.execute(delete(Distributor))
+        db.commit()
+        db.close()
+
+
+def test_import_reports_each_row(client):
+    response = client.post(
+        "/api/distributors/bulk/import",
+        files={"file": ("equipo.csv", CSV.encode("cp1252"), "text/csv")}
+    )
+    assert response.status_code == 200, response.text
+    report = response.json()
+
+    assert (report["total"], report["created"], report["failed"]) == (4, 2, 2)
+    assert [(r["line"], r["status"]) for r in report["results"]] == [
+        (2, "created"), (3, "created"), (4, "error"), (5, "error")
+    ]
+    assert report["results"][2]["errors"] == ["telefono: repetido en el archivo"]
+
+    db = SessionLocal()
+    try:
+        names = db.scalars(select(Distributor.apellidos).order_by(Distributor.id)).all()
+    finally:
+        db.close()
+    assert names == ["Gómez", "Pérez"]
+
+
+def test_rows_are_parsed_in_the_threadpool(monkeypatch):
+    threads = []
+    original = distributor_bulk.iter_csv_rows
+
+    def spy(file):
+        for row in original(file):
+            threads.append(threading.get_ident())
+            yield row
+
+    monkeypatch.setattr(distributor_bulk, "iter_csv_rows", spy)
+
+    async def scenario():
+        rows = [row async for row in distributor_bulk.aiter_csv_rows(io.BytesIO(CSV.encode()), chunk_size=2)]
+        return rows, threading.get_ident()
+
+    rows, loop_thread = asyncio.run(scenario())
+    assert [row["usuario"] for row in rows] == ["anagomez", "luisperez", "evaruiz", "xy"]
+    assert len(threads) == 4 and loop_thread not in threads
@@ -0,0 +1,248 @@
+# backend/tests/test_intent_matcher.py
+"""
+Paridad entre el IntentMatcher compilado y la cadena if/elif original.
+
+Las funciones legacy_* son copia literal de las condiciones que tenía
+chatbot.py antes de compilar las reglas: si alguien cambia una regla o el
+orden en AUTO_RESPONSE_RULES, PROFILE_RULES o INTEREST_RULES sin querer,
+estas pruebas lo detectan.
+"""
+
+import itertools
+import random
+
+import pytest
+
+from chatbot import (
+    AUTO_RESPONSE_MATCHER, AUTO_RESPONSE_RULES, INTEREST_RULES, MENU_OPTIONS,
+    PROFILE_RULES, ChatbotService
+)
+from services.intent_matcher import IntentMatcher
+
+
+# ==================== CADENA ORIGINAL ====================
+
+def legacy_auto_intent(text):
+    t = text.lower().strip()
+    if t in ["1", "1️⃣"]:
+        t = "qué es hgw"
+    elif t in ["2", "2️⃣"]:
+        t = "qué tengo que hacer"
+    elif t in ["3", "3️⃣"]:
+        t = "inversión"
+    elif t in ["4", "4️⃣"]:
+        t = "recuperar inversión"
+    elif t in ["5", "5️⃣"]:
+        t = "cuándo gano"
+    elif t in ["6", "6️⃣"]:
+        t = "productos"
+    elif t in ["7", "7️⃣"]:
+        t = "richard"
+
+    if any(w in t for w in ["hola", "buenas", "buenos días", "buenas tardes", "hi", "hello"]) and len(t) < 25:
+        return "saludo"
+    if any(w in t for w in ["qué es hgw", "que es hgw", "qué es", "que es", "empresa", "compañía", "explicame hgw", "sobre hgw", "cuéntame de hgw"]):
+        return "que_es_hgw"
+    if any(w in t for w in ["qué tengo que hacer", "que tengo que hacer", "qué hago", "que hago", "actividades", "tareas", "trabajo diario", "responsabilidades"]):
+        return "que_hacer"
+    if any(w in t for w in ["inversión", "inversion", "cuánto cuesta", "cuanto cuesta", "precio", "cuanto necesito", "cuánto necesito", "planes", "membresia", "membresía", "paquetes"]):
+        return "inversion"
+    if any(w in t for w in ["recuperar", "recupero", "cuándo recupero", "cuando recupero", "devolver", "regresa", "tiempo de recuperación"]):
+        return "recuperacion"
+    if any(w in t for w in ["cuándo gano", "cuando gano", "cuándo empiezo a ganar", "cuando empiezo a ganar", "ganancias", "ganar dinero", "utilidad", "cuanto gano", "cuánto gano", "ingresos"]):
+        return "ganancias"
+    if any(w in t for w in ["resumen", "todo", "5 puntos", "5 preguntas", "explicame todo", "todo junto"]):
+        return "resumen"
+    if any(w in t for w in ["unirme", "unir", "inscribirme", "registrarme", "ser parte", "entrar", "quiero empezar", "empezar"]):
+        return "unirse"
+    if any(w in t for w in ["producto", "qué venden", "qué tienen", "catalogo", "catálogo"]) and not any(x in t for x in ["blueberry", "cafe", "omega", "espirulina", "pasta", "jabon", "shampoo", "toalla", "collar", "termo"]):
+        return "catalogo"
+    if any(w in t for w in ["blueberry", "arandano", "arándano"]) and not any(x in t for x in ["fresh", "regaliz"]):
+        return "arandano"
+    if any(w in t for w in ["fresh candy", "regaliz", "caramelo regaliz"]):
+        return "fresh_candy"
+    if any(w in t for w in ["cafe", "café", "ganoderma", "cordyceps", "coffee"]):
+        return "cafe"
+    if any(w in t for w in ["omega", "espirulina", "suplemento"]):
+        return "suplementos"
+    if any(w in t for w in ["pasta dental", "dientes", "toothpaste"]):
+        return "pasta_dental"
+    if any(w in t for w in ["jabon", "jabón", "turmalina", "oliva"]):
+        return "jabones"
+    if any(w in t for w in ["shampoo", "champú", "keratina", "cabello"]):
+        return "shampoo"
+    if any(w in t for w in ["toalla sanitaria", "toallas", "femenino", "menstruacion", "menstruación"]):
+        return "toallas"
+    if any(w in t for w in ["termo", "collar", "pulsera", "turmalina", "accesorio"]):
+        return "accesorios"
+    if any(w in t for w in ["tiempo", "ocupado", "no tengo tiempo", "trabajo mucho"]):
+        return "sin_tiempo"
+    if any(w in t for w in ["salud", "bienestar", "energía", "cansado", "energia", "vitaminas", "natural"]):
+        return "bienestar"
+    if any(w in t for w in ["richard", "llamar", "contacto", "hablar", "agendar", "numero", "número", "telefono", "teléfono"]):
+        return "contacto_richard"
+    if any(w in t for w in ["testimonio", "experiencia", "funciona", "resultados", "casos de exito"]):
+        return "testimonios"
+    if any(w in t for w in ["no sé", "no se", "duda", "pregunta", "no entiendo"]):
+        return "dudas"
+    if any(w in t for w in ["inscribir", "registrar", "como me inscribo", "cómo me registro", "como inicio"]):
+        return "inscripcion"
+    if any(w in t for w in ["no puedo", "no se como", "no sé cómo", "ayuda", "dificultad", "problema", "error"]):
+        return "soporte"
+    if any(w in t for w in ["aplicacion", "aplicación", "app", "descargar app", "instalar app", "descargar aplicacion", "movil", "móvil", "celular"]):
+        return "app_descarga"
+    if any(w in t for w in ["ayuda app", "problema app", "no instala", "no funciona app", "error app"]):
+        return "app_problemas"
+    if any(w in t for w in ["backoffice", "back office", "ingresar", "login", "iniciar sesion", "iniciar sesión"]):
+        return "backoffice"
+    if any(w in t for w in ["membresia", "membresía", "comprar membresia", "adquirir membresia", "activar"]):
+        return "membresia"
+    if any(w in t for w in ["pedido", "comprar productos", "hacer pedido", "ordenar", "comprar"]):
+        return "pedido"
+    if any(w in t for w in ["comision", "comisión", "cobrar", "ganancias", "retiro", "retirar", "dinero", "pagar"]):
+        return "comisiones"
+    if any(w in t for w in ["referido", "enlace", "link", "invitar", "compartir", "reclutar"]):
+        return "referidos"
+    if any(w in t for w in ["red", "equipo", "socios", "downline", "genealogia", "genealogía"]):
+        return "red"
+    if any(w in t for w in ["material", "catalogo", "catálogo", "folleto", "informacion productos", "información productos"]):
+        return "material"
+    if any(w in t for w in ["cambiar datos", "actualizar datos", "modificar datos", "direccion", "dirección", "telefono", "teléfono"]):
+        return "datos"
+    if any(w in t for w in ["tutoriales", "videos", "todos los tutoriales", "lista de tutoriales"]):
+        return "tutoriales"
+    return None
+
+
+def legacy_profile(text):
+    text_lower = text.lower()
+    if any(w in text_lower for w in ["tiempo", "ocupado", "trabajo", "empleado"]):
+        return "sin_tiempo"
+    elif any(w in text_lower for w in ["dinero", "joven", "estudiante", "poco presupuesto"]):
+        return "joven_economico"
+    elif any(w in text_lower for w in ["salud", "bienestar", "natural", "enfermedad"]):
+        return "bienestar"
+    elif any(w in text_lower for w in ["negocio", "emprender", "ganar", "ingresos", "libertad financiera"]):
+        return "emprendedor"
+    return "otro"
+
+
+def legacy_interest(text):
+    text_lower = text.lower()
+    if any(w in text_lower for w in ["quiero empezar", "inscribirme", "registrarme", "cuánto cuesta"]):
+        return 9
+    elif any(w in text_lower for w in ["me interesa", "cuéntame más", "información"]):
+        return 7
+    elif any(w in text_lower for w in ["quizás", "tal vez", "no sé"]):
+        return 4
+    elif any(w in text_lower for w in ["no gracias", "no interesa"]):
+        return 1
+    return 5
+
+
+# ==================== CORPUS ====================
+
+def _keywords(rules):
+    words = []
+    for rule in rules:
+        for word in rule["keywords"] + rule.get("exclude", []):
+            if word not in words:
+                words.append(word)
+    return words
+
+
+KEYWORDS = _keywords(AUTO_RESPONSE_RULES + PROFILE_RULES + INTEREST_RULES)
+
+FILLERS = ["", "hola", "por favor", "y", "?", "¿", "quiero saber", "gracias", "ok", "xyz"]
+
+SENTENCES = [
+    "Hola", "hola!", "Buenas tardes, quería información", "hi", "HELLO THERE",
+    "Hola, quiero saber qué es HGW y cuánto cuesta la membresía del plan más completo",
+    "¿Qué es HGW?", "que tengo que hacer todos los dias", "cuanto cuesta", "Cuánto necesito para empezar",
+    "cuando recupero la inversión", "cuándo gano dinero", "dame un resumen", "quiero unirme",
+    "qué productos tienen", "producto de cafe", "catalogo de blueberry", "fresh candy de blueberry",
+    "arándano", "café con ganoderma", "omega 3", "pasta dental", "jabón de turmalina",
+    "shampoo de keratina", "toallas sanitarias", "termo", "no tengo tiempo", "estoy cansado",
+    "quiero hablar con richard", "testimonios reales", "no sé", "cómo me registro", "no puedo entrar",
+    "descargar app", "la app no instala", "backoffice", "activar membresía", "hacer pedido",
+    "retirar mis comisiones", "link de referido", "mi red de socios", "material de apoyo",
+    "cambiar datos de dirección", "todos los tutoriales", "", "   ", "asdfgh", "1", "2️⃣", "7", "8",
+    "soy estudiante y busco ganar dinero", "trabajo mucho pero me interesa", "no gracias",
+    "tal vez luego", "me interesa la libertad financiera", "información por favor",
+]
+
+
+def build_corpus():
+    corpus = list(SENTENCES) + list(MENU_OPTIONS)
+    corpus += KEYWORDS + [k.upper() for k in KEYWORDS] + [f"  {k}  " for k in KEYWORDS]
+    corpus += [f"{a} {b}" for a, b in itertools.product(KEYWORDS, repeat=2)]
+    rng = random.Random(20241017)
+    pieces = KEYWORDS + FILLERS
+    for _ in range(3000):
+        corpus.append(" ".join(rng.choice(pieces) for _ in range(rng.randint(1, 6))))
+    # Sin espacios: palabras clave que se solapan dentro de otras
+    for _ in range(1000):
+        corpus.append("".join(rng.choice(KEYWORDS) for _ in range(rng.randint(2, 3))))
+    return corpus
+
+
+CORPUS = build_corpus()
+
+
+# ==================== PRUEBAS ====================
+
+def test_corpus_covers_every_rule():
+    hit = {legacy_auto_intent(text) for text in CORPUS}
+    assert {rule["intent"] for rule in AUTO_RESPONSE_RULES} - hit <= {"app_problemas"}
+    # app_problemas nunca gana en la cadena original (soporte y app_descarga van antes)
+    assert len(CORPUS) > 10000
+
+
+def test_auto_response_parity():
+    mismatches = []
+    for text in CORPUS:
+        t = text.lower().strip()
+        compiled = AUTO_RESPONSE_MATCHER.match(MENU_OPTIONS.get(t, t))
+        if compiled != legacy_auto_intent(text):
+            mismatches.append((text, legacy_auto_intent(text), compiled))
+    assert not mismatches, mismatches[:20]
+
+
+def test_profile_and_interest_parity():
+    service = ChatbotService()
+    for text in CORPUS:
+        assert service._detect_profile(text) == legacy_profile(text), text
+        assert service._detect_interest(text) == legacy_interest(text), text
+
+
+def test_auto_response_uses_matched_intent():
+    service = ChatbotService()
+    assert service._get_auto_response("asdfgh") is None
+    assert "PREGUNTA 1" in service._get_auto_response("1")
+    assert "Ana" in service._get_auto_response("hola", "Ana")
+    # Saludo largo: ya no es saludo, cae en la siguiente regla que aplique
+    assert "PREGUNTA 3" in service._get_auto_response("hola, cuánto cuesta entrar al negocio?")
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("hola", "saludo"),
+    ("hola, quiero saber cuánto cuesta", "inversion"),
+    ("producto omega", "suplementos"),
+    ("fresh candy blueberry", "fresh_candy"),
+    ("blueberry fresh", None),
+])
+def test_priority_and_guards(text, expected):
+    assert AUTO_RESPONSE_MATCHER.match(text) == expected
+
+
+def test_matcher_first_rule_wins():
+    matcher = IntentMatcher([
+        {"intent": "a", "keywords": ["abc"], "exclude": ["x"]},
+        {"intent": "b", "keywords": ["bc"]},
+        {"intent": "c", "keywords": ["c"], "max_length": 3},
+    ])
+    assert matcher.match("abc") == "a"
+    assert matcher.match("abcx") == "b"
+    assert matcher.match("c") == "c"
+    assert matcher.match("zzzc") is None
+    assert matcher.match("") is None
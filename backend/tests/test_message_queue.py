@@ -0,0 +1,73 @@
+# backend/tests/test_message_queue.py
+"""
+Cola de webhooks: Meta ya recibió su 200, así que un fallo se reintenta en
+el worker y lo que se descarta queda en el log con sus IDs.
+"""
+
+import asyncio
+import logging
+
+from services.message_queue import MessageQueue
+
+
+def _describe(item):
+    return f"ids {item}"
+
+
+def test_failed_item_is_retried_in_order_before_the_next_one():
+    calls = []
+
+    async def handler(item):
+        calls.append(item)
+        if item == ["a"] and calls.count(["a"]) < 3:
+            raise RuntimeError("database is locked")
+
+    async def scenario():
+        queue = MessageQueue(handler, workers=1, retry_delay=0, describe=_describe)
+        queue.start()
+        queue.enqueue("573001", ["a"])
+        queue.enqueue("573001", ["b"])
+        await queue.stop(timeout=5)
+
+    asyncio.run(scenario())
+    assert calls == [["a"], ["a"], ["a"], ["b"]]
+
+
+def test_exhausted_retries_log_the_dropped_ids(caplog):
+    attempts = []
+
+    async def handler(item):
+        attempts.append(item)
+        raise RuntimeError("boom")
+
+    async def scenario():
+        queue = MessageQueue(handler, workers=1, max_attempts=3, retry_delay=0, describe=_describe)
+        queue.start()
+        queue.enqueue("573001", ["wamid.1", "wamid.2"])
+        await queue.stop(timeout=5)
+
+    with caplog.at_level(logging.WARNING, logger="services.message_queue"):
+        asyncio.run(scenario())
+    assert len(attempts) == 3
+    assert "dropped ids ['wamid.1', 'wamid.2'] after 3 attempts" in caplog.text
+
+
+def test_stop_timeout_logs_every_unprocessed_item(caplog):
+    async def scenario():
+        blocked = asyncio.Event()
+
+        async def handler(item):
+            await blocked.wait()
+
+        queue = MessageQueue(handler, workers=1, describe=_describe)
+        queue.start()
+        for n in range(3):
+            queue.enqueue("573001", [f"wamid.{n}"])
+        await asyncio.sleep(0)
+        await queue.stop(timeout=0.05)
+
+    with caplog.at_level(logging.ERROR, logger="services.message_queue"):
+        asyncio.run(scenario())
+    assert "stopped with 3 items unprocessed" in caplog.text
+    for n in range(3):
+        assert f"dropped unprocessed ids ['wamid.{n}']" in caplog.text
@@ -0,0 +1,126 @@
+# backend/tests/test_outbox.py
+"""Outbox: a lo sumo un envío en vuelo por teléfono y siempre en orden de id"""
+
+import asyncio
+
+import pytest
+from sqlalchemy import delete, select
+
+from database import AsyncSessionLocal, Base, SessionLocal, async_engine, engine
+from models import OutboundMessage
+from repositories.outbox_repository import OutboxRepository
+from services.outbox import OutboxDispatcher
+
+
+def _run(coroutine):
+    async def scenario():
+        try:
+            return await coroutine
+        finally:
+            await async_engine.dispose()
+    return asyncio.run(scenario())
+
+
+@pytest.fixture(autouse=True)
+def outbox():
+    Base.metadata.create_all(bind=engine)
+    yield
+    db = SessionLocal()
+    db.execute(delete(OutboundMessage))
+    db.commit()
+    db.close()
+
+
+async def _add(*phones):
+    async with AsyncSessionLocal() as db:
+        await OutboxRepository(db).add([
+            {"phone_number": phone, "payload": {"to": phone, "n": n}} for n, phone in enumerate(phones)
+        ])
+        await db.commit()
+
+
+async def _claim(limit=10):
+    async with AsyncSessionLocal() as db:
+        return [(m.phone_number, m.payload["n"]) for m in await OutboxRepository(db).claim(limit, 60)]
+
+
+def _statuses():
+    db = SessionLocal()
+    try:
+        return db.execute(
+            select(OutboundMessage.payload, OutboundMessage.status, OutboundMessage.attempts)
+            .order_by(OutboundMessage.id)
+        ).all()
+    finally:
+        db.close()
+
+
+def test_claim_takes_only_the_oldest_pending_row_per_phone():
+    async def scenario():
+        await _add("A", "A", "B", "A")
+        first = await _claim()
+        # A0 sigue reservado (pending): A1 no se puede tomar todavía
+        second = await _claim()
+        return first, second
+
+    first, second = _run(scenario())
+    assert first == [("A", 0), ("B", 2)]
+    assert second == []
+
+
+def test_failed_send_holds_back_later_messages_of_the_same_phone():
+    sent = []
+    failures = {0: 1}
+
+    async def send(payload, priority):
+        await asyncio.sleep(0.01)
+        if failures.get(payload["n"]):
+            failures[payload["n"]] -= 1
+            return {"ok": False, "error": "timeout", "retryable": True}
+        sent.append((payload["to"], payload["n"]))
+        return {"ok": True, "message_id": f"wamid.{payload['n']}"}
+
+    dispatcher = OutboxDispatcher(AsyncSessionLocal, send, base_delay=0.05, max_delay=0.05)
+
+    async def scenario():
+        await _add("A", "A", "B", "A", "B")
+        await dispatcher.drain_once()
+        # A0 espera su reintento; B avanza por su cuenta
+        held = list(sent)
+        for _ in range(20):
+            await asyncio.sleep(0.05)
+            await dispatcher.drain_once()
+        return held
+
+    held = _run(scenario())
+    assert held == [("B", 2)]
+    assert [n for phone, n in sent if phone == "A"] == [0, 1, 3]
+    assert [n for phone, n in sent if phone == "B"] == [2, 4]
+    assert all(status == "sent" for _, status, _ in _statuses())
+
+
+def test_failing_head_holds_its_phone_until_marked_failed():
+    sent = []
+
+    async def send(payload, priority):
+        if payload["n"] == 0:
+            return {"ok": False, "error": "timeout", "retryable": True}
+        sent.append((payload["to"], payload["n"]))
+        return {"ok": True, "message_id": f"wamid.{payload['n']}"}
+
+    dispatcher = OutboxDispatcher(AsyncSessionLocal, send, max_attempts=3, base_delay=0.05, max_delay=0.05)
+
+    async def scenario():
+        await _add("A", "A", "B")
+        held = []
+        for _ in range(20):
+            await dispatcher.drain_once()
+            held.append(list(sent))
+            await asyncio.sleep(0.05)
+        return held
+
+    held = _run(scenario())
+    # B no espera a A; A1 sale recién cuando A0 agota sus intentos
+    assert held[0] == [("B", 2)]
+    assert sent == [("B", 2), ("A", 1)]
+    assert [(status, attempts) for _, status, attempts in _statuses()] == [("failed", 3), ("sent", 1), ("sent", 1)]
@@ -0,0 +1,159 @@
+# backend/tests/test_query_counts.py
+"""
+Número de sentencias por petición en los listados y estadísticas.
+
+Se cuentan con un listener before_cursor_execute sobre el engine asíncrono:
+una página cuesta lo mismo con 5 filas que con 50 (sin N+1 por fila), y las
+estadísticas cacheadas no tocan la base.
+"""
+
+import warnings
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import delete, event, insert, select
+from sqlalchemy.exc import SAWarning
+
+import app as app_module
+from auth import create_access_token
+from database import SessionLocal, async_engine
+from inventory.models.inventory import Producto, StockVendedor, Vendedor, VentaVendedor
+from models import Conversation, Lead, Message
+from services.stats_cache import stats_cache
+
+ROWS = 60
+
+
+@pytest.fixture(scope="module")
+def client():
+    db = SessionLocal()
+    now = datetime.utcnow()
+    db.execute(insert(Conversation), [
+        {
+            "phone_number": f"5731{n:08d}",
+            "user_name": f"Cliente {n}",
+            "status": "nuevo",
+            "profile_type": "otro",
+            "message_count": 2,
+            "last_interaction": now - timedelta(minutes=n),
+            "created_at": now - timedelta(days=n % 10)
+        }
+        for n in range(ROWS)
+    ])
+    conversations = db.execute(select(Conversation.id, Conversation.phone_number)).all()
+    db.execute(insert(Message), [
+        {"conversation_id": conversation_id, "role": role, "content": f"{role} de {phone}"}
+        for conversation_id, phone in conversations for role in ("user", "assistant")
+    ])
+    db.execute(insert(Lead), [
+        {"phone_number": f"5731{n:08d}", "status": "nuevo", "profile_type": "otro", "interest_level": n % 10}
+        for n in range(ROWS)
+    ])
+
+    vendedores = [Vendedor(nombre=f"Vendedor {n}", telefono=f"5740{n:08d}") for n in range(ROWS)]
+    productos = [Producto(nombre=f"Producto {n}", codigo=f"QC-{n}", precio_unitario=1000) for n in range(ROWS)]
+    db.add_all(vendedores + productos)
+    db.flush()
+    for vendedor, producto in zip(vendedores, productos):
+        db.add(StockVendedor(vendedor=vendedor, producto=producto, cantidad_inicial=10, cantidad_actual=10))
+        db.add(VentaVendedor(vendedor=vendedor, producto=producto, cantidad=1, precio_venta=1000))
+    db.commit()
+
+    try:
+        with TestClient(app_module.app) as client:
+            client.headers["Authorization"] = f"Bearer {create_access_token({'sub': 'admin', 'role': 'admin'})}"
+            yield client
+    finally:
+        for model in (VentaVendedor, StockVendedor, Producto, Vendedor, Message, Conversation, Lead):
+            db.execute(delete(model))
+        db.commit()
+        db.close()
+        stats_cache.clear()
+
+
+@contextmanager
+def count_statements():
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(async_engine.sync_engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(async_engine.sync_engine, "before_cursor_execute", before_cursor_execute)
+
+
+def _statements_for(client, path, **params):
+    with count_statements() as statements:
+        response = client.get(path, params=params)
+    assert response.status_code == 200, response.text
+    return response.json(), len(statements)
+
+
+def test_conversations_page_is_one_query_with_preview(client):
+    small, small_count = _statements_for(client, "/api/admin/conversations", limit=5)
+    large, large_count = _statements_for(client, "/api/admin/conversations", limit=50)
+
+    assert (len(small), len(large)) == (5, 50)
+    assert small_count == large_count == 1
+    # La vista previa es el último mensaje de cada conversación (subconsulta por fila)
+    assert all(row["last_message_preview"] == f"assistant de {row['phone_number']}" for row in large)
+
+
+@pytest.mark.parametrize("path", ["/api/v1/inventory/stock", "/api/v1/inventory/ventas"])
+@pytest.mark.parametrize("expand", ["vendedor,producto", ""])
+def test_inventory_pages_do_not_load_relations_per_row(client, path, expand):
+    small, small_count = _statements_for(client, path, limit=5, expand=expand)
+    large, large_count = _statements_for(client, path, limit=50, expand=expand)
+
+    assert (len(small), len(large)) == (5, 50)
+    assert small_count == large_count == 1
+    if expand:
+        assert all(row["vendedor"]["id"] == row["vendedor_id"] for row in large)
+        assert all(row["producto"]["id"] == row["producto_id"] for row in large)
+    else:
+        assert all(row["vendedor"] is None and row["producto"] is None for row in large)
+
+
+@pytest.mark.parametrize("path, queries", [("/api/stats", 1), ("/api/admin/stats/detailed", 2)])
+def test_stats_run_a_fixed_number_of_queries_and_then_hit_the_cache(client, path, queries):
+    stats_cache.clear()
+    _, first = _statements_for(client, path)
+    _, cached = _statements_for(client, path)
+
+    # Más datos no agregan consultas
+    db = SessionLocal()
+    db.execute(insert(Lead), [
+        {"phone_number": f"5739{n:08d}", "status": "contactado", "profile_type": "emprendedor", "interest_level": 7}
+        for n in range(ROWS)
+    ])
+    db.commit()
+    stats_cache.clear()
+    _, after_growth = _statements_for(client, path)
+    db.execute(delete(Lead).where(Lead.phone_number.like("5739%")))
+    db.commit()
+    db.close()
+
+    assert first == after_growth == queries
+    assert cached == 0
+
+
+def test_general_stats_values_without_cartesian_product(client):
+    stats_cache.clear()
+    # El aviso de producto cartesiano sale al compilar: sin caché de sentencias
+    async_engine.sync_engine.clear_compiled_cache()
+    with warnings.catch_warnings():
+        warnings.simplefilter("error", SAWarning)
+        stats, _ = _statements_for(client, "/api/stats")
+
+    assert stats == {
+        "total_conversations": ROWS,
+        "total_distributors": 0,
+        "total_leads": ROWS,
+        "active_distributors": 0,
+        "high_interest_leads": ROWS * 3 // 10
+    }
@@ -0,0 +1,86 @@
+# backend/tests/test_stats_cache.py
+"""Caché de estadísticas: invalidación por tablas escritas y cálculos concurrentes"""
+
+import asyncio
+
+import pytest
+from sqlalchemy import delete, insert, update
+
+from database import AsyncSessionLocal, Base, SessionLocal, async_engine, engine
+from models import Lead
+from services.stats_cache import StatsCache, stats_cache
+
+
+@pytest.fixture()
+def leads():
+    Base.metadata.create_all(bind=engine)
+    stats_cache.clear()
+    yield
+    db = SessionLocal()
+    db.execute(delete(Lead))
+    db.commit()
+    db.close()
+    stats_cache.clear()
+
+
+def test_invalidation_during_compute_is_not_overwritten():
+    cache = StatsCache(ttl_seconds=60)
+    calls = []
+
+    async def compute():
+        calls.append(len(calls))
+        if len(calls) == 1:
+            # Una escritura se confirma mientras se calcula el primer resultado
+            await asyncio.sleep(0)
+            cache.invalidate({"leads"})
+        return len(calls)
+
+    async def scenario():
+        first = await cache.get_or_compute("stats", {"leads"}, compute)
+        second = await cache.get_or_compute("stats", {"leads"}, compute)
+        third = await cache.get_or_compute("stats", {"leads"}, compute)
+        return first, second, third
+
+    # El primer resultado se devuelve pero no queda en caché
+    assert asyncio.run(scenario()) == (1, 2, 2)
+    assert calls == [0, 1]
+
+
+def test_other_tables_do_not_discard_the_result():
+    cache = StatsCache(ttl_seconds=60)
+
+    async def scenario():
+        async def compute():
+            cache.invalidate({"ventas_vendedor"})
+            return "ok"
+        await cache.get_or_compute("stats", {"leads"}, compute)
+        return await cache.get_or_compute("stats", {"leads"}, lambda: "recalculado")
+
+    assert asyncio.run(scenario()) == "ok"
+
+
+async def _cached_value(value):
+    return await stats_cache.get_or_compute("leads", {"leads"}, lambda: value)
+
+
+@pytest.mark.parametrize("statement", [
+    lambda: update(Lead.__table__).values(interest_level=9),
+    lambda: insert(Lead.__table__).values(phone_number="573009998877", interest_level=5),
+    lambda: update(Lead).values(interest_level=9),
+], ids=["core-update", "core-insert", "orm-update"])
+def test_commit_invalidates_tables_written_by_statements(leads, statement):
+    async def scenario():
+        try:
+            await _cached_value("antes")
+            async with AsyncSessionLocal() as db:
+                await db.execute(statement())
+                await db.rollback()
+            after_rollback = await _cached_value("después")
+            async with AsyncSessionLocal() as db:
+                await db.execute(statement())
+                await db.commit()
+            return after_rollback, await _cached_value("después")
+        finally:
+            await async_engine.dispose()
+
+    assert asyncio.run(scenario()) == ("antes", "después")
@@ -0,0 +1,149 @@
+# backend/tests/test_stock_concurrency.py
+"""
+Ventas simultáneas contra stock limitado.
+
+Cientos de ventas concurrentes a un mismo SKU por las dos rutas: la venta
+individual (UPDATE condicional) y el lote (_bloquear_stock con FOR UPDATE).
+Ninguna combinación puede vender más de lo asignado, dejar el stock
+negativo ni desalinear el libro de movimientos. Con TEST_DATABASE_URL
+apuntando a PostgreSQL se prueban los bloqueos de filas reales.
+
+SQLite ignora FOR UPDATE: sobre SQLite cada transacción de la prueba abre
+con BEGIN IMMEDIATE (candado de escritura de toda la base), el equivalente
+más cercano, para que dos lotes no lean el mismo stock.
+"""
+
+import asyncio
+import random
+
+import httpx
+import pytest
+from sqlalchemy import delete, event, func, select
+
+import app as app_module
+from database import SessionLocal, async_engine
+from inventory.models.inventory import MovimientoStock, Producto, StockVendedor, Vendedor, VentaVendedor
+
+STOCK = 60
+SALES = 200
+
+
+@pytest.fixture(autouse=True)
+def sqlite_write_lock():
+    if async_engine.dialect.name != "sqlite":
+        yield
+        return
+
+    def on_connect(dbapi_connection, connection_record):
+        # El driver no emite su propio BEGIN: lo hace on_begin
+        dbapi_connection.isolation_level = None
+
+    def on_begin(connection):
+        connection.exec_driver_sql("BEGIN IMMEDIATE")
+
+    # Las conexiones ya abiertas no pasaron por on_connect
+    asyncio.run(async_engine.dispose())
+    sync_engine = async_engine.sync_engine
+    event.listen(sync_engine, "connect", on_connect)
+    event.listen(sync_engine, "begin", on_begin)
+    try:
+        yield
+    finally:
+        event.remove(sync_engine, "connect", on_connect)
+        event.remove(sync_engine, "begin", on_begin)
+        asyncio.run(async_engine.dispose())
+
+
+@pytest.fixture()
+def sku():
+    db = SessionLocal()
+    vendedor = Vendedor(nombre="Vendedor estrés", telefono="3009990000")
+    producto = Producto(nombre="SKU estrés", codigo="STRESS-1", precio_unitario=1000)
+    db.add_all([vendedor, producto])
+    db.commit()
+    ids = (vendedor.id, producto.id)
+    try:
+        yield ids
+    finally:
+        for model in (MovimientoStock, VentaVendedor, StockVendedor):
+            db.execute(delete(model).where(model.vendedor_id == ids[0]))
+        db.execute(delete(Producto).where(Producto.id == ids[1]))
+        db.execute(delete(Vendedor).where(Vendedor.id == ids[0]))
+        db.commit()
+        db.close()
+
+
+def _run(scenario):
+    async def main():
+        transport = httpx.ASGITransport(app=app_module.app)
+        try:
+            async with httpx.AsyncClient(transport=transport, base_url="http://test", timeout=120) as client:
+                return await scenario(client)
+        finally:
+            await async_engine.dispose()
+    return asyncio.run(main())
+
+
+async def _sell_concurrently(client, vendedor_id, producto_id, sales):
+    """Lanza las ventas a la vez; devuelve las unidades vendidas con éxito"""
+    assigned = await client.post("/api/v1/inventory/stock/asignar", json={
+        "vendedor_id": vendedor_id, "producto_id": producto_id, "cantidad": STOCK
+    })
+    assert assigned.status_code == 200, assigned.text
+
+    async def sell(kind, quantities):
+        if kind == "venta":
+            response = await client.post("/api/v1/inventory/ventas", json={
+                "vendedor_id": vendedor_id, "producto_id": producto_id, "cantidad": quantities[0]
+            })
+        else:
+            response = await client.post("/api/v1/inventory/ventas/lote", json={"items": [
+                {"vendedor_id": vendedor_id, "producto_id": producto_id, "cantidad": quantity}
+                for quantity in quantities
+            ]})
+        # Sin stock suficiente se rechaza con 400; cualquier otro error falla la prueba
+        assert response.status_code in (200, 400), response.text
+        return sum(quantities) if response.status_code == 200 else 0
+
+    return sum(await asyncio.gather(*(sell(kind, quantities) for kind, quantities in sales)))
+
+
+def _assert_consistent(vendedor_id, producto_id, sold):
+    db = SessionLocal()
+    try:
+        stock = db.scalar(select(StockVendedor.cantidad_actual).where(
+            StockVendedor.vendedor_id == vendedor_id, StockVendedor.producto_id == producto_id
+        ))
+        ledger = db.scalar(select(func.sum(MovimientoStock.cantidad)).where(
+            MovimientoStock.vendedor_id == vendedor_id, MovimientoStock.producto_id == producto_id
+        ))
+        ventas = db.scalar(select(func.coalesce(func.sum(VentaVendedor.cantidad), 0)).where(
+            VentaVendedor.vendedor_id == vendedor_id, VentaVendedor.producto_id == producto_id
+        ))
+    finally:
+        db.close()
+    assert stock >= 0
+    assert stock + sold == STOCK
+    assert ventas == sold
+    assert ledger == stock
+
+
+def test_concurrent_single_sales_never_oversell(sku):
+    rng = random.Random(21)
+    sales = [("venta", [rng.choice((1, 1, 2, 3))]) for _ in range(SALES)]
+    sold = _run(lambda client: _sell_concurrently(client, *sku, sales))
+
+    assert sold == STOCK
+    _assert_consistent(*sku, sold)
+
+
+def test_concurrent_batches_and_single_sales_never_oversell(sku):
+    rng = random.Random(22)
+    sales = [
+        ("lote", [rng.choice((1, 2)), rng.choice((1, 2))]) if n % 2 else ("venta", [rng.choice((1, 2))])
+        for n in range(SALES)
+    ]
+    sold = _run(lambda client: _sell_concurrently(client, *sku, sales))
+
+    assert STOCK - 3 <= sold <= STOCK
+    _assert_consistent(*sku, sold)
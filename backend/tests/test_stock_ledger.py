@@ -0,0 +1,150 @@
+# backend/tests/test_stock_ledger.py
+"""
+Libro de movimientos de stock: stock a una fecha desde el snapshot anterior
+y snapshots incrementales desde la marca de agua, sin recorrer el libro.
+"""
+
+import asyncio
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import delete, event, insert
+
+from database import AsyncSessionLocal, Base, SessionLocal, async_engine, engine
+from inventory.models.inventory import MovimientoStock, Producto, SnapshotStock, StockVendedor, Vendedor
+from repositories.inventory_repository import StockLedgerRepository
+
+NOW = datetime.utcnow()
+
+
+def _run(coroutine_function, *args):
+    async def scenario():
+        try:
+            async with AsyncSessionLocal() as db:
+                return await coroutine_function(StockLedgerRepository(db), *args)
+        finally:
+            await async_engine.dispose()
+    return asyncio.run(scenario())
+
+
+@contextmanager
+def captured_statements():
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+
+    event.listen(async_engine.sync_engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(async_engine.sync_engine, "before_cursor_execute", before_cursor_execute)
+
+
+def _ledger_scans(statements):
+    """Pasos del plan de SQLite que recorren movimientos_stock completo"""
+    scans = []
+    connection = engine.raw_connection()
+    try:
+        for statement, parameters in statements:
+            for row in connection.cursor().execute(f"EXPLAIN QUERY PLAN {statement}", parameters):
+                if row[-1].startswith("SCAN movimientos_stock"):
+                    scans.append(row[-1])
+    finally:
+        connection.close()
+    return scans
+
+
+@pytest.fixture()
+def pares():
+    """Par A (+10, -3) y par B (+5) con movimientos de hace dos y tres días"""
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    vendedor = Vendedor(nombre="Vendedor libro", telefono="3008880000")
+    productos = [Producto(nombre=f"SKU libro {n}", codigo=f"LEDGER-{n}", precio_unitario=1000) for n in "AB"]
+    db.add_all([vendedor, *productos])
+    db.flush()
+    a, b = ((vendedor.id, producto.id) for producto in productos)
+    db.add_all([
+        StockVendedor(vendedor_id=a[0], producto_id=a[1], cantidad_inicial=10, cantidad_actual=7),
+        StockVendedor(vendedor_id=b[0], producto_id=b[1], cantidad_inicial=5, cantidad_actual=5)
+    ])
+    db.execute(insert(MovimientoStock), [
+        {"vendedor_id": a[0], "producto_id": a[1], "cantidad": 10, "motivo": "asignacion", "fecha": NOW - timedelta(days=3)},
+        {"vendedor_id": a[0], "producto_id": a[1], "cantidad": -3, "motivo": "venta", "fecha": NOW - timedelta(days=2)},
+        {"vendedor_id": b[0], "producto_id": b[1], "cantidad": 5, "motivo": "asignacion", "fecha": NOW - timedelta(days=2)}
+    ])
+    db.commit()
+    try:
+        yield a, b
+    finally:
+        for model in (SnapshotStock, MovimientoStock, StockVendedor):
+            db.execute(delete(model).where(model.vendedor_id == vendedor.id))
+        db.execute(delete(Producto).where(Producto.id.in_([p.id for p in productos])))
+        db.execute(delete(Vendedor).where(Vendedor.id == vendedor.id))
+        db.commit()
+        db.close()
+
+
+def _vender(par, cantidad, fecha):
+    db = SessionLocal()
+    db.execute(insert(MovimientoStock), [{
+        "vendedor_id": par[0], "producto_id": par[1], "cantidad": -cantidad, "motivo": "venta", "fecha": fecha
+    }])
+    stock = db.query(StockVendedor).filter_by(vendedor_id=par[0], producto_id=par[1]).one()
+    stock.cantidad_actual -= cantidad
+    db.commit()
+    db.close()
+
+
+def _stock(filas):
+    return {(f["vendedor_id"], f["producto_id"]): (f["cantidad"], f["snapshot"] is not None, f["movimientos"]) for f in filas}
+
+
+def test_stock_at_adds_only_the_tail_after_each_snapshot(pares):
+    a, b = pares
+    assert _run(StockLedgerRepository.take_snapshots) == 2
+    _vender(a, 2, NOW + timedelta(hours=1))
+
+    # Antes del snapshot: todo sale del libro; B todavía no tenía stock
+    assert _stock(_run(StockLedgerRepository.stock_at, NOW - timedelta(days=2, hours=12), a[0])) == {
+        a: (10, False, 1)
+    }
+    # Después: snapshot más la cola del par
+    assert _stock(_run(StockLedgerRepository.stock_at, NOW + timedelta(minutes=30), a[0])) == {
+        a: (7, True, 0), b: (5, True, 0)
+    }
+    assert _stock(_run(StockLedgerRepository.stock_at, NOW + timedelta(hours=2), a[0])) == {
+        a: (5, True, 1), b: (5, True, 0)
+    }
+    assert _stock(_run(StockLedgerRepository.stock_at, NOW + timedelta(hours=2), None, b[1])) == {
+        b: (5, True, 0)
+    }
+
+
+def test_snapshots_start_from_the_high_water_mark(pares):
+    a, _ = pares
+    assert _run(StockLedgerRepository.take_snapshots) == 2
+    assert _run(StockLedgerRepository.take_snapshots) == 0
+
+    _vender(a, 1, NOW)
+    assert _run(StockLedgerRepository.take_snapshots) == 1
+    db = SessionLocal()
+    ultimo = db.query(SnapshotStock).filter_by(vendedor_id=a[0], producto_id=a[1]).order_by(SnapshotStock.id.desc()).first()
+    db.close()
+    assert ultimo.cantidad == 6
+
+
+@pytest.mark.skipif(engine.dialect.name != "sqlite", reason="plan de consulta de SQLite")
+def test_ledger_queries_never_scan_the_whole_ledger(pares):
+    a, _ = pares
+    with captured_statements() as statements:
+        _run(StockLedgerRepository.take_snapshots)
+        _vender(a, 1, NOW)
+        _run(StockLedgerRepository.take_snapshots)
+        _run(StockLedgerRepository.stock_at, NOW + timedelta(hours=1))
+
+    selects = [(s, p) for s, p in statements if s.lstrip().upper().startswith("SELECT")]
+    assert selects
+    assert _ledger_scans(selects) == []